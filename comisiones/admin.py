@@ -1,5 +1,26 @@
 from django.contrib import admin
-from .models import Boletin, Comision, Incidencia, LecturaBoletin, Perfil, Venta
+
+from .contexto_usuario import contexto_usuario
+from .models import (
+    Boletin,
+    Comision,
+    CorreoSalida,
+    ExportacionVentas,
+    Incidencia,
+    Instalacion,
+    LecturaBoletin,
+    Perfil,
+    ResumenMensualVentas,
+    RevisionMasiva,
+    Venta,
+)
+
+
+@admin.register(Instalacion)
+class InstalacionAdmin(admin.ModelAdmin):
+    list_display = ("codigo", "nombre", "concesionario", "sede", "activa")
+    list_filter = ("activa",)
+    search_fields = ("codigo", "nombre", "concesionario", "sede")
 
 
 @admin.register(Venta)
@@ -9,16 +30,14 @@ class VentaAdmin(admin.ModelAdmin):
         "nombre_cliente",
         "usuario",
         "tipo_venta",
+        "instalacion",
         "fecha_venta",
     )
-    list_filter = ("tipo_venta", "tipo_cliente", "fecha_venta")
+    list_filter = ("instalacion", "tipo_venta", "tipo_cliente", "fecha_venta")
     search_fields = ("matricula", "idv", "dni", "nombre_cliente", "usuario__username")
 
     def save_model(self, request, obj, form, change):
-        es_equipo_ventas = request.user.groups.filter(
-            name__in=["Vendedor", "Jefe de ventas"]
-        ).exists()
-        if not change and es_equipo_ventas:
+        if not change and contexto_usuario(request.user).es_equipo_ventas:
             obj.usuario = request.user
         super().save_model(request, obj, form, change)
 
@@ -40,8 +59,14 @@ class IncidenciaAdmin(admin.ModelAdmin):
         "validacion_ok",
         "fecha_incidencia",
     )
-    list_filter = ("estado", "validacion_ok", "es_general", "fecha_incidencia")
-    search_fields = ("tipo", "detalle", "ventas__matricula", "reportado_por__username")
+    list_filter = (
+        "instalacion",
+        "estado",
+        "validacion_ok",
+        "es_general",
+        "fecha_incidencia",
+    )
+    search_fields = ("tipo", "detalle", "matriculas", "reportado_por__username")
     filter_horizontal = ("ventas",)
 
     def matricula_listado(self, obj):
@@ -50,10 +75,7 @@ class IncidenciaAdmin(admin.ModelAdmin):
     matricula_listado.short_description = "Matrícula"
 
     def save_model(self, request, obj, form, change):
-        es_equipo_ventas = request.user.groups.filter(
-            name__in=["Vendedor", "Jefe de ventas"]
-        ).exists()
-        if not change and es_equipo_ventas:
+        if not change and contexto_usuario(request.user).es_equipo_ventas:
             obj.reportado_por = request.user
         super().save_model(request, obj, form, change)
 
@@ -67,6 +89,7 @@ class PerfilAdmin(admin.ModelAdmin):
         "area",
         "concesionario",
         "sede",
+        "instalacion",
         "jefe_ventas",
         "gerente",
         "director_comercial",
@@ -91,9 +114,15 @@ class PerfilAdmin(admin.ModelAdmin):
         "director_comercial__first_name",
         "director_comercial__last_name",
     )
-    list_select_related = ("user", "jefe_ventas", "gerente", "director_comercial")
+    list_select_related = (
+        "user",
+        "instalacion",
+        "jefe_ventas",
+        "gerente",
+        "director_comercial",
+    )
     autocomplete_fields = ("user", "jefe_ventas", "gerente", "director_comercial")
-    list_filter = ("area", "concesionario", "sede")
+    list_filter = ("area", "instalacion", "concesionario", "sede")
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == "jefe_ventas":
@@ -128,3 +157,61 @@ class LecturaBoletinAdmin(admin.ModelAdmin):
     list_display = ("boletin", "usuario", "leido_en", "confirmado")
     list_filter = ("confirmado", "leido_en")
     search_fields = ("boletin__boletin", "usuario__username", "usuario__first_name")
+
+
+@admin.register(ExportacionVentas)
+class ExportacionVentasAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "usuario",
+        "formato",
+        "estado",
+        "filas_totales",
+        "filas_procesadas",
+        "creada_en",
+        "finalizada_en",
+    )
+    list_filter = ("estado", "formato", "creada_en")
+    search_fields = ("usuario__username",)
+    list_select_related = ("usuario",)
+    readonly_fields = ("ventas_ids",)
+
+
+@admin.register(ResumenMensualVentas)
+class ResumenMensualVentasAdmin(admin.ModelAdmin):
+    list_display = (
+        "usuario",
+        "anio",
+        "mes",
+        "ventas_total",
+        "comision_aprobada",
+        "actualizado_en",
+    )
+    list_filter = ("anio", "mes")
+    search_fields = ("usuario__username",)
+    list_select_related = ("usuario",)
+
+
+@admin.register(CorreoSalida)
+class CorreoSalidaAdmin(admin.ModelAdmin):
+    list_display = ("id", "asunto", "estado", "intentos", "creado_en", "enviado_en")
+    list_filter = ("estado", "creado_en")
+    search_fields = ("asunto",)
+    readonly_fields = ("lote", "reclamado_en", "error")
+
+
+@admin.register(RevisionMasiva)
+class RevisionMasivaAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "tipo",
+        "accion",
+        "usuario",
+        "actualizadas",
+        "conflictos",
+        "creada_en",
+    )
+    list_filter = ("tipo", "accion", "creada_en")
+    search_fields = ("usuario__username",)
+    list_select_related = ("usuario",)
+    readonly_fields = ("leido_en", "parametros")
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class ComisionesConfig(AppConfig):
     name = "comisiones"
+
+    def ready(self):
+        # Registra las senales que cuentan los intentos de login fallidos y
+        # las que mantienen el indice de busqueda de vendedores y matriculas.
+        from . import busqueda, limite_login  # noqa: F401
@@ -1,21 +1,30 @@
 from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
 
-from .models import Perfil
+from .limite_login import ip_de_request, segundos_bloqueo
+from .models import Perfil, normalizar_dni
 
 
 class DNIAutenticacionBackend(ModelBackend):
     """Autentica usuarios usando el DNI guardado en Perfil."""
 
     def authenticate(self, request, username=None, password=None, **kwargs):
-        dni = (username or "").strip()
+        dni = normalizar_dni(username)
         if not dni or password is None:
             return None
+        # PermissionDenied corta tambien el resto de backends (y su hash).
+        if segundos_bloqueo(dni, ip_de_request(request)):
+            raise PermissionDenied
 
-        perfil = Perfil.objects.select_related("user").filter(dni__iexact=dni).first()
+        perfil = (
+            Perfil.objects.select_related("user").filter(dni_normalizado=dni).first()
+        )
         if not perfil:
             return None
 
         user = perfil.user
+        # Si el hash es de otro algoritmo o coste que el de PASSWORD_HASHERS,
+        # check_password lo recalcula y lo guarda al acertar la contrasena.
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
         return None
@@ -0,0 +1,129 @@
+"""Busqueda de vendedores y matriculas para el filtro "Vendedor" de gerencia.
+
+En SQLite se usan dos tablas virtuales FTS5 con el tokenizador `trigram`
+(una para usuarios y otra para ventas) cuyo `rowid` es el id del objeto; la
+busqueda por subcadena sale del indice en lugar de recorrer `auth_user` y
+`comisiones_venta` con cuatro `LIKE`. Las senales de este modulo las mantienen
+al dia y `python manage.py reconstruir_busqueda` las regenera.
+
+Sin FTS5 (u otra base de datos) se filtra con `icontains`; en PostgreSQL la
+migracion crea indices trigram (`pg_trgm`) que cubren esas mismas consultas.
+"""
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Venta
+
+TABLA_USUARIOS = "comisiones_busqueda_usuario"
+TABLA_VENTAS = "comisiones_busqueda_venta"
+CAMPOS_USUARIO = frozenset({"username", "first_name", "last_name"})
+# El tokenizador trigram solo usa el indice con 3 caracteres o mas.
+LONGITUD_MINIMA_MATCH = 3
+
+_fts_disponible = None
+
+
+def fts_disponible():
+    global _fts_disponible
+    if _fts_disponible is None:
+        _fts_disponible = connection.vendor == "sqlite" and {
+            TABLA_USUARIOS,
+            TABLA_VENTAS,
+        } <= set(connection.introspection.table_names())
+    return _fts_disponible
+
+
+def _texto_usuario(user):
+    return " ".join(filter(None, (user.username, user.first_name, user.last_name)))
+
+
+def _indexar(tabla, objeto_id, texto):
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {tabla} WHERE rowid = %s", [objeto_id])
+        if texto:
+            cursor.execute(
+                f"INSERT INTO {tabla} (rowid, texto) VALUES (%s, %s)", [objeto_id, texto]
+            )
+
+
+def _ids_fts(tabla, termino):
+    if len(termino) >= LONGITUD_MINIMA_MATCH:
+        frase = '"{}"'.format(termino.replace('"', '""'))
+        return RawSQL(f"SELECT rowid FROM {tabla} WHERE texto MATCH %s", [frase])
+    patron = termino.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return RawSQL(
+        f"SELECT rowid FROM {tabla} WHERE texto LIKE %s ESCAPE '\\'", [f"%{patron}%"]
+    )
+
+
+def ids_usuarios(termino):
+    """Ids de usuarios cuyo username, nombre o apellidos contienen `termino`."""
+    if fts_disponible():
+        return _ids_fts(TABLA_USUARIOS, termino)
+    return User.objects.filter(
+        Q(username__icontains=termino)
+        | Q(first_name__icontains=termino)
+        | Q(last_name__icontains=termino)
+    ).values("pk")
+
+
+def ids_ventas(termino):
+    """Ids de ventas cuya matricula contiene `termino`."""
+    if fts_disponible():
+        return _ids_fts(TABLA_VENTAS, termino)
+    return Venta.objects.filter(matricula__icontains=termino).values("pk")
+
+
+def reconstruir():
+    """Regenera las tablas de busqueda. Devuelve `(usuarios, ventas)` indexados."""
+    if not fts_disponible():
+        return 0, 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_USUARIOS}")
+        cursor.execute(
+            f"INSERT INTO {TABLA_USUARIOS} (rowid, texto) "
+            "SELECT id, TRIM(username || ' ' || first_name || ' ' || last_name) "
+            f"FROM {User._meta.db_table}"
+        )
+        usuarios = cursor.rowcount
+        cursor.execute(f"DELETE FROM {TABLA_VENTAS}")
+        cursor.execute(
+            f"INSERT INTO {TABLA_VENTAS} (rowid, texto) "
+            f"SELECT id, matricula FROM {Venta._meta.db_table}"
+        )
+        ventas = cursor.rowcount
+    return usuarios, ventas
+
+
+@receiver(post_save, sender=User)
+def _indexar_usuario(sender, instance, update_fields=None, **kwargs):
+    # El login guarda `last_login` con `update_fields`: no cambia el texto.
+    if update_fields is not None and not CAMPOS_USUARIO & set(update_fields):
+        return
+    if fts_disponible():
+        _indexar(TABLA_USUARIOS, instance.pk, _texto_usuario(instance))
+
+
+@receiver(post_save, sender=Venta)
+def _indexar_venta(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "matricula" not in update_fields:
+        return
+    if fts_disponible():
+        _indexar(TABLA_VENTAS, instance.pk, instance.matricula)
+
+
+@receiver(post_delete, sender=User)
+def _desindexar_usuario(sender, instance, **kwargs):
+    if fts_disponible():
+        _indexar(TABLA_USUARIOS, instance.pk, "")
+
+
+@receiver(post_delete, sender=Venta)
+def _desindexar_venta(sender, instance, **kwargs):
+    if fts_disponible():
+        _indexar(TABLA_VENTAS, instance.pk, "")
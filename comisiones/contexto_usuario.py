@@ -0,0 +1,64 @@
+"""Contexto del usuario autenticado: perfil, grupos, rol y acceso de gerencia.
+
+Casi todas las vistas necesitan el `Perfil` y los grupos del usuario. Se leen
+de BD una vez por peticion y se memorizan en la instancia de `request.user`,
+asi que el resto de llamadas de la misma peticion no consultan nada. No se
+guardan entre peticiones: los grupos deciden los permisos y una cache por
+proceso no se enteraria a tiempo de los cambios hechos desde otro proceso.
+"""
+
+from dataclasses import dataclass
+
+from .models import Perfil
+
+ROLES_POR_PRIORIDAD = (
+    "Director Comercial",
+    "Gerente",
+    "Jefe de ventas",
+    "Vendedor",
+)
+ROL_POR_DEFECTO = "Usuario"
+GRUPOS_GERENCIA = frozenset({"Gerente", "Director Comercial"})
+GRUPOS_EQUIPO_VENTAS = frozenset({"Vendedor", "Jefe de ventas"})
+GRUPOS_MANDOS = frozenset({"Jefe de ventas", "Gerente", "Director Comercial"})
+
+_ATRIBUTO_PETICION = "_contexto_usuario"
+
+
+@dataclass(frozen=True)
+class ContextoUsuario:
+    perfil: Perfil
+    grupos: frozenset
+    es_superusuario: bool
+
+    @property
+    def rol(self):
+        for rol in ROLES_POR_PRIORIDAD:
+            if rol in self.grupos:
+                return rol
+        return ROL_POR_DEFECTO
+
+    @property
+    def es_gerencia(self):
+        return self.es_superusuario or bool(self.grupos & GRUPOS_GERENCIA)
+
+    @property
+    def es_equipo_ventas(self):
+        return bool(self.grupos & GRUPOS_EQUIPO_VENTAS)
+
+    @property
+    def es_mando(self):
+        return self.es_superusuario or bool(self.grupos & GRUPOS_MANDOS)
+
+
+def contexto_usuario(user):
+    """Devuelve el `ContextoUsuario`; solo consulta BD la primera vez por peticion."""
+    contexto = getattr(user, _ATRIBUTO_PETICION, None)
+    if contexto is None:
+        contexto = ContextoUsuario(
+            perfil=Perfil.objects.get_or_create(user=user)[0],
+            grupos=frozenset(user.groups.values_list("name", flat=True)),
+            es_superusuario=user.is_superuser,
+        )
+        setattr(user, _ATRIBUTO_PETICION, contexto)
+    return contexto
@@ -0,0 +1,249 @@
+"""Bandeja de salida de correos (`CorreoSalida`).
+
+Las vistas no hablan con el servidor de correo: guardan el mensaje en la
+bandeja y vuelven enseguida. El comando `enviar_correos` reclama los
+pendientes por lotes, los reparte entre varios hilos que reutilizan una
+conexion SMTP por lote y guarda el resultado. Los fallos se reintentan con
+espera exponencial hasta `CORREOS_MAX_INTENTOS`.
+
+Los hilos solo envian; las lecturas y escrituras en BD se hacen en el hilo que
+llama a `procesar_correos_pendientes`.
+
+Con `INCIDENCIAS_AVISO_MODO = "resumen"` las incidencias nuevas no generan un
+correo cada una: `encolar_resumenes_incidencias` (lo llama `enviar_correos`
+cada `INCIDENCIAS_RESUMEN_MINUTOS`) manda un unico resumen a cada jefe de
+ventas y gerente con las incidencias de su equipo.
+"""
+
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import CorreoSalida, Incidencia
+
+AVISO_INMEDIATO = "inmediato"
+AVISO_RESUMEN = "resumen"
+
+
+def _remitente():
+    return getattr(settings, "DEFAULT_FROM_EMAIL", "") or "no-reply@local.test"
+
+
+def encolar_correo(asunto, cuerpo, destinatarios, incidencia=None):
+    """Guarda un correo en la bandeja de salida. No abre conexion SMTP."""
+    return CorreoSalida.objects.create(
+        asunto=asunto[:255],
+        cuerpo=cuerpo,
+        remitente=_remitente(),
+        destinatarios=list(destinatarios),
+        incidencia=incidencia,
+    )
+
+
+def _destinatario_general(usuario):
+    destinatario = getattr(settings, "INCIDENCIAS_EMAIL_TO", "").strip()
+    if destinatario:
+        return destinatario
+    return usuario.email if usuario and usuario.email else "test@local.test"
+
+
+def encolar_correo_nueva_incidencia(incidencia):
+    destinatario = _destinatario_general(incidencia.reportado_por)
+
+    usuario = (
+        incidencia.reportado_por.get_full_name().strip()
+        if incidencia.reportado_por
+        else ""
+    ) or (incidencia.reportado_por.username if incidencia.reportado_por else "Sin usuario")
+
+    asunto = f"Nueva incidencia registrada - {incidencia.matricula_display}"
+    cuerpo = (
+        "Se ha registrado una nueva incidencia.\n\n"
+        f"Usuario: {usuario}\n"
+        f"Fecha incidencia: {incidencia.fecha_incidencia:%d/%m/%Y}\n"
+        f"Matricula: {incidencia.matricula_display}\n"
+        f"Tipo: {incidencia.tipo}\n"
+        f"Estado: {incidencia.get_estado_display()}\n\n"
+        f"Detalle:\n{incidencia.detalle}\n"
+    )
+    return encolar_correo(asunto, cuerpo, [destinatario], incidencia=incidencia)
+
+
+def avisar_nueva_incidencia(incidencia):
+    """Encola el aviso de una incidencia recien registrada.
+
+    En modo resumen no hace nada: la incidencia queda sin `avisada_en` y entra
+    en el siguiente resumen.
+    """
+    if settings.INCIDENCIAS_AVISO_MODO == AVISO_RESUMEN:
+        return None
+    correo = encolar_correo_nueva_incidencia(incidencia)
+    incidencia.avisada_en = correo.creado_en
+    Incidencia.objects.filter(pk=incidencia.pk).update(avisada_en=incidencia.avisada_en)
+    return correo
+
+
+def _destinatarios_resumen(incidencia):
+    """Jefe de ventas y gerente de quien la reporta, o el destinatario general."""
+    perfil = getattr(incidencia.reportado_por, "perfil", None)
+    destinatarios = []
+    if perfil is not None:
+        for mando in (perfil.jefe_ventas, perfil.gerente):
+            if mando and mando.email and mando.email not in destinatarios:
+                destinatarios.append(mando.email)
+    return destinatarios or [_destinatario_general(incidencia.reportado_por)]
+
+
+def encolar_resumenes_incidencias(ahora=None):
+    """Encola un resumen por destinatario con las incidencias sin avisar.
+
+    Las incidencias se marcan con un unico `UPDATE` y se leen, con quien las
+    reporta y sus mandos, en una sola consulta. Devuelve cuantos correos.
+    """
+    ahora = ahora or timezone.now()
+    with transaction.atomic():
+        marcadas = Incidencia.objects.filter(avisada_en__isnull=True).update(
+            avisada_en=ahora
+        )
+        if not marcadas:
+            return 0
+        incidencias = (
+            Incidencia.objects.filter(avisada_en=ahora)
+            .select_related(
+                "reportado_por__perfil__jefe_ventas",
+                "reportado_por__perfil__gerente",
+            )
+            .order_by("fecha_incidencia", "id")
+        )
+        por_destinatario = defaultdict(list)
+        for incidencia in incidencias:
+            for destinatario in _destinatarios_resumen(incidencia):
+                por_destinatario[destinatario].append(incidencia)
+
+        remitente = _remitente()
+        correos = [
+            CorreoSalida(
+                asunto=f"Resumen de incidencias nuevas ({len(lista)})",
+                cuerpo=render_to_string(
+                    "comisiones/correo_resumen_incidencias.txt",
+                    {"incidencias": lista},
+                ),
+                remitente=remitente,
+                destinatarios=[destinatario],
+            )
+            for destinatario, lista in por_destinatario.items()
+        ]
+        CorreoSalida.objects.bulk_create(correos)
+    return len(correos)
+
+
+def _reclamar(limite, ahora):
+    """Marca como `enviando` hasta `limite` correos listos y los devuelve."""
+    bloqueo = timedelta(seconds=settings.CORREOS_BLOQUEO_SEGUNDOS)
+    listos = (
+        CorreoSalida.objects.filter(
+            Q(estado=CorreoSalida.ESTADO_PENDIENTE, proximo_intento__lte=ahora)
+            # Reclamados por un worker que no termino.
+            | Q(estado=CorreoSalida.ESTADO_ENVIANDO, reclamado_en__lt=ahora - bloqueo)
+        )
+        .order_by("proximo_intento", "id")
+        .values_list("id", flat=True)[:limite]
+    )
+    lote = uuid.uuid4().hex
+    # Otro worker puede haber cogido alguno entre medias: solo se queda con los
+    # que siguen en el mismo estado, y luego se leen por `lote`.
+    CorreoSalida.objects.filter(
+        Q(estado=CorreoSalida.ESTADO_PENDIENTE)
+        | Q(estado=CorreoSalida.ESTADO_ENVIANDO, reclamado_en__lt=ahora - bloqueo),
+        id__in=list(listos),
+    ).update(estado=CorreoSalida.ESTADO_ENVIANDO, lote=lote, reclamado_en=ahora)
+    return list(CorreoSalida.objects.filter(lote=lote).order_by("id"))
+
+
+def _enviar_lote(correos):
+    """Envia los correos con una sola conexion. Devuelve `{id: error o None}`."""
+    resultados = {}
+    try:
+        with get_connection(fail_silently=False) as conexion:
+            for correo in correos:
+                mensaje = EmailMessage(
+                    subject=correo.asunto,
+                    body=correo.cuerpo,
+                    from_email=correo.remitente,
+                    to=correo.destinatarios,
+                    connection=conexion,
+                )
+                try:
+                    mensaje.send()
+                except Exception as exc:
+                    resultados[correo.pk] = str(exc)[:500] or exc.__class__.__name__
+                else:
+                    resultados[correo.pk] = None
+    except Exception as exc:
+        # Fallo al abrir o cerrar la conexion: cuenta para los que no se enviaron.
+        error = str(exc)[:500] or exc.__class__.__name__
+        for correo in correos:
+            resultados.setdefault(correo.pk, error)
+    return resultados
+
+
+def _espera_reintento(intentos):
+    segundos = settings.CORREOS_REINTENTO_SEGUNDOS * 2 ** (intentos - 1)
+    return timedelta(seconds=segundos)
+
+
+def _guardar_resultados(correos, resultados):
+    ahora = timezone.now()
+    enviados = [pk for pk, error in resultados.items() if error is None]
+    CorreoSalida.objects.filter(pk__in=enviados).update(
+        estado=CorreoSalida.ESTADO_ENVIADO, enviado_en=ahora, error=""
+    )
+
+    fallidos = []
+    for correo in correos:
+        error = resultados.get(correo.pk)
+        if error is None:
+            continue
+        correo.intentos += 1
+        correo.error = error
+        if correo.intentos >= settings.CORREOS_MAX_INTENTOS:
+            correo.estado = CorreoSalida.ESTADO_ERROR
+        else:
+            correo.estado = CorreoSalida.ESTADO_PENDIENTE
+            correo.proximo_intento = ahora + _espera_reintento(correo.intentos)
+        fallidos.append(correo)
+    CorreoSalida.objects.bulk_update(
+        fallidos, ["estado", "intentos", "error", "proximo_intento"]
+    )
+    return len(enviados), len(fallidos)
+
+
+def procesar_correos_pendientes(limite=100, hilos=None, tamano_lote=None):
+    """Envia los correos listos. Devuelve `(enviados, fallidos)`."""
+    hilos = max(1, hilos or settings.CORREOS_HILOS)
+    tamano_lote = max(1, tamano_lote or settings.CORREOS_TAMANO_LOTE)
+    correos = _reclamar(limite, timezone.now())
+    if not correos:
+        return 0, 0
+
+    lotes = [
+        correos[inicio : inicio + tamano_lote]
+        for inicio in range(0, len(correos), tamano_lote)
+    ]
+    resultados = {}
+    if len(lotes) == 1 or hilos == 1:
+        for lote in lotes:
+            resultados.update(_enviar_lote(lote))
+    else:
+        with ThreadPoolExecutor(max_workers=min(hilos, len(lotes))) as ejecutor:
+            for parcial in ejecutor.map(_enviar_lote, lotes):
+                resultados.update(parcial)
+    return _guardar_resultados(correos, resultados)
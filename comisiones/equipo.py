@@ -0,0 +1,99 @@
+"""Resumen mensual del equipo de un jefe de ventas, gerente o director.
+
+Una fila por subordinado (a cualquier nivel, segun `JerarquiaPerfil`) con sus
+ventas y comisiones del mes, leidas de `ResumenMensualVentas`, y sus
+incidencias, agrupadas en una sola consulta. El resultado se guarda en la
+cache por (usuario, mes) durante `EQUIPO_RESUMEN_CACHE_SEGUNDOS`.
+"""
+
+from calendar import monthrange
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .models import Incidencia, JerarquiaPerfil, ResumenMensualVentas
+
+CACHE_CLAVE = "comisiones:resumen_equipo:{}:{}:{}"
+
+CAMPOS_VENTAS = (
+    "ventas_total",
+    *ResumenMensualVentas.CONTADORES_TIPO_VENTA.values(),
+    *ResumenMensualVentas.CONTADORES_TIPO_CLIENTE.values(),
+)
+CAMPOS_COMISIONES = tuple(ResumenMensualVentas.TOTALES_COMISION.values())
+CAMPOS_INCIDENCIAS = ("incidencias_total", "incidencias_pendientes")
+
+
+def _fila_vacia(subordinado, profundidad):
+    return {
+        "usuario_id": subordinado.pk,
+        "nombre": subordinado.get_full_name().strip() or subordinado.username,
+        "profundidad": profundidad,
+        **{campo: 0 for campo in CAMPOS_VENTAS + CAMPOS_INCIDENCIAS},
+        **{campo: None for campo in CAMPOS_COMISIONES},
+    }
+
+
+def _calcular(usuario, anio, mes):
+    filas = {
+        relacion.subordinado_id: _fila_vacia(relacion.subordinado, relacion.profundidad)
+        for relacion in JerarquiaPerfil.objects.filter(
+            superior=usuario, profundidad__gt=0
+        )
+        .select_related("subordinado")
+        .order_by("profundidad", "subordinado__first_name", "subordinado__username")
+    }
+    if not filas:
+        return {"filas": [], "totales": _totales([])}
+
+    for resumen in ResumenMensualVentas.objects.filter(
+        usuario__superiores_jerarquia__superior=usuario,
+        usuario__superiores_jerarquia__profundidad__gt=0,
+        anio=anio,
+        mes=mes,
+    ).values("usuario_id", *CAMPOS_VENTAS, *CAMPOS_COMISIONES):
+        filas.get(resumen.pop("usuario_id"), {}).update(resumen)
+
+    primer_dia = date(anio, mes, 1)
+    ultimo_dia = date(anio, mes, monthrange(anio, mes)[1])
+    for agregado in (
+        Incidencia.objects.filter(
+            reportado_por__superiores_jerarquia__superior=usuario,
+            reportado_por__superiores_jerarquia__profundidad__gt=0,
+            fecha_incidencia__gte=primer_dia,
+            fecha_incidencia__lte=ultimo_dia,
+        )
+        .values("reportado_por_id")
+        .order_by()
+        .annotate(
+            incidencias_total=Count("id"),
+            incidencias_pendientes=Count("id", filter=Q(estado="pte_revision")),
+        )
+    ):
+        filas.get(agregado.pop("reportado_por_id"), {}).update(agregado)
+
+    filas = list(filas.values())
+    return {"filas": filas, "totales": _totales(filas)}
+
+
+def _totales(filas):
+    totales = {
+        campo: sum(fila[campo] for fila in filas)
+        for campo in CAMPOS_VENTAS + CAMPOS_INCIDENCIAS
+    }
+    for campo in CAMPOS_COMISIONES:
+        valores = [fila[campo] for fila in filas if fila[campo] is not None]
+        totales[campo] = sum(valores) if valores else None
+    return totales
+
+
+def resumen_equipo(usuario, anio, mes):
+    """Devuelve `{"filas": [...], "totales": {...}}` del equipo en ese mes."""
+    clave = CACHE_CLAVE.format(usuario.pk, anio, mes)
+    resumen = cache.get(clave)
+    if resumen is None:
+        resumen = _calcular(usuario, anio, mes)
+        cache.set(clave, resumen, settings.EQUIPO_RESUMEN_CACHE_SEGUNDOS)
+    return resumen
@@ -0,0 +1,201 @@
+"""Generacion de ficheros de exportacion de `Mis Ventas`.
+
+La descarga directa se genera dentro de la peticion. Las exportaciones
+solicitadas como trabajo (`ExportacionVentas`) las procesa en segundo plano el
+comando `procesar_exportaciones`, que deja el fichero en `MEDIA_ROOT` y lo
+borra cuando caduca. Ambos caminos usan los mismos escritores CSV/Excel.
+"""
+
+import csv
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from .models import ExportacionVentas, Venta
+
+EXPORT_VENTAS_CABECERAS = [
+    "Matricula",
+    "Fecha",
+    "IDV",
+    "Tipo venta",
+    "UD financiadas",
+    "DNI",
+    "Tipo cliente",
+    "Nombre cliente",
+]
+
+# Filas leidas de BD por bloque al exportar; acota la memoria del cursor.
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_EXCEL_SPOOL_BYTES = 5 * 1024 * 1024
+
+
+def fila_export_venta(venta):
+    return [
+        venta.matricula or "--",
+        venta.fecha_venta.strftime("%d/%m/%Y") if venta.fecha_venta else "--",
+        venta.idv if venta.idv is not None else "--",
+        venta.get_tipo_venta_display() or "--",
+        venta.ud_financiadas if venta.ud_financiadas is not None else "--",
+        venta.dni or "--",
+        venta.get_tipo_cliente_display() or "--",
+        venta.nombre_cliente or "--",
+    ]
+
+
+class _EcoCSV:
+    """Pseudo-buffer para `csv.writer`: devuelve la linea en vez de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def lineas_csv_ventas(ventas):
+    """Genera el CSV (BOM, cabecera y filas) linea a linea."""
+    writer = csv.writer(_EcoCSV(), delimiter=";")
+    yield "\ufeff"
+    yield writer.writerow(EXPORT_VENTAS_CABECERAS)
+    for venta in ventas:
+        yield writer.writerow(fila_export_venta(venta))
+
+
+def escribir_excel_ventas(ventas, destino):
+    """Vuelca las ventas en un libro `write_only` sin retener filas en memoria."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title="Mis Ventas")
+
+    cabecera = []
+    for titulo in EXPORT_VENTAS_CABECERAS:
+        cell = WriteOnlyCell(sheet, value=titulo)
+        cell.font = Font(bold=True)
+        cabecera.append(cell)
+    sheet.append(cabecera)
+
+    for venta in ventas:
+        sheet.append(fila_export_venta(venta))
+
+    workbook.save(destino)
+
+
+def crear_exportacion(usuario, formato, parametros, ventas_qs):
+    """Registra un trabajo con la seleccion ya resuelta y ordenada.
+
+    Se guardan los ids en el orden del listado para que el fichero refleje lo
+    que el usuario tenia en pantalla aunque luego cambien los datos.
+    """
+    ventas_ids = list(ventas_qs.values_list("id", flat=True))
+    return ExportacionVentas.objects.create(
+        usuario=usuario,
+        formato=formato,
+        parametros=parametros,
+        ventas_ids=ventas_ids,
+        filas_totales=len(ventas_ids),
+    )
+
+
+def _ventas_de_exportacion(exportacion):
+    """Recorre las ventas del trabajo por bloques, respetando el orden guardado."""
+    ids = exportacion.ventas_ids
+    for inicio in range(0, len(ids), EXPORT_CHUNK_SIZE):
+        bloque = ids[inicio : inicio + EXPORT_CHUNK_SIZE]
+        ventas = Venta.objects.filter(
+            usuario_id=exportacion.usuario_id
+        ).in_bulk(bloque)
+        for venta_id in bloque:
+            venta = ventas.get(venta_id)
+            if venta is not None:
+                yield venta
+        procesadas = min(inicio + len(bloque), len(ids))
+        ExportacionVentas.objects.filter(pk=exportacion.pk).update(
+            filas_procesadas=procesadas
+        )
+
+
+def _reclamar_exportacion(exportacion):
+    """Marca el trabajo como en curso si nadie lo ha cogido antes."""
+    ahora = timezone.now()
+    reclamada = ExportacionVentas.objects.filter(
+        pk=exportacion.pk, estado=ExportacionVentas.ESTADO_PENDIENTE
+    ).update(estado=ExportacionVentas.ESTADO_EN_CURSO, iniciada_en=ahora)
+    if reclamada:
+        exportacion.estado = ExportacionVentas.ESTADO_EN_CURSO
+        exportacion.iniciada_en = ahora
+    return bool(reclamada)
+
+
+def procesar_exportacion(exportacion):
+    """Genera el fichero de un trabajo pendiente. Devuelve `False` si ya estaba cogido."""
+    if not _reclamar_exportacion(exportacion):
+        return False
+
+    timestamp = timezone.localtime(exportacion.creada_en).strftime("%Y%m%d_%H%M%S")
+    ventas = _ventas_de_exportacion(exportacion)
+    try:
+        with tempfile.TemporaryFile() as destino:
+            if exportacion.formato == ExportacionVentas.FORMATO_EXCEL:
+                nombre = f"mis_ventas_{timestamp}.xlsx"
+                escribir_excel_ventas(ventas, destino)
+            else:
+                nombre = f"mis_ventas_{timestamp}.csv"
+                for linea in lineas_csv_ventas(ventas):
+                    destino.write(linea.encode("utf-8"))
+            destino.seek(0)
+            exportacion.archivo.save(nombre, File(destino), save=False)
+    except Exception as exc:
+        exportacion.estado = ExportacionVentas.ESTADO_ERROR
+        exportacion.error = str(exc)[:500]
+        exportacion.finalizada_en = timezone.now()
+        exportacion.save(update_fields=["estado", "error", "finalizada_en"])
+        raise
+
+    exportacion.estado = ExportacionVentas.ESTADO_COMPLETADA
+    exportacion.filas_procesadas = exportacion.filas_totales
+    exportacion.finalizada_en = timezone.now()
+    exportacion.save(
+        update_fields=["estado", "archivo", "filas_procesadas", "finalizada_en"]
+    )
+    return True
+
+
+def procesar_exportaciones_pendientes(limite=None):
+    """Procesa los trabajos pendientes por orden de llegada. Devuelve cuantos."""
+    pendientes = ExportacionVentas.objects.filter(
+        estado=ExportacionVentas.ESTADO_PENDIENTE
+    ).order_by("creada_en", "id")
+    if limite:
+        pendientes = pendientes[:limite]
+
+    procesadas = 0
+    for exportacion in pendientes:
+        try:
+            if procesar_exportacion(exportacion):
+                procesadas += 1
+        except Exception:
+            # El error queda registrado en el trabajo; se sigue con el resto.
+            continue
+    return procesadas
+
+
+def purgar_exportaciones_caducadas(ahora=None):
+    """Borra los ficheros caducados y marca sus trabajos. Devuelve cuantos."""
+    ahora = ahora or timezone.now()
+    limite = ahora - timedelta(hours=settings.EXPORTACIONES_CADUCIDAD_HORAS)
+    caducadas = ExportacionVentas.objects.filter(
+        Q(finalizada_en__lt=limite) | Q(finalizada_en__isnull=True, creada_en__lt=limite),
+    ).exclude(estado=ExportacionVentas.ESTADO_CADUCADA)
+
+    total = 0
+    for exportacion in caducadas.iterator():
+        if exportacion.archivo:
+            exportacion.archivo.delete(save=False)
+        exportacion.estado = ExportacionVentas.ESTADO_CADUCADA
+        exportacion.ventas_ids = []
+        exportacion.save(update_fields=["estado", "archivo", "ventas_ids"])
+        total += 1
+    return total
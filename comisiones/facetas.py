@@ -0,0 +1,58 @@
+"""Calculo de opciones de filtro (facetas) para los listados.
+
+Los desplegables de filtros de `Mis Ventas`, `Mis Incidencias` y
+`Mis Comunicaciones` necesitan los valores distintos de varias columnas dentro
+del periodo seleccionado. En lugar de lanzar un `SELECT DISTINCT` por columna,
+se combinan todas en una unica consulta `UNION` que devuelve pares
+(faceta, valor) y se reparten en Python.
+"""
+
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast
+
+
+def calcular_facetas(queryset, facetas):
+    """Devuelve `{nombre: [valores ordenados]}` para cada faceta solicitada.
+
+    `facetas` es un dict `nombre -> campo o expresion`. Los valores nulos o
+    vacios se descartan y todos se devuelven como texto, igual que hacian las
+    consultas individuales con `Cast`.
+    """
+    resultado = {nombre: [] for nombre in facetas}
+    if not facetas:
+        return resultado
+
+    base_qs = queryset.order_by().prefetch_related(None)
+    consultas = []
+    for nombre, expresion in facetas.items():
+        if isinstance(expresion, str):
+            expresion = F(expresion)
+        consultas.append(
+            base_qs.annotate(
+                faceta_nombre=Value(nombre, output_field=CharField()),
+                faceta_valor=Cast(expresion, output_field=CharField()),
+            )
+            .exclude(faceta_valor__isnull=True)
+            .exclude(faceta_valor="")
+            .values_list("faceta_nombre", "faceta_valor")
+            .distinct()
+        )
+
+    consulta = consultas[0]
+    if len(consultas) > 1:
+        consulta = consulta.union(*consultas[1:])
+
+    for nombre, valor in consulta:
+        resultado[nombre].append(valor)
+    for valores in resultado.values():
+        valores.sort()
+    return resultado
+
+
+def opciones_con_etiqueta(codigos, choices):
+    """Convierte codigos de un campo con `choices` en opciones value/label."""
+    etiquetas = dict(choices)
+    return [
+        {"value": codigo, "label": etiquetas.get(codigo, codigo)}
+        for codigo in codigos
+    ]
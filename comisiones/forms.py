@@ -3,11 +3,16 @@ import re
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 
+from .limite_login import ip_de_request, segundos_bloqueo
+
 
 class LoginPorDNIForm(AuthenticationForm):
     error_messages = {
         **AuthenticationForm.error_messages,
         "invalid_login": "Por favor, introduce un DNI y contraseña correctos.",
+        "demasiados_intentos": (
+            "Demasiados intentos fallidos. Vuelve a intentarlo en %(minutos)s minutos."
+        ),
     }
 
     username = forms.CharField(
@@ -25,6 +30,19 @@ class LoginPorDNIForm(AuthenticationForm):
     def clean_username(self):
         return (self.cleaned_data.get("username") or "").strip().upper()
 
+    def clean(self):
+        # Se comprueba antes de autenticar para no calcular el hash en un bloqueo.
+        segundos = segundos_bloqueo(
+            self.cleaned_data.get("username"), ip_de_request(self.request)
+        )
+        if segundos:
+            raise forms.ValidationError(
+                self.error_messages["demasiados_intentos"],
+                code="demasiados_intentos",
+                params={"minutos": (segundos + 59) // 60},
+            )
+        return super().clean()
+
 
 class MiPerfilEditableForm(forms.Form):
     email = forms.EmailField(
@@ -0,0 +1,83 @@
+"""Hashers de contrasena con el coste definido en settings.
+
+Cada hasher lee sus parametros de `PASSWORD_HASHER_COSTES[algorithm]` y usa
+los de Django para lo que no este configurado. Mantienen el nombre de
+algoritmo de Django, asi que verifican los hashes ya guardados; si el coste
+guardado no coincide con el configurado, `check_password` vuelve a calcular
+el hash en el siguiente login correcto. `python manage.py medir_hashers`
+propone los valores para esta maquina.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    PBKDF2PasswordHasher,
+    ScryptPasswordHasher,
+)
+
+# Limite de memoria de OpenSSL para scrypt cuando no se indica `maxmem`.
+SCRYPT_MAXMEM_MINIMO = 32 * 1024 * 1024
+
+
+def _parametro_coste(nombre):
+    return property(lambda self: self.coste(nombre))
+
+
+class CosteDesdeSettingsMixin:
+    # Parametro que ajusta `medir_hashers` y si solo admite potencias de 2.
+    parametro_ajustable = None
+    ajuste_potencia_de_2 = False
+    redondeo_ajuste = 1
+
+    def __init__(self, **costes):
+        # `medir_hashers` fija costes concretos sin tocar settings.
+        super().__init__()
+        self._costes = costes
+
+    def coste(self, nombre):
+        if nombre in self._costes:
+            return self._costes[nombre]
+        costes = getattr(settings, "PASSWORD_HASHER_COSTES", {}).get(self.algorithm, {})
+        return costes.get(nombre, self.coste_minimo(nombre))
+
+    def coste_minimo(self, nombre):
+        """Valor por defecto de Django: `medir_hashers` no propone menos."""
+        return getattr(super(), nombre)
+
+    def disponible(self):
+        if self.library is None:
+            return True
+        try:
+            self._load_library()
+        except ValueError:
+            return False
+        return True
+
+
+class PBKDF2AjustableHasher(CosteDesdeSettingsMixin, PBKDF2PasswordHasher):
+    parametro_ajustable = "iterations"
+    redondeo_ajuste = 10_000
+
+    iterations = _parametro_coste("iterations")
+
+
+class ScryptAjustableHasher(CosteDesdeSettingsMixin, ScryptPasswordHasher):
+    parametro_ajustable = "work_factor"
+    ajuste_potencia_de_2 = True
+
+    work_factor = _parametro_coste("work_factor")
+    block_size = _parametro_coste("block_size")
+    parallelism = _parametro_coste("parallelism")
+
+    @property
+    def maxmem(self):
+        # scrypt necesita unos 128 * n * r bytes; se deja margen para p.
+        return max(SCRYPT_MAXMEM_MINIMO, 2 * 128 * self.work_factor * self.block_size)
+
+
+class Argon2AjustableHasher(CosteDesdeSettingsMixin, Argon2PasswordHasher):
+    parametro_ajustable = "time_cost"
+
+    time_cost = _parametro_coste("time_cost")
+    memory_cost = _parametro_coste("memory_cost")
+    parallelism = _parametro_coste("parallelism")
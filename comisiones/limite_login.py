@@ -0,0 +1,131 @@
+"""Limite de intentos de login fallidos por DNI y por IP.
+
+Los fallos se guardan en la cache como marcas de tiempo dentro de una ventana
+deslizante. Al superar el maximo, la clave queda bloqueada durante
+`LOGIN_BLOQUEO_SEGUNDOS` y el login se rechaza antes de consultar la BD o
+calcular ningun hash de contrasena.
+
+Se usa la cache `LOGIN_INTENTOS_CACHE`, que tiene que ser compartida por todos
+los procesos; con una por proceso cada worker llevaria su propia cuenta.
+"""
+
+import ipaddress
+import time
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.cache import caches
+from django.dispatch import receiver
+
+from .models import normalizar_dni
+
+CACHE_CLAVE_FALLOS = "comisiones:login_fallos:{}:{}"
+CACHE_CLAVE_BLOQUEO = "comisiones:login_bloqueo:{}:{}"
+
+
+def _cache():
+    return caches[settings.LOGIN_INTENTOS_CACHE]
+
+
+def _limites():
+    return {
+        "dni": settings.LOGIN_INTENTOS_MAX_POR_DNI,
+        "ip": settings.LOGIN_INTENTOS_MAX_POR_IP,
+    }
+
+
+def _claves(dni, ip):
+    claves = []
+    dni = normalizar_dni(dni)
+    if dni:
+        claves.append(("dni", dni))
+    if ip:
+        claves.append(("ip", ip))
+    return claves
+
+
+def _es_proxy_de_confianza(ip):
+    try:
+        direccion = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(
+        direccion in ipaddress.ip_network(red, strict=False)
+        for red in settings.LOGIN_PROXIES_DE_CONFIANZA
+    )
+
+
+def ip_de_request(request):
+    """IP del cliente que hace la peticion.
+
+    Si `REMOTE_ADDR` es un proxy de `LOGIN_PROXIES_DE_CONFIANZA`, se recorre
+    `X-Forwarded-For` de derecha a izquierda y se devuelve la primera direccion
+    que no es de un proxy de confianza: las anteriores las puede escribir el
+    propio cliente.
+    """
+    if request is None:
+        return None
+    ip = request.META.get("REMOTE_ADDR") or None
+    if not ip or not _es_proxy_de_confianza(ip):
+        return ip
+    reenviadas = request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")
+    for anterior in reversed([direccion.strip() for direccion in reenviadas]):
+        try:
+            ipaddress.ip_address(anterior)
+        except ValueError:
+            break
+        ip = anterior
+        if not _es_proxy_de_confianza(ip):
+            break
+    return ip
+
+
+def segundos_bloqueo(dni, ip):
+    """Segundos que quedan de bloqueo para el DNI o la IP (0 si no hay)."""
+    ahora = time.time()
+    bloqueos = _cache().get_many(
+        [CACHE_CLAVE_BLOQUEO.format(tipo, valor) for tipo, valor in _claves(dni, ip)]
+    )
+    if not bloqueos:
+        return 0
+    return max(0, int(max(bloqueos.values()) - ahora) + 1)
+
+
+def registrar_fallo(dni, ip):
+    cache = _cache()
+    ahora = time.time()
+    ventana = settings.LOGIN_INTENTOS_VENTANA_SEGUNDOS
+    limites = _limites()
+    for tipo, valor in _claves(dni, ip):
+        clave = CACHE_CLAVE_FALLOS.format(tipo, valor)
+        fallos = [ts for ts in cache.get(clave, []) if ts > ahora - ventana]
+        fallos.append(ahora)
+        if len(fallos) >= limites[tipo]:
+            bloqueo = settings.LOGIN_BLOQUEO_SEGUNDOS
+            cache.set(CACHE_CLAVE_BLOQUEO.format(tipo, valor), ahora + bloqueo, bloqueo)
+            cache.delete(clave)
+        else:
+            cache.set(clave, fallos, ventana)
+
+
+def limpiar_fallos_dni(dni):
+    dni = normalizar_dni(dni)
+    if dni:
+        _cache().delete(CACHE_CLAVE_FALLOS.format("dni", dni))
+
+
+@receiver(user_login_failed)
+def _registrar_login_fallido(sender, credentials, request=None, **kwargs):
+    dni = credentials.get("username")
+    ip = ip_de_request(request)
+    # Los intentos durante el bloqueo no lo alargan.
+    if not segundos_bloqueo(dni, ip):
+        registrar_fallo(dni, ip)
+
+
+@receiver(user_logged_in)
+def _limpiar_login_correcto(sender, request, user, **kwargs):
+    # Solo el contador del DNI: la IP puede ser la de toda una oficina.
+    perfil = getattr(user, "perfil", None)
+    limpiar_fallos_dni(perfil.dni if perfil else None)
+    limpiar_fallos_dni(user.get_username())
@@ -0,0 +1,77 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from comisiones.correos import (
+    AVISO_RESUMEN,
+    encolar_resumenes_incidencias,
+    procesar_correos_pendientes,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Envia los correos pendientes de la bandeja de salida, con reintentos "
+        "y reutilizando la conexion SMTP por lote. En modo resumen, encola "
+        "tambien los resumenes de incidencias nuevas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--una-vez",
+            action="store_true",
+            help="Procesa la bandeja una sola vez y termina (util para cron).",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=2.0,
+            help="Segundos de espera entre pasadas cuando no hay correos (default: 2).",
+        )
+        parser.add_argument(
+            "--limite",
+            type=int,
+            default=100,
+            help="Maximo de correos por pasada (default: 100).",
+        )
+        parser.add_argument(
+            "--hilos",
+            type=int,
+            help="Hilos de envio (default: CORREOS_HILOS).",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            help="Correos por conexion SMTP (default: CORREOS_TAMANO_LOTE).",
+        )
+
+    def handle(self, *args, **options):
+        intervalo = max(0.1, options["intervalo"])
+        limite = max(1, options["limite"])
+        resumenes = settings.INCIDENCIAS_AVISO_MODO == AVISO_RESUMEN
+        ventana_resumen = settings.INCIDENCIAS_RESUMEN_MINUTOS * 60
+        ultimo_resumen = None
+
+        while True:
+            # Con `--una-vez` la ventana la marca la frecuencia del cron.
+            if resumenes and (
+                options["una_vez"]
+                or ultimo_resumen is None
+                or time.monotonic() - ultimo_resumen >= ventana_resumen
+            ):
+                encolados = encolar_resumenes_incidencias()
+                ultimo_resumen = time.monotonic()
+                if encolados:
+                    self.stdout.write(f"Resumenes de incidencias encolados: {encolados}.")
+            enviados, fallidos = procesar_correos_pendientes(
+                limite=limite, hilos=options["hilos"], tamano_lote=options["lote"]
+            )
+            if enviados or fallidos:
+                self.stdout.write(f"Correos enviados: {enviados}. Fallidos: {fallidos}.")
+            if options["una_vez"]:
+                break
+            if not (enviados or fallidos):
+                time.sleep(intervalo)
+
+        self.stdout.write(self.style.SUCCESS("Bandeja de salida procesada."))
@@ -0,0 +1,99 @@
+import math
+import time
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand, CommandError
+
+from comisiones.hashers import CosteDesdeSettingsMixin
+
+CONTRASENA_PRUEBA = "Contrasena-de-prueba-123"
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide en esta maquina el tiempo de verificar una contrasena con cada hasher "
+        "de PASSWORD_HASHERS y propone el coste que cabe en la latencia objetivo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--objetivo-ms",
+            type=float,
+            default=250.0,
+            help="Milisegundos maximos por verificacion de contrasena (default: 250).",
+        )
+        parser.add_argument(
+            "--repeticiones",
+            type=int,
+            default=3,
+            help="Verificaciones por medida; se usa la mas rapida (default: 3).",
+        )
+        parser.add_argument(
+            "--algoritmo",
+            action="append",
+            help="Algoritmo a medir (repetible; por defecto, todos los ajustables).",
+        )
+
+    def handle(self, *args, **options):
+        objetivo = options["objetivo_ms"]
+        repeticiones = max(1, options["repeticiones"])
+        if objetivo <= 0:
+            raise CommandError("--objetivo-ms debe ser mayor que 0.")
+
+        hashers = [
+            hasher
+            for hasher in get_hashers()
+            if isinstance(hasher, CosteDesdeSettingsMixin)
+            and (not options["algoritmo"] or hasher.algorithm in options["algoritmo"])
+        ]
+        if not hashers:
+            raise CommandError("No hay hashers ajustables que medir en PASSWORD_HASHERS.")
+
+        propuestas = {}
+        for hasher in hashers:
+            if not hasher.disponible():
+                self.stdout.write(
+                    self.style.WARNING(f"{hasher.algorithm}: libreria no instalada.")
+                )
+                continue
+            parametro = hasher.parametro_ajustable
+            actual = getattr(hasher, parametro)
+            ms_actual = self._medir(hasher, repeticiones)
+
+            propuesto = self._proponer(hasher, actual, ms_actual, objetivo)
+            minimo = hasher.coste_minimo(parametro)
+            aviso = ""
+            if propuesto < minimo:
+                propuesto = minimo
+                aviso = " (objetivo no alcanzable sin bajar del minimo de Django)"
+            ms_propuesto = self._medir(
+                type(hasher)(**{parametro: propuesto}), repeticiones
+            )
+            propuestas[hasher.algorithm] = {parametro: propuesto}
+            self.stdout.write(
+                f"{hasher.algorithm}: {parametro}={actual} -> {ms_actual:.0f} ms; "
+                f"propuesto {parametro}={propuesto} -> {ms_propuesto:.0f} ms{aviso}"
+            )
+
+        self.stdout.write("\nPASSWORD_HASHER_COSTES = {")
+        for algoritmo, costes in propuestas.items():
+            self.stdout.write(f"    {algoritmo!r}: {costes!r},")
+        self.stdout.write("}")
+        self.stdout.write(self.style.SUCCESS("Medicion de hashers completada."))
+
+    def _medir(self, hasher, repeticiones):
+        codificado = hasher.encode(CONTRASENA_PRUEBA, hasher.salt())
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            hasher.verify(CONTRASENA_PRUEBA, codificado)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return min(tiempos)
+
+    def _proponer(self, hasher, actual, ms_actual, objetivo):
+        # El tiempo de los tres algoritmos crece linealmente con su parametro.
+        estimado = actual * objetivo / max(ms_actual, 0.001)
+        if hasher.ajuste_potencia_de_2:
+            return 2 ** max(1, math.floor(math.log2(estimado)))
+        redondeo = hasher.redondeo_ajuste
+        return max(redondeo, int(estimado) // redondeo * redondeo)
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from comisiones.exportaciones import (
+    procesar_exportaciones_pendientes,
+    purgar_exportaciones_caducadas,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera en MEDIA_ROOT los ficheros de las exportaciones de Mis Ventas "
+        "pendientes y borra los caducados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--una-vez",
+            action="store_true",
+            help="Procesa la cola una sola vez y termina (util para cron).",
+        )
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=2.0,
+            help="Segundos de espera entre pasadas cuando la cola esta vacia (default: 2).",
+        )
+        parser.add_argument(
+            "--limite",
+            type=int,
+            default=10,
+            help="Maximo de exportaciones por pasada (default: 10).",
+        )
+
+    def handle(self, *args, **options):
+        intervalo = max(0.1, options["intervalo"])
+        limite = max(1, options["limite"])
+
+        while True:
+            procesadas = procesar_exportaciones_pendientes(limite=limite)
+            purgadas = purgar_exportaciones_caducadas()
+            if procesadas or purgadas:
+                self.stdout.write(
+                    f"Exportaciones generadas: {procesadas}. Caducadas: {purgadas}."
+                )
+            if options["una_vez"]:
+                break
+            if not procesadas:
+                time.sleep(intervalo)
+
+        self.stdout.write(self.style.SUCCESS("Cola de exportaciones procesada."))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from comisiones.busqueda import fts_disponible, reconstruir
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera las tablas FTS5 de busqueda de vendedores y matriculas usadas "
+        "por el filtro de gerencia."
+    )
+
+    def handle(self, *args, **options):
+        if not fts_disponible():
+            self.stdout.write(
+                self.style.WARNING(
+                    "No hay tablas FTS5 de busqueda: se usan LIKE o indices trigram."
+                )
+            )
+            return
+        usuarios, ventas = reconstruir()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Busqueda regenerada: {usuarios} usuarios y {ventas} ventas."
+            )
+        )
@@ -0,0 +1,32 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from comisiones.models import Incidencia
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula la columna `matriculas` de las incidencias a partir de sus "
+        "ventas asociadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--usuario",
+            help="Username de quien reporta las incidencias (por defecto, todas).",
+        )
+
+    def handle(self, *args, **options):
+        incidencia_ids = None
+        if options["usuario"]:
+            usuario = User.objects.filter(username=options["usuario"]).first()
+            if usuario is None:
+                raise CommandError(f"No existe el usuario {options['usuario']}.")
+            incidencia_ids = Incidencia.objects.filter(reportado_por=usuario).values(
+                "id"
+            )
+
+        cambiadas = Incidencia.actualizar_matriculas(incidencia_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f"Matriculas de incidencias actualizadas: {cambiadas}.")
+        )
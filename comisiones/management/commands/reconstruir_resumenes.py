@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from comisiones.models import ResumenMensualVentas
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera la tabla de resumenes mensuales de ventas y comisiones a partir "
+        "de los datos originales."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--usuario",
+            help="Username del usuario a regenerar (por defecto, todos).",
+        )
+
+    def handle(self, *args, **options):
+        usuario = None
+        if options["usuario"]:
+            usuario = User.objects.filter(username=options["usuario"]).first()
+            if usuario is None:
+                raise CommandError(f"No existe el usuario {options['usuario']}.")
+
+        filas = ResumenMensualVentas.reconstruir(usuario=usuario)
+        self.stdout.write(
+            self.style.SUCCESS(f"Resumenes mensuales regenerados: {filas} filas.")
+        )
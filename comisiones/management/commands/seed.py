@@ -11,8 +11,10 @@ from comisiones.models import (
     Boletin,
     Comision,
     Incidencia,
+    Instalacion,
     LecturaBoletin,
     Perfil,
+    ResumenMensualVentas,
     Venta,
 )
 
@@ -82,6 +84,8 @@ class Command(BaseCommand):
             users = self._crear_usuarios(grupos)
             self._configurar_perfiles(users)
             ventas = self._crear_ventas_y_comisiones(users, n_ventas)
+            # Las fechas demo se fijan con update(), que no dispara senales.
+            ResumenMensualVentas.reconstruir()
             incidencias = self._crear_incidencias(users, ventas, n_incidencias)
             boletines = self._crear_boletines()
             lecturas_boletin = self._crear_lecturas_boletin(users, boletines)
@@ -196,6 +200,14 @@ class Command(BaseCommand):
 
     def _configurar_perfiles(self, users):
         sede_principal = "Orihuela"
+        instalacion, _ = Instalacion.objects.get_or_create(
+            codigo="2901",
+            defaults={
+                "nombre": "Nissan Orihuela",
+                "concesionario": "Francisco Marcos",
+                "sede": sede_principal,
+            },
+        )
         dni_por_usuario = {
             "director": "70000001A",
             "gerente": "70000002B",
@@ -229,6 +241,7 @@ class Command(BaseCommand):
         director_perfil.telefono = telefono_por_usuario["director"]
         director_perfil.concesionario = concesionario_por_usuario["director"]
         director_perfil.sede = sede_principal
+        director_perfil.instalacion = instalacion
         director_perfil.area = Perfil.AREA_VENTAS
         director_perfil.save()
 
@@ -237,6 +250,7 @@ class Command(BaseCommand):
         gerente_perfil.telefono = telefono_por_usuario["gerente"]
         gerente_perfil.concesionario = concesionario_por_usuario["gerente"]
         gerente_perfil.sede = sede_principal
+        gerente_perfil.instalacion = instalacion
         gerente_perfil.area = Perfil.AREA_VENTAS
         gerente_perfil.director_comercial = users["director"]
         gerente_perfil.save()
@@ -246,6 +260,7 @@ class Command(BaseCommand):
         jefe_perfil.telefono = telefono_por_usuario["jefe"]
         jefe_perfil.concesionario = concesionario_por_usuario["jefe"]
         jefe_perfil.sede = sede_principal
+        jefe_perfil.instalacion = instalacion
         jefe_perfil.area = Perfil.AREA_VENTAS
         jefe_perfil.gerente = users["gerente"]
         jefe_perfil.director_comercial = users["director"]
@@ -258,6 +273,7 @@ class Command(BaseCommand):
         jefe_postventa_perfil.telefono = telefono_por_usuario["jefe_postventa"]
         jefe_postventa_perfil.concesionario = concesionario_por_usuario["jefe_postventa"]
         jefe_postventa_perfil.sede = sede_principal
+        jefe_postventa_perfil.instalacion = instalacion
         jefe_postventa_perfil.area = Perfil.AREA_POSTVENTA
         jefe_postventa_perfil.gerente = users["gerente"]
         jefe_postventa_perfil.director_comercial = users["director"]
@@ -274,6 +290,7 @@ class Command(BaseCommand):
             perfil.telefono = telefono_por_usuario[vendedor_key]
             perfil.concesionario = concesionario_por_usuario[vendedor_key]
             perfil.sede = sede_principal
+            perfil.instalacion = instalacion
             perfil.area = area
             perfil.jefe_ventas = jefe_ref
             perfil.gerente = users["gerente"]
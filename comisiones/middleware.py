@@ -5,7 +5,16 @@ from django.utils import timezone
 
 
 class SessionIdleTimeoutMiddleware:
-    """Cierra sesion si el usuario autenticado supera el tiempo de inactividad."""
+    """Cierra sesion si el usuario autenticado supera el tiempo de inactividad.
+
+    La ultima actividad solo se guarda en sesion cuando ha avanzado al menos
+    `SESSION_IDLE_ACTIVITY_GRANULARITY_SECONDS`, para no escribir la tabla de
+    sesiones en cada peticion. El cierre sigue siendo a los
+    `SESSION_IDLE_TIMEOUT_SECONDS` del valor guardado, que puede ir hasta esa
+    granularidad por detras de la actividad real. Si la granularidad pasa de la
+    mitad del timeout, se escribe a partir de `timeout - granularidad` (o en cada
+    peticion), para que un usuario activo no caduque.
+    """
 
     def __init__(self, get_response):
         self.get_response = get_response
@@ -13,6 +22,12 @@ class SessionIdleTimeoutMiddleware:
     def __call__(self, request):
         timeout_seconds = int(getattr(settings, "SESSION_IDLE_TIMEOUT_SECONDS", 0))
         if timeout_seconds > 0 and request.user.is_authenticated:
+            granularity_seconds = int(
+                getattr(settings, "SESSION_IDLE_ACTIVITY_GRANULARITY_SECONDS", 0)
+            )
+            refresh_seconds = max(
+                0, min(granularity_seconds, timeout_seconds - granularity_seconds)
+            )
             now_ts = int(timezone.now().timestamp())
             last_activity_ts = request.session.get("last_activity_ts")
 
@@ -30,6 +45,9 @@ class SessionIdleTimeoutMiddleware:
                     logout(request)
                     return redirect(f"{settings.LOGIN_URL}?session_expired=1")
 
-            request.session["last_activity_ts"] = now_ts
+            if last_activity_ts is None or (
+                not is_exempt and now_ts - int(last_activity_ts) >= refresh_seconds
+            ):
+                request.session["last_activity_ts"] = now_ts
 
         return self.get_response(request)
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0015_perfil_concesionario"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExportacionVentas",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("formato", models.CharField(choices=[("csv", "CSV"), ("excel", "Excel")], default="csv", max_length=10)),
+                ("parametros", models.JSONField(blank=True, default=dict)),
+                ("ventas_ids", models.JSONField(blank=True, default=list)),
+                ("estado", models.CharField(choices=[("pendiente", "Pendiente"), ("en_curso", "En curso"), ("completada", "Completada"), ("error", "Error"), ("caducada", "Caducada")], default="pendiente", max_length=20)),
+                ("filas_totales", models.PositiveIntegerField(default=0)),
+                ("filas_procesadas", models.PositiveIntegerField(default=0)),
+                ("archivo", models.FileField(blank=True, null=True, upload_to="exportaciones/")),
+                ("error", models.TextField(blank=True, default="")),
+                ("creada_en", models.DateTimeField(auto_now_add=True)),
+                ("iniciada_en", models.DateTimeField(blank=True, null=True)),
+                ("finalizada_en", models.DateTimeField(blank=True, null=True)),
+                ("usuario", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="exportaciones_ventas", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["-creada_en", "-id"],
+                "indexes": [models.Index(fields=["estado", "creada_en"], name="exportacion_estado_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def poblar_resumenes(apps, schema_editor):
+    Venta = apps.get_model("comisiones", "Venta")
+    Comision = apps.get_model("comisiones", "Comision")
+    ResumenMensualVentas = apps.get_model("comisiones", "ResumenMensualVentas")
+
+    filas = {}
+    ventas = (
+        Venta.objects.filter(usuario__isnull=False)
+        .annotate(anio=ExtractYear("fecha_venta"), mes=ExtractMonth("fecha_venta"))
+        .values("usuario_id", "anio", "mes")
+        .order_by()
+        .annotate(
+            ventas_total=Count("id"),
+            ventas_exenta=Count("id", filter=Q(tipo_venta="EXENTA")),
+            ventas_renting=Count("id", filter=Q(tipo_venta="RENTING")),
+            ventas_particular=Count("id", filter=Q(tipo_venta="PARTICULAR")),
+            ventas_cif=Count("id", filter=Q(tipo_cliente="CIF")),
+            ventas_nif=Count("id", filter=Q(tipo_cliente="NIF")),
+        )
+    )
+    for valores in ventas:
+        clave = (valores.pop("usuario_id"), valores.pop("anio"), valores.pop("mes"))
+        filas[clave] = ResumenMensualVentas(
+            usuario_id=clave[0], anio=clave[1], mes=clave[2], **valores
+        )
+
+    comisiones = (
+        Comision.objects.filter(venta__usuario__isnull=False)
+        .annotate(
+            usuario_id=F("venta__usuario_id"),
+            anio=ExtractYear("venta__fecha_venta"),
+            mes=ExtractMonth("venta__fecha_venta"),
+        )
+        .values("usuario_id", "anio", "mes")
+        .order_by()
+        .annotate(
+            comision_pendiente=Sum("monto", filter=Q(estado="pendiente")),
+            comision_aprobada=Sum("monto", filter=Q(estado="aprobada")),
+            comision_rechazada=Sum("monto", filter=Q(estado="rechazada")),
+        )
+    )
+    for valores in comisiones:
+        clave = (valores.pop("usuario_id"), valores.pop("anio"), valores.pop("mes"))
+        if clave in filas:
+            for campo, total in valores.items():
+                setattr(filas[clave], campo, total)
+
+    ResumenMensualVentas.objects.bulk_create(filas.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0016_exportacionventas"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResumenMensualVentas",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("anio", models.PositiveSmallIntegerField()),
+                ("mes", models.PositiveSmallIntegerField()),
+                ("ventas_total", models.PositiveIntegerField(default=0)),
+                ("ventas_exenta", models.PositiveIntegerField(default=0)),
+                ("ventas_renting", models.PositiveIntegerField(default=0)),
+                ("ventas_particular", models.PositiveIntegerField(default=0)),
+                ("ventas_cif", models.PositiveIntegerField(default=0)),
+                ("ventas_nif", models.PositiveIntegerField(default=0)),
+                ("comision_pendiente", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ("comision_aprobada", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ("comision_rechazada", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ("actualizado_en", models.DateTimeField(auto_now=True)),
+                ("usuario", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="resumenes_mensuales", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["usuario", "anio", "mes"],
+                "constraints": [models.UniqueConstraint(fields=("usuario", "anio", "mes"), name="uniq_resumen_usuario_mes")],
+            },
+        ),
+        migrations.RunPython(poblar_resumenes, migrations.RunPython.noop),
+    ]
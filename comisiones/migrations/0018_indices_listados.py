@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0017_resumenmensualventas"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="boletin",
+            index=models.Index(condition=models.Q(("activo", True)), fields=["fecha"], name="boletin_activo_fecha_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="comision",
+            index=models.Index(fields=["venta", "estado", "monto"], name="comision_venta_estado_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="incidencia",
+            index=models.Index(fields=["reportado_por", "fecha_incidencia"], name="incidencia_usuario_fecha_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="venta",
+            index=models.Index(fields=["usuario", "fecha_venta"], name="venta_usuario_fecha_idx"),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:37
+
+import re
+
+import comisiones.models
+from django.db import migrations, models
+
+
+def poblar_dni_normalizado(apps, schema_editor):
+    Perfil = apps.get_model("comisiones", "Perfil")
+
+    # Con DNIs repetidos se queda el perfil mas antiguo, que es el que
+    # encontraba el login anterior (`filter(dni__iexact=...).first()`).
+    vistos = set()
+    pendientes = []
+    for perfil in Perfil.objects.exclude(dni="").order_by("pk").only("pk", "dni"):
+        dni = re.sub(r"[\s.\-]", "", perfil.dni or "").upper()
+        if not dni or dni in vistos:
+            continue
+        vistos.add(dni)
+        perfil.dni_normalizado = dni
+        pendientes.append(perfil)
+    Perfil.objects.bulk_update(pendientes, ["dni_normalizado"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0018_indices_listados"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="perfil",
+            name="dni_normalizado",
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.RunPython(poblar_dni_normalizado, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="perfil",
+            name="dni_normalizado",
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="perfil",
+            name="dni",
+            field=models.CharField(blank=True, default="", max_length=20, validators=[comisiones.models.validar_dni]),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def poblar_jerarquia(apps, schema_editor):
+    Perfil = apps.get_model("comisiones", "Perfil")
+    JerarquiaPerfil = apps.get_model("comisiones", "JerarquiaPerfil")
+
+    perfiles = {perfil.user_id: perfil for perfil in Perfil.objects.all()}
+
+    # Los cambios de jefes y gerentes no se propagaban a sus subordinados:
+    # se recalcula la cadena de arriba abajo, como hace ahora `Perfil.save`.
+    def director_de(user_id):
+        perfil = perfiles.get(user_id)
+        return perfil.director_comercial_id if perfil else None
+
+    for perfil in perfiles.values():
+        if not perfil.jefe_ventas_id and perfil.gerente_id:
+            perfil.director_comercial_id = director_de(perfil.gerente_id)
+    for perfil in perfiles.values():
+        if perfil.jefe_ventas_id:
+            jefe = perfiles.get(perfil.jefe_ventas_id)
+            perfil.gerente_id = jefe.gerente_id if jefe else None
+            perfil.director_comercial_id = (
+                director_de(perfil.gerente_id) if perfil.gerente_id else None
+            )
+    Perfil.objects.bulk_update(
+        perfiles.values(), ["gerente", "director_comercial"], batch_size=500
+    )
+
+    superiores = {
+        user_id: perfil.jefe_ventas_id
+        or perfil.gerente_id
+        or perfil.director_comercial_id
+        for user_id, perfil in perfiles.items()
+    }
+    filas = []
+    for user_id in superiores:
+        actual, profundidad, vistos = user_id, 0, set()
+        while actual and actual not in vistos:
+            vistos.add(actual)
+            filas.append(
+                JerarquiaPerfil(
+                    superior_id=actual, subordinado_id=user_id, profundidad=profundidad
+                )
+            )
+            actual, profundidad = superiores.get(actual), profundidad + 1
+    JerarquiaPerfil.objects.bulk_create(filas, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0019_perfil_dni_normalizado"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JerarquiaPerfil",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("profundidad", models.PositiveSmallIntegerField()),
+                ("subordinado", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="superiores_jerarquia", to=settings.AUTH_USER_MODEL)),
+                ("superior", models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name="subordinados_jerarquia", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "constraints": [models.UniqueConstraint(fields=("superior", "subordinado"), name="uniq_jerarquia_superior_sub")],
+            },
+        ),
+        migrations.RunPython(poblar_jerarquia, migrations.RunPython.noop),
+    ]
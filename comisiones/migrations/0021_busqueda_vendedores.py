@@ -0,0 +1,67 @@
+# Generated by Django 6.0.2 on 2026-10-18 20:40
+
+from django.conf import settings
+from django.db import OperationalError, migrations
+
+TABLA_USUARIOS = "comisiones_busqueda_usuario"
+TABLA_VENTAS = "comisiones_busqueda_venta"
+
+INDICES_TRIGRAM = (
+    ("auth_user_username_trgm", "auth_user", "username"),
+    ("auth_user_first_name_trgm", "auth_user", "first_name"),
+    ("auth_user_last_name_trgm", "auth_user", "last_name"),
+    ("comisiones_venta_matricula_trgm", "comisiones_venta", "matricula"),
+)
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        try:
+            for tabla in (TABLA_USUARIOS, TABLA_VENTAS):
+                schema_editor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {tabla} "
+                    "USING fts5(texto, tokenize='trigram')"
+                )
+        except OperationalError:
+            # SQLite sin FTS5 o anterior a 3.34: se sigue buscando con LIKE.
+            return
+        schema_editor.execute(
+            f"INSERT INTO {TABLA_USUARIOS} (rowid, texto) "
+            "SELECT id, TRIM(username || ' ' || first_name || ' ' || last_name) "
+            "FROM auth_user"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {TABLA_VENTAS} (rowid, texto) "
+            "SELECT id, matricula FROM comisiones_venta"
+        )
+    elif vendor == "postgresql":
+        # `icontains` se traduce a `UPPER(col) LIKE UPPER(...)`.
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for nombre, tabla, columna in INDICES_TRIGRAM:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} "
+                f"USING gin ((UPPER({columna}::text)) gin_trgm_ops)"
+            )
+
+
+def borrar_indices_busqueda(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        for tabla in (TABLA_USUARIOS, TABLA_VENTAS):
+            schema_editor.execute(f"DROP TABLE IF EXISTS {tabla}")
+    elif vendor == "postgresql":
+        for nombre, _, _ in INDICES_TRIGRAM:
+            schema_editor.execute(f"DROP INDEX IF EXISTS {nombre}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0020_jerarquiaperfil"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices_busqueda, borrar_indices_busqueda),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def poblar_instalaciones(apps, schema_editor):
+    Instalacion = apps.get_model("comisiones", "Instalacion")
+    Perfil = apps.get_model("comisiones", "Perfil")
+    Venta = apps.get_model("comisiones", "Venta")
+    Incidencia = apps.get_model("comisiones", "Incidencia")
+
+    # Una instalacion por cada par (concesionario, sede) de los perfiles. El
+    # codigo es provisional y se corrige desde el admin.
+    pares = (
+        Perfil.objects.exclude(concesionario="", sede="")
+        .values_list("concesionario", "sede")
+        .distinct()
+        .order_by("concesionario", "sede")
+    )
+    for numero, (concesionario, sede) in enumerate(pares, start=1):
+        instalacion = Instalacion.objects.create(
+            codigo=f"{numero:04d}",
+            nombre=" ".join(filter(None, (concesionario, sede))),
+            concesionario=concesionario,
+            sede=sede,
+        )
+        Perfil.objects.filter(concesionario=concesionario, sede=sede).update(
+            instalacion=instalacion
+        )
+
+    Venta.objects.update(
+        instalacion=Subquery(
+            Perfil.objects.filter(user_id=OuterRef("usuario_id")).values(
+                "instalacion_id"
+            )[:1]
+        )
+    )
+    Incidencia.objects.update(
+        instalacion=Subquery(
+            Perfil.objects.filter(user_id=OuterRef("reportado_por_id")).values(
+                "instalacion_id"
+            )[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0021_busqueda_vendedores"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Instalacion",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("codigo", models.CharField(max_length=10, unique=True)),
+                ("nombre", models.CharField(max_length=120)),
+                ("activa", models.BooleanField(default=True)),
+                ("concesionario", models.CharField(blank=True, default="", max_length=120)),
+                ("sede", models.CharField(blank=True, default="", max_length=100)),
+            ],
+            options={
+                "verbose_name_plural": "instalaciones",
+                "ordering": ["codigo"],
+                "indexes": [models.Index(fields=["concesionario", "sede"], name="instalacion_sede_idx")],
+            },
+        ),
+        migrations.AddField(
+            model_name="perfil",
+            name="instalacion",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="perfiles", to="comisiones.instalacion"),
+        ),
+        migrations.AddField(
+            model_name="venta",
+            name="instalacion",
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="ventas", to="comisiones.instalacion"),
+        ),
+        migrations.AddField(
+            model_name="incidencia",
+            name="instalacion",
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="incidencias", to="comisiones.instalacion"),
+        ),
+        migrations.AddIndex(
+            model_name="venta",
+            index=models.Index(fields=["instalacion", "fecha_venta"], name="venta_instalacion_fecha_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="incidencia",
+            index=models.Index(fields=["instalacion", "fecha_incidencia"], name="incidencia_instalacion_idx"),
+        ),
+        migrations.RunPython(poblar_instalaciones, migrations.RunPython.noop),
+    ]
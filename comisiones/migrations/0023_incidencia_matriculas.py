@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 21:40
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def poblar_matriculas(apps, schema_editor):
+    Incidencia = apps.get_model("comisiones", "Incidencia")
+
+    por_incidencia = defaultdict(list)
+    for incidencia_id, matricula in (
+        Incidencia.ventas.through.objects.order_by("venta_id").values_list(
+            "incidencia_id", "venta__matricula"
+        )
+    ):
+        por_incidencia[incidencia_id].append(matricula)
+
+    incidencias = []
+    for incidencia in Incidencia.objects.filter(es_general=False).only("id"):
+        matriculas = por_incidencia.get(incidencia.id)
+        if not matriculas:
+            continue
+        incidencia.matriculas = ", ".join(matriculas)
+        incidencias.append(incidencia)
+    Incidencia.objects.bulk_update(incidencias, ["matriculas"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0022_instalacion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="incidencia",
+            name="matriculas",
+            field=models.TextField(blank=True, default="GENERAL", editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="incidencia",
+            index=models.Index(fields=["reportado_por", "matriculas"], name="incidencia_usuario_matr_idx"),
+        ),
+        migrations.RunPython(poblar_matriculas, migrations.RunPython.noop),
+    ]
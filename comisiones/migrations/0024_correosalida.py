@@ -0,0 +1,39 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0023_incidencia_matriculas"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CorreoSalida",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("asunto", models.CharField(max_length=255)),
+                ("cuerpo", models.TextField()),
+                ("remitente", models.CharField(max_length=254)),
+                ("destinatarios", models.JSONField(default=list)),
+                ("estado", models.CharField(choices=[("pendiente", "Pendiente"), ("enviando", "Enviando"), ("enviado", "Enviado"), ("error", "Error")], default="pendiente", max_length=20)),
+                ("intentos", models.PositiveSmallIntegerField(default=0)),
+                ("proximo_intento", models.DateTimeField(default=django.utils.timezone.now)),
+                ("lote", models.CharField(blank=True, default="", max_length=32)),
+                ("reclamado_en", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("creado_en", models.DateTimeField(auto_now_add=True)),
+                ("enviado_en", models.DateTimeField(blank=True, null=True)),
+                ("incidencia", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="correos", to="comisiones.incidencia")),
+            ],
+            options={
+                "verbose_name_plural": "correos de salida",
+                "ordering": ["-creado_en", "-id"],
+                "indexes": [models.Index(fields=["estado", "proximo_intento"], name="correo_estado_intento_idx")],
+            },
+        ),
+    ]
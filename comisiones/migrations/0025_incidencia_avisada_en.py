@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-18 22:30
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def marcar_existentes_como_avisadas(apps, schema_editor):
+    # Las incidencias anteriores ya se avisaron una a una al registrarlas.
+    Incidencia = apps.get_model("comisiones", "Incidencia")
+    Incidencia.objects.update(avisada_en=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0024_correosalida"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="incidencia",
+            name="avisada_en",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(marcar_existentes_como_avisadas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="incidencia",
+            index=models.Index(condition=models.Q(("avisada_en__isnull", True)), fields=["id"], name="incidencia_sin_aviso_idx"),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 6.0.2 on 2026-10-18 23:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("comisiones", "0025_incidencia_avisada_en"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RevisionMasiva",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tipo", models.CharField(choices=[("comision", "Comisiones"), ("incidencia", "Incidencias")], max_length=20)),
+                ("accion", models.CharField(max_length=20)),
+                ("estado_nuevo", models.CharField(max_length=20)),
+                ("modo", models.CharField(max_length=10)),
+                ("parametros", models.JSONField(default=dict)),
+                ("leido_en", models.DateTimeField()),
+                ("actualizadas", models.PositiveIntegerField(default=0)),
+                ("conflictos", models.PositiveIntegerField(default=0)),
+                ("creada_en", models.DateTimeField(auto_now_add=True)),
+                ("usuario", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="revisiones_masivas", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "verbose_name_plural": "revisiones masivas",
+                "ordering": ["-creada_en", "-id"],
+            },
+        ),
+        migrations.AddField(
+            model_name="comision",
+            name="modificada_en",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="comision",
+            name="revision_masiva",
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="comisiones", to="comisiones.revisionmasiva"),
+        ),
+        migrations.AddField(
+            model_name="incidencia",
+            name="modificada_en",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="incidencia",
+            name="revision_masiva",
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="incidencias", to="comisiones.revisionmasiva"),
+        ),
+    ]
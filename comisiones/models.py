@@ -1,14 +1,78 @@
+import re
+from calendar import monthrange
+from collections import defaultdict
 from datetime import date
 
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
 
-from django.db.models.signals import post_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
 from django.dispatch import receiver
 
 # Create your models here.
 
 
+class Instalacion(models.Model):
+    """Concesionario/sede en el que trabaja un usuario y se registran sus ventas."""
+
+    codigo = models.CharField(max_length=10, unique=True)
+    nombre = models.CharField(max_length=120)
+    activa = models.BooleanField(default=True)
+    # Concesionario y sede de los perfiles: `Perfil.save` asigna la instalacion
+    # a partir de ellos.
+    concesionario = models.CharField(max_length=120, blank=True, default="")
+    sede = models.CharField(max_length=100, blank=True, default="")
+
+    class Meta:
+        ordering = ["codigo"]
+        verbose_name_plural = "instalaciones"
+        indexes = [
+            models.Index(
+                fields=["concesionario", "sede"], name="instalacion_sede_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.codigo}: {self.nombre}"
+
+    @classmethod
+    def de_sede(cls, concesionario, sede):
+        """Instalacion de un concesionario y sede; `None` si ambos estan vacios.
+
+        Si no existe se crea con un codigo provisional (`P0001`...), que se
+        corrige desde el admin.
+        """
+        concesionario, sede = (concesionario or "").strip(), (sede or "").strip()
+        if not concesionario and not sede:
+            return None
+        instalacion = (
+            cls.objects.filter(concesionario=concesionario, sede=sede)
+            .order_by("-activa", "codigo")
+            .first()
+        )
+        if instalacion is None:
+            numero = cls.objects.count() + 1
+            while cls.objects.filter(codigo=f"P{numero:04d}").exists():
+                numero += 1
+            instalacion = cls.objects.create(
+                codigo=f"P{numero:04d}",
+                nombre=" ".join(filter(None, (concesionario, sede))),
+                concesionario=concesionario,
+                sede=sede,
+            )
+        return instalacion
+
+
 class Venta(models.Model):
     usuario = models.ForeignKey(
         User,
@@ -41,6 +105,29 @@ class Venta(models.Model):
 
     fecha_venta = models.DateField(auto_now_add=True)
 
+    # Instalacion del vendedor al registrar la venta (ver `asignar_instalacion`).
+    instalacion = models.ForeignKey(
+        Instalacion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="ventas",
+        db_index=False,
+    )
+
+    class Meta:
+        indexes = [
+            # Listados y KPI filtran por usuario y rango de fechas.
+            models.Index(
+                fields=["usuario", "fecha_venta"], name="venta_usuario_fecha_idx"
+            ),
+            # Las pantallas de gerencia filtran por instalacion y periodo.
+            models.Index(
+                fields=["instalacion", "fecha_venta"],
+                name="venta_instalacion_fecha_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"{self.matricula} - {self.nombre_cliente} - {self.tipo_venta}"
 
@@ -78,11 +165,224 @@ class Comision(models.Model):
     ]
     estado = models.CharField(max_length=10, choices=ESTADOS, default="pendiente")
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    # Control de concurrencia optimista de las revisiones en bloque.
+    modificada_en = models.DateTimeField(auto_now=True)
+    revision_masiva = models.ForeignKey(
+        "RevisionMasiva",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="comisiones",
+        editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            # Cubre la suma de `monto` por estado de las ventas de un listado.
+            models.Index(
+                fields=["venta", "estado", "monto"], name="comision_venta_estado_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.venta} – {self.monto} € – {self.get_estado_display()}"
 
 
+class ResumenMensualVentas(models.Model):
+    """Totales de ventas y comisiones por usuario y mes para las tarjetas KPI.
+
+    Se mantiene al dia con las senales de `Venta` y `Comision` (solo se
+    recalcula el mes afectado) y se puede regenerar entero con el comando
+    `reconstruir_resumenes`. Las comisiones cuentan en el mes de su venta.
+    """
+
+    CONTADORES_TIPO_VENTA = {
+        "EXENTA": "ventas_exenta",
+        "RENTING": "ventas_renting",
+        "PARTICULAR": "ventas_particular",
+    }
+    CONTADORES_TIPO_CLIENTE = {
+        "CIF": "ventas_cif",
+        "NIF": "ventas_nif",
+    }
+    TOTALES_COMISION = {
+        "pendiente": "comision_pendiente",
+        "aprobada": "comision_aprobada",
+        "rechazada": "comision_rechazada",
+    }
+
+    usuario = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="resumenes_mensuales"
+    )
+    anio = models.PositiveSmallIntegerField()
+    mes = models.PositiveSmallIntegerField()
+    ventas_total = models.PositiveIntegerField(default=0)
+    ventas_exenta = models.PositiveIntegerField(default=0)
+    ventas_renting = models.PositiveIntegerField(default=0)
+    ventas_particular = models.PositiveIntegerField(default=0)
+    ventas_cif = models.PositiveIntegerField(default=0)
+    ventas_nif = models.PositiveIntegerField(default=0)
+    # Nulo cuando el mes no tiene comisiones en ese estado, igual que un
+    # `Sum` sobre cero filas.
+    comision_pendiente = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    comision_aprobada = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    comision_rechazada = models.DecimalField(
+        max_digits=12, decimal_places=2, null=True, blank=True
+    )
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["usuario", "anio", "mes"], name="uniq_resumen_usuario_mes"
+            )
+        ]
+        ordering = ["usuario", "anio", "mes"]
+
+    @classmethod
+    def _agregados_ventas(cls):
+        agregados = {"ventas_total": Count("id")}
+        for codigo, campo in cls.CONTADORES_TIPO_VENTA.items():
+            agregados[campo] = Count("id", filter=Q(tipo_venta=codigo))
+        for codigo, campo in cls.CONTADORES_TIPO_CLIENTE.items():
+            agregados[campo] = Count("id", filter=Q(tipo_cliente=codigo))
+        return agregados
+
+    @classmethod
+    def _agregados_comisiones(cls):
+        return {
+            campo: Sum("monto", filter=Q(estado=estado))
+            for estado, campo in cls.TOTALES_COMISION.items()
+        }
+
+    @classmethod
+    def recalcular(cls, usuario_id, anio, mes):
+        """Vuelve a calcular un unico mes de un usuario a partir de las ventas."""
+        if not usuario_id:
+            return
+        primer_dia = date(anio, mes, 1)
+        ultimo_dia = date(anio, mes, monthrange(anio, mes)[1])
+        ventas = Venta.objects.filter(
+            usuario_id=usuario_id,
+            fecha_venta__gte=primer_dia,
+            fecha_venta__lte=ultimo_dia,
+        )
+        valores = ventas.aggregate(**cls._agregados_ventas())
+        if not valores["ventas_total"]:
+            cls.objects.filter(usuario_id=usuario_id, anio=anio, mes=mes).delete()
+            return
+        valores.update(
+            Comision.objects.filter(venta__in=ventas).aggregate(
+                **cls._agregados_comisiones()
+            )
+        )
+        cls.objects.update_or_create(
+            usuario_id=usuario_id, anio=anio, mes=mes, defaults=valores
+        )
+
+    @classmethod
+    def reconstruir(cls, usuario=None):
+        """Regenera la tabla (o solo un usuario) desde las ventas. Devuelve filas."""
+        ventas = Venta.objects.filter(usuario__isnull=False)
+        comisiones = Comision.objects.filter(venta__usuario__isnull=False)
+        resumenes = cls.objects.all()
+        if usuario is not None:
+            ventas = ventas.filter(usuario=usuario)
+            comisiones = comisiones.filter(venta__usuario=usuario)
+            resumenes = resumenes.filter(usuario=usuario)
+
+        filas = {}
+        for valores in (
+            ventas.annotate(
+                anio=ExtractYear("fecha_venta"), mes=ExtractMonth("fecha_venta")
+            )
+            .values("usuario_id", "anio", "mes")
+            .order_by()
+            .annotate(**cls._agregados_ventas())
+        ):
+            clave = (valores.pop("usuario_id"), valores.pop("anio"), valores.pop("mes"))
+            filas[clave] = cls(
+                usuario_id=clave[0], anio=clave[1], mes=clave[2], **valores
+            )
+        for valores in (
+            comisiones.annotate(
+                usuario_id=models.F("venta__usuario_id"),
+                anio=ExtractYear("venta__fecha_venta"),
+                mes=ExtractMonth("venta__fecha_venta"),
+            )
+            .values("usuario_id", "anio", "mes")
+            .order_by()
+            .annotate(**cls._agregados_comisiones())
+        ):
+            clave = (valores.pop("usuario_id"), valores.pop("anio"), valores.pop("mes"))
+            if clave in filas:
+                for campo, total in valores.items():
+                    setattr(filas[clave], campo, total)
+
+        with transaction.atomic():
+            resumenes.delete()
+            cls.objects.bulk_create(filas.values(), batch_size=500)
+        return len(filas)
+
+    @classmethod
+    def recalcular_totales_comision(cls, meses):
+        """Recalcula solo los importes por estado de comision de varios meses.
+
+        `meses` son tuplas `(usuario_id, anio, mes)`. Para los cambios de estado
+        en bloque, que no tocan las ventas: dos lecturas y un `bulk_update`
+        sea cual sea el numero de meses. Devuelve cuantas filas.
+        """
+        meses = set(filter(None, meses))
+        if not meses:
+            return 0
+        usuarios = {usuario_id for usuario_id, _, _ in meses}
+        anios = {anio for _, anio, _ in meses}
+
+        totales = {}
+        for valores in (
+            Comision.objects.filter(
+                venta__usuario_id__in=usuarios, venta__fecha_venta__year__in=anios
+            )
+            .annotate(
+                usuario_id=models.F("venta__usuario_id"),
+                anio=ExtractYear("venta__fecha_venta"),
+                mes=ExtractMonth("venta__fecha_venta"),
+            )
+            .values("usuario_id", "anio", "mes")
+            .order_by()
+            .annotate(**cls._agregados_comisiones())
+        ):
+            clave = (valores.pop("usuario_id"), valores.pop("anio"), valores.pop("mes"))
+            totales[clave] = valores
+
+        campos = list(cls.TOTALES_COMISION.values())
+        resumenes = []
+        for resumen in cls.objects.filter(usuario_id__in=usuarios, anio__in=anios):
+            clave = (resumen.usuario_id, resumen.anio, resumen.mes)
+            if clave not in meses:
+                continue
+            for campo in campos:
+                setattr(resumen, campo, totales.get(clave, {}).get(campo))
+            resumenes.append(resumen)
+        cls.objects.bulk_update(resumenes, campos, batch_size=500)
+        return len(resumenes)
+
+    @classmethod
+    def del_periodo(cls, usuario, desde, hasta):
+        """Filas de `usuario` entre dos meses `(anio, mes)`, ambos incluidos."""
+        return cls.objects.filter(usuario=usuario).filter(
+            Q(anio__gt=desde[0]) | Q(anio=desde[0], mes__gte=desde[1]),
+            Q(anio__lt=hasta[0]) | Q(anio=hasta[0], mes__lte=hasta[1]),
+        )
+
+    def __str__(self):
+        return f"Resumen {self.usuario_id} {self.mes:02d}/{self.anio}"
+
+
 class Incidencia(models.Model):
     ESTADOS = [
         ("pte_revision", "Pte. revision"),
@@ -104,19 +404,115 @@ class Incidencia(models.Model):
     detalle = models.TextField()
     estado = models.CharField(max_length=20, choices=ESTADOS, default="pte_revision")
     validacion_ok = models.BooleanField(default=False)
+    instalacion = models.ForeignKey(
+        Instalacion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="incidencias",
+        db_index=False,
+    )
+
+    ETIQUETA_GENERAL = "GENERAL"
+    # Matriculas de `ventas` separadas por comas (o GENERAL), guardadas para
+    # ordenar, filtrar y paginar en SQL. Sin limite de longitud: recortarla
+    # ocultaria matriculas al filtrar. La mantienen `save` y las senales de
+    # `ventas` y `Venta`; `reconstruir_matriculas_incidencias` la regenera.
+    matriculas = models.TextField(
+        blank=True, default=ETIQUETA_GENERAL, editable=False
+    )
+    # Cuando se encolo su aviso por correo (individual o en un resumen).
+    avisada_en = models.DateTimeField(null=True, blank=True, editable=False)
+    # Control de concurrencia optimista de las revisiones en bloque.
+    modificada_en = models.DateTimeField(auto_now=True)
+    revision_masiva = models.ForeignKey(
+        "RevisionMasiva",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="incidencias",
+        editable=False,
+    )
 
     class Meta:
         ordering = ["-fecha_incidencia", "-id"]
+        indexes = [
+            models.Index(
+                fields=["reportado_por", "fecha_incidencia"],
+                name="incidencia_usuario_fecha_idx",
+            ),
+            models.Index(
+                fields=["instalacion", "fecha_incidencia"],
+                name="incidencia_instalacion_idx",
+            ),
+            # `Mis Incidencias` ordenado por matricula.
+            models.Index(
+                fields=["reportado_por", "matriculas"],
+                name="incidencia_usuario_matr_idx",
+            ),
+            # Parcial: solo las pendientes de aviso, que son pocas.
+            models.Index(
+                fields=["id"],
+                condition=models.Q(avisada_en__isnull=True),
+                name="incidencia_sin_aviso_idx",
+            ),
+        ]
 
     @property
     def matricula_display(self):
-        if self.es_general:
-            return "GENERAL"
-        matriculas = [venta.matricula for venta in self.ventas.all()]
-        if not matriculas:
-            return "GENERAL"
+        return self.matriculas or self.ETIQUETA_GENERAL
+
+    @classmethod
+    def etiqueta_matriculas(cls, es_general, matriculas):
+        if es_general or not matriculas:
+            return cls.ETIQUETA_GENERAL
         return ", ".join(matriculas)
 
+    def _calcular_matriculas(self):
+        matriculas = []
+        if self.pk and not self.es_general:
+            matriculas = list(
+                self.ventas.order_by("id").values_list("matricula", flat=True)
+            )
+        return self.etiqueta_matriculas(self.es_general, matriculas)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "es_general" in update_fields:
+            self.matriculas = self._calcular_matriculas()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "matriculas"}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def actualizar_matriculas(cls, incidencia_ids=None):
+        """Recalcula `matriculas` de esas incidencias (de todas si `None`).
+
+        Devuelve cuantas han cambiado.
+        """
+        incidencias = cls.objects.only("id", "es_general", "matriculas").order_by()
+        relaciones = cls.ventas.through.objects.order_by("venta_id")
+        if incidencia_ids is not None:
+            incidencias = incidencias.filter(id__in=incidencia_ids)
+            relaciones = relaciones.filter(incidencia_id__in=incidencia_ids)
+
+        por_incidencia = defaultdict(list)
+        for incidencia_id, matricula in relaciones.values_list(
+            "incidencia_id", "venta__matricula"
+        ):
+            por_incidencia[incidencia_id].append(matricula)
+
+        cambiadas = []
+        for incidencia in incidencias:
+            etiqueta = cls.etiqueta_matriculas(
+                incidencia.es_general, por_incidencia.get(incidencia.id)
+            )
+            if etiqueta != incidencia.matriculas:
+                incidencia.matriculas = etiqueta
+                cambiadas.append(incidencia)
+        cls.objects.bulk_update(cambiadas, ["matriculas"], batch_size=500)
+        return len(cambiadas)
+
     def __str__(self):
         return f"Incidencia {self.id or '-'} - {self.tipo}"
 
@@ -131,6 +527,15 @@ class Boletin(models.Model):
 
     class Meta:
         ordering = ["-fecha", "-id"]
+        indexes = [
+            # Parcial: el filtro `activo=True` se compila como `WHERE activo`, que
+            # no puede usar un indice compuesto (activo, fecha).
+            models.Index(
+                fields=["fecha"],
+                condition=models.Q(activo=True),
+                name="boletin_activo_fecha_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.boletin} ({self.fecha:%d/%m/%Y})"
@@ -158,6 +563,169 @@ class LecturaBoletin(models.Model):
         return f"{self.usuario.username} -> {self.boletin.boletin}"
 
 
+class ExportacionVentas(models.Model):
+    """Trabajo de exportacion de `Mis Ventas` procesado en segundo plano."""
+
+    FORMATO_CSV = "csv"
+    FORMATO_EXCEL = "excel"
+    FORMATOS = [
+        (FORMATO_CSV, "CSV"),
+        (FORMATO_EXCEL, "Excel"),
+    ]
+
+    ESTADO_PENDIENTE = "pendiente"
+    ESTADO_EN_CURSO = "en_curso"
+    ESTADO_COMPLETADA = "completada"
+    ESTADO_ERROR = "error"
+    ESTADO_CADUCADA = "caducada"
+    ESTADOS = [
+        (ESTADO_PENDIENTE, "Pendiente"),
+        (ESTADO_EN_CURSO, "En curso"),
+        (ESTADO_COMPLETADA, "Completada"),
+        (ESTADO_ERROR, "Error"),
+        (ESTADO_CADUCADA, "Caducada"),
+    ]
+
+    usuario = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="exportaciones_ventas"
+    )
+    formato = models.CharField(max_length=10, choices=FORMATOS, default=FORMATO_CSV)
+    parametros = models.JSONField(default=dict, blank=True)
+    ventas_ids = models.JSONField(default=list, blank=True)
+    estado = models.CharField(
+        max_length=20, choices=ESTADOS, default=ESTADO_PENDIENTE
+    )
+    filas_totales = models.PositiveIntegerField(default=0)
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    archivo = models.FileField(upload_to="exportaciones/", blank=True, null=True)
+    error = models.TextField(blank=True, default="")
+    creada_en = models.DateTimeField(auto_now_add=True)
+    iniciada_en = models.DateTimeField(null=True, blank=True)
+    finalizada_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-creada_en", "-id"]
+        indexes = [
+            models.Index(
+                fields=["estado", "creada_en"], name="exportacion_estado_idx"
+            )
+        ]
+
+    @property
+    def progreso(self):
+        if not self.filas_totales:
+            return 100 if self.estado == self.ESTADO_COMPLETADA else 0
+        return min(100, round(self.filas_procesadas * 100 / self.filas_totales))
+
+    def __str__(self):
+        return f"Exportacion {self.id or '-'} ({self.formato}) - {self.get_estado_display()}"
+
+
+class CorreoSalida(models.Model):
+    """Correo en la bandeja de salida, enviado en segundo plano por `enviar_correos`."""
+
+    ESTADO_PENDIENTE = "pendiente"
+    ESTADO_ENVIANDO = "enviando"
+    ESTADO_ENVIADO = "enviado"
+    ESTADO_ERROR = "error"
+    ESTADOS = [
+        (ESTADO_PENDIENTE, "Pendiente"),
+        (ESTADO_ENVIANDO, "Enviando"),
+        (ESTADO_ENVIADO, "Enviado"),
+        (ESTADO_ERROR, "Error"),
+    ]
+
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField()
+    remitente = models.CharField(max_length=254)
+    destinatarios = models.JSONField(default=list)
+    incidencia = models.ForeignKey(
+        Incidencia,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="correos",
+    )
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=ESTADO_PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now)
+    # Pasada del worker que lo ha reclamado y cuando, para recuperar los que
+    # se quedan en `enviando` si el proceso muere a mitad.
+    lote = models.CharField(max_length=32, blank=True, default="")
+    reclamado_en = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-creado_en", "-id"]
+        verbose_name_plural = "correos de salida"
+        indexes = [
+            models.Index(
+                fields=["estado", "proximo_intento"], name="correo_estado_intento_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"Correo {self.id or '-'} ({self.get_estado_display()}) - {self.asunto}"
+
+
+class RevisionMasiva(models.Model):
+    """Cambio de estado en bloque hecho desde gerencia: una fila por lote."""
+
+    TIPO_COMISION = "comision"
+    TIPO_INCIDENCIA = "incidencia"
+    TIPOS = [
+        (TIPO_COMISION, "Comisiones"),
+        (TIPO_INCIDENCIA, "Incidencias"),
+    ]
+
+    usuario = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="revisiones_masivas",
+    )
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    accion = models.CharField(max_length=20)
+    estado_nuevo = models.CharField(max_length=20)
+    # `ids` o `filtros` (ver `selecciones`), con los filtros y los ids marcados
+    # o excluidos tal como llegaron.
+    modo = models.CharField(max_length=10)
+    parametros = models.JSONField(default=dict)
+    # Cuando se leyo el listado: las filas modificadas despues no se tocan.
+    leido_en = models.DateTimeField()
+    actualizadas = models.PositiveIntegerField(default=0)
+    conflictos = models.PositiveIntegerField(default=0)
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-creada_en", "-id"]
+        verbose_name_plural = "revisiones masivas"
+
+    def __str__(self):
+        return (
+            f"Revision {self.id or '-'} ({self.get_tipo_display()}) - "
+            f"{self.accion}: {self.actualizadas}"
+        )
+
+
+DNI_NIE_RE = re.compile(r"^(\d{8}|[XYZ]\d{7})[A-Z]$")
+
+
+def normalizar_dni(valor):
+    """DNI/NIE sin espacios, puntos ni guiones y en mayusculas; `None` si vacio."""
+    normalizado = re.sub(r"[\s.\-]", "", valor or "").upper()
+    return normalizado or None
+
+
+def validar_dni(valor):
+    normalizado = normalizar_dni(valor)
+    if normalizado and not DNI_NIE_RE.match(normalizado):
+        raise ValidationError("El DNI/NIE no tiene un formato valido.")
+
+
 class Perfil(models.Model):
     AREA_VENTAS = "ventas"
     AREA_POSTVENTA = "postventa"
@@ -167,13 +735,26 @@ class Perfil(models.Model):
     ]
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    dni = models.CharField(max_length=20, blank=True, default="")
+    dni = models.CharField(
+        max_length=20, blank=True, default="", validators=[validar_dni]
+    )
+    # Clave de login: `dni` normalizado, unica e indexada para buscar con `=`.
+    dni_normalizado = models.CharField(
+        max_length=20, unique=True, null=True, blank=True, editable=False
+    )
     telefono = models.CharField(max_length=20, blank=True, default="")
     area = models.CharField(
         max_length=20, choices=AREA_CHOICES, default=AREA_VENTAS
     )
     concesionario = models.CharField(max_length=120, blank=True, default="")
     sede = models.CharField(max_length=100, blank=True, default="")
+    instalacion = models.ForeignKey(
+        Instalacion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="perfiles",
+    )
     ha_visto_perfil_inicial = models.BooleanField(default=False)
     jefe_ventas = models.ForeignKey(
         User,
@@ -198,39 +779,423 @@ class Perfil(models.Model):
     )
     foto_perfil = models.ImageField(upload_to="perfiles/", blank=True, null=True)
 
+    CAMPOS_CADENA = frozenset({"jefe_ventas", "gerente", "director_comercial"})
+    CAMPOS_SEDE = frozenset({"concesionario", "sede"})
+
+    def _asignar_instalacion(self):
+        """Instalacion segun concesionario y sede, salvo que se haya elegido otra.
+
+        Se respeta la instalacion puesta a mano; si no, se deriva cuando falta
+        o cuando cambian concesionario o sede.
+        """
+        cargada = getattr(self, "_sede_cargada", None)
+        if cargada is not None:
+            concesionario, sede, instalacion_id = cargada
+            if self.instalacion_id != instalacion_id:
+                return
+            if self.instalacion_id and (concesionario, sede) == (
+                self.concesionario,
+                self.sede,
+            ):
+                return
+        elif self.instalacion_id:
+            return
+        instalacion = Instalacion.de_sede(self.concesionario, self.sede)
+        if instalacion is not None:
+            self.instalacion = instalacion
+
     def save(self, *args, **kwargs):
+        # Solo si cambia el DNI: los repetidos que la migracion 0019 dejo sin
+        # clave se pueden seguir guardando mientras no se corrijan.
+        if self._state.adding or getattr(self, "_dni_cargado", None) != self.dni:
+            self.dni_normalizado = normalizar_dni(self.dni)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "dni" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "dni_normalizado"}
+        if update_fields is None or self.CAMPOS_SEDE & set(update_fields):
+            self._asignar_instalacion()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "instalacion"}
+        guarda_cadena = update_fields is None or bool(
+            self.CAMPOS_CADENA & set(update_fields)
+        )
+        if update_fields is not None and guarda_cadena:
+            # gerente y director se deducen del superior: se guardan con el.
+            kwargs["update_fields"] = {*kwargs["update_fields"], *self.CAMPOS_CADENA}
+
+        if guarda_cadena:
+            self._resolver_cadena()
+
+        creado = self._state.adding
+        cadena_anterior = getattr(self, "_cadena_cargada", None)
+        if creado:
+            cadena_anterior = (None, None, None)
+        elif cadena_anterior is None and guarda_cadena:
+            cadena_anterior = (
+                self.__class__.objects.filter(pk=self.pk)
+                .values_list("jefe_ventas_id", "gerente_id", "director_comercial_id")
+                .first()
+            ) or (None, None, None)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if guarda_cadena:
+                self._propagar_cadena(cadena_anterior, creado)
+        if guarda_cadena:
+            self._cadena_cargada = self._cadena()
+        self._dni_cargado = self.dni
+        self._sede_cargada = (self.concesionario, self.sede, self.instalacion_id)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Cadena leida de BD, para saber al guardar si hay que propagarla.
+        cargados = dict(zip(field_names, values))
+        campos = ("jefe_ventas_id", "gerente_id", "director_comercial_id")
+        if all(campo in cargados for campo in campos):
+            instance._cadena_cargada = tuple(cargados[campo] for campo in campos)
+        if "dni" in cargados:
+            instance._dni_cargado = cargados["dni"]
+        campos = ("concesionario", "sede", "instalacion_id")
+        if all(campo in cargados for campo in campos):
+            instance._sede_cargada = tuple(cargados[campo] for campo in campos)
+        return instance
+
+    def _resolver_cadena(self):
         # Jerarquia automatica:
         # vendedor -> jefe_ventas -> gerente -> director_comercial
+        # El perfil del superior ya tiene resuelta su cadena: basta una consulta.
         if self.jefe_ventas_id:
-            jefe_perfil = self.__class__.objects.filter(
-                user_id=self.jefe_ventas_id
-            ).first()
-            self.gerente = jefe_perfil.gerente if jefe_perfil else None
-
-            if self.gerente_id:
-                gerente_perfil = self.__class__.objects.filter(
-                    user_id=self.gerente_id
-                ).first()
-                self.director_comercial = (
-                    gerente_perfil.director_comercial if gerente_perfil else None
-                )
-            else:
-                self.director_comercial = None
+            gerente_id, director_id = (
+                self.__class__.objects.filter(user_id=self.jefe_ventas_id)
+                .values_list("gerente_id", "director_comercial_id")
+                .first()
+            ) or (None, None)
+            self.gerente_id = gerente_id
+            self.director_comercial_id = director_id if gerente_id else None
         elif self.gerente_id:
-            gerente_perfil = self.__class__.objects.filter(
-                user_id=self.gerente_id
-            ).first()
-            self.director_comercial = (
-                gerente_perfil.director_comercial if gerente_perfil else None
+            self.director_comercial_id = (
+                self.__class__.objects.filter(user_id=self.gerente_id)
+                .values_list("director_comercial_id", flat=True)
+                .first()
             )
 
-        super().save(*args, **kwargs)
+    def _cadena(self):
+        return (self.jefe_ventas_id, self.gerente_id, self.director_comercial_id)
+
+    @staticmethod
+    def _superior_directo(jefe_ventas_id, gerente_id, director_comercial_id):
+        return jefe_ventas_id or gerente_id or director_comercial_id
+
+    def _propagar_cadena(self, cadena_anterior, creado):
+        """Actualiza subordinados y `JerarquiaPerfil` si ha cambiado la cadena."""
+        _, gerente_anterior, director_anterior = cadena_anterior
+        if (gerente_anterior, director_anterior) != (
+            self.gerente_id,
+            self.director_comercial_id,
+        ):
+            # Vendedores de este jefe: heredan su gerente y director.
+            vendedores = list(
+                Perfil.objects.filter(jefe_ventas_id=self.user_id)
+                .exclude(pk=self.pk)
+                .values_list("user_id", flat=True)
+            )
+            Perfil.objects.filter(user_id__in=vendedores).update(
+                gerente_id=self.gerente_id,
+                director_comercial_id=(
+                    self.director_comercial_id if self.gerente_id else None
+                ),
+            )
+        if director_anterior != self.director_comercial_id:
+            # Jefes y vendedores de este gerente: heredan su director.
+            equipo = list(
+                Perfil.objects.filter(gerente_id=self.user_id)
+                .exclude(pk=self.pk)
+                .values_list("user_id", flat=True)
+            )
+            Perfil.objects.filter(user_id__in=equipo).update(
+                director_comercial_id=self.director_comercial_id
+            )
+
+        superior_anterior = self._superior_directo(*cadena_anterior)
+        superior = self._superior_directo(*self._cadena())
+        if creado:
+            JerarquiaPerfil.objects.get_or_create(
+                superior_id=self.user_id, subordinado_id=self.user_id, profundidad=0
+            )
+        if creado or superior != superior_anterior:
+            JerarquiaPerfil.mover(self.user_id, superior)
+
+    def clean(self):
+        super().clean()
+        dni_normalizado = normalizar_dni(self.dni)
+        if (
+            dni_normalizado
+            and self.__class__.objects.filter(dni_normalizado=dni_normalizado)
+            .exclude(pk=self.pk)
+            .exists()
+        ):
+            raise ValidationError({"dni": "Ya existe un perfil con este DNI/NIE."})
+        superior = self._superior_directo(*self._cadena())
+        if superior and (
+            superior == self.user_id
+            or JerarquiaPerfil.objects.filter(
+                superior_id=self.user_id, subordinado_id=superior
+            ).exists()
+        ):
+            raise ValidationError(
+                "Un usuario no puede depender de si mismo ni de alguien de su equipo."
+            )
 
     def __str__(self):
         return f"Perfil de {self.user.username}"
 
 
+class JerarquiaPerfil(models.Model):
+    """Tabla de cierre de la jerarquia vendedor -> jefe -> gerente -> director.
+
+    Una fila por cada par (superior, subordinado) de la cadena, incluida la del
+    propio usuario con profundidad 0. "Todo el equipo de X" es una sola
+    consulta por el indice unico `(superior, subordinado)`. La mantiene
+    `Perfil.save`; `JerarquiaPerfil.reconstruir()` la regenera entera.
+    """
+
+    superior = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="subordinados_jerarquia",
+        db_index=False,
+    )
+    subordinado = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="superiores_jerarquia"
+    )
+    profundidad = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["superior", "subordinado"], name="uniq_jerarquia_superior_sub"
+            )
+        ]
+
+    @classmethod
+    def usuarios_bajo(cls, usuario, incluir_propio=False):
+        """Usuarios por debajo de `usuario` a cualquier nivel, en una consulta."""
+        filtro = Q(superiores_jerarquia__superior=usuario)
+        if not incluir_propio:
+            filtro &= Q(superiores_jerarquia__profundidad__gt=0)
+        return User.objects.filter(filtro)
+
+    @classmethod
+    def mover(cls, usuario_id, superior_id):
+        """Cuelga el subarbol de `usuario_id` de `superior_id` (o de nadie)."""
+        subarbol = list(
+            cls.objects.filter(superior_id=usuario_id).values_list(
+                "subordinado_id", "profundidad"
+            )
+        )
+        ids_subarbol = [subordinado_id for subordinado_id, _ in subarbol]
+        cls.objects.filter(subordinado_id__in=ids_subarbol).exclude(
+            superior_id__in=ids_subarbol
+        ).delete()
+        if not superior_id:
+            return
+        ancestros = cls.objects.filter(subordinado_id=superior_id).values_list(
+            "superior_id", "profundidad"
+        )
+        cls.objects.bulk_create(
+            [
+                cls(
+                    superior_id=ancestro_id,
+                    subordinado_id=subordinado_id,
+                    profundidad=profundidad_ancestro + profundidad + 1,
+                )
+                for ancestro_id, profundidad_ancestro in ancestros
+                for subordinado_id, profundidad in subarbol
+            ],
+            batch_size=500,
+        )
+
+    @classmethod
+    def reconstruir(cls):
+        """Regenera la tabla desde `Perfil`. Devuelve el numero de filas."""
+        superiores = {
+            user_id: Perfil._superior_directo(*cadena)
+            for user_id, *cadena in Perfil.objects.values_list(
+                "user_id", "jefe_ventas_id", "gerente_id", "director_comercial_id"
+            )
+        }
+        filas = []
+        for user_id in superiores:
+            actual, profundidad, vistos = user_id, 0, set()
+            # `vistos` corta ciclos introducidos sin pasar por `Perfil.clean`.
+            while actual and actual not in vistos:
+                vistos.add(actual)
+                filas.append(
+                    cls(superior_id=actual, subordinado_id=user_id, profundidad=profundidad)
+                )
+                actual, profundidad = superiores.get(actual), profundidad + 1
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(filas, batch_size=500)
+        return len(filas)
+
+
 @receiver(post_save, sender=User)
 def crear_perfil_automatico(sender, instance, created, **kwargs):
     if created:
         Perfil.objects.get_or_create(user=instance)
+
+
+@receiver(pre_delete, sender=User)
+def guardar_subordinados_directos(sender, instance, **kwargs):
+    instance._subordinados_directos = list(
+        JerarquiaPerfil.objects.filter(superior=instance, profundidad=1).values_list(
+            "subordinado_id", flat=True
+        )
+    )
+
+
+@receiver(post_delete, sender=User)
+def recolgar_subordinados_directos(sender, instance, **kwargs):
+    # SET_NULL ya ha vaciado sus FKs sin pasar por `Perfil.save`.
+    subordinados = getattr(instance, "_subordinados_directos", [])
+    for user_id, *cadena in Perfil.objects.filter(user_id__in=subordinados).values_list(
+        "user_id", "jefe_ventas_id", "gerente_id", "director_comercial_id"
+    ):
+        JerarquiaPerfil.mover(user_id, Perfil._superior_directo(*cadena))
+
+
+def _mes_de_venta(usuario_id, fecha_venta):
+    if not usuario_id or not fecha_venta:
+        return None
+    return usuario_id, fecha_venta.year, fecha_venta.month
+
+
+def _mes_de_venta_id(venta_id):
+    venta = (
+        Venta.objects.filter(pk=venta_id)
+        .values_list("usuario_id", "fecha_venta")
+        .first()
+    )
+    return _mes_de_venta(*venta) if venta else None
+
+
+def _recalcular_resumenes(*meses):
+    for mes in set(filter(None, meses)):
+        ResumenMensualVentas.recalcular(*mes)
+
+
+def _instalacion_de_usuario(usuario_id):
+    if not usuario_id:
+        return None
+    return (
+        Perfil.objects.filter(user_id=usuario_id)
+        .values_list("instalacion_id", flat=True)
+        .first()
+    )
+
+
+@receiver(m2m_changed, sender=Incidencia.ventas.through)
+def actualizar_matriculas_por_ventas(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # `incidencia.ventas.add/remove/set/clear(...)`
+        if action in {"post_add", "post_remove", "post_clear"}:
+            instance.matriculas = instance._calcular_matriculas()
+            Incidencia.objects.filter(pk=instance.pk).update(
+                matriculas=instance.matriculas
+            )
+    elif action == "pre_clear":
+        # `venta.incidencias.clear()`: las afectadas son las actuales.
+        instance._incidencias_afectadas = list(
+            instance.incidencias.values_list("id", flat=True)
+        )
+    elif action in {"post_add", "post_remove"}:
+        Incidencia.actualizar_matriculas(pk_set)
+    elif action == "post_clear":
+        Incidencia.actualizar_matriculas(instance._incidencias_afectadas)
+
+
+@receiver(post_save, sender=Venta)
+def actualizar_matriculas_por_venta(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "matricula" not in update_fields):
+        return
+    incidencia_ids = list(instance.incidencias.values_list("id", flat=True))
+    if incidencia_ids:
+        Incidencia.actualizar_matriculas(incidencia_ids)
+
+
+@receiver(pre_delete, sender=Venta)
+def guardar_incidencias_de_venta(sender, instance, **kwargs):
+    # El borrado en cascada de la tabla intermedia no envia `m2m_changed`.
+    instance._incidencias_afectadas = list(
+        instance.incidencias.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Venta)
+def actualizar_matriculas_por_venta_borrada(sender, instance, **kwargs):
+    incidencia_ids = getattr(instance, "_incidencias_afectadas", None)
+    if incidencia_ids:
+        Incidencia.actualizar_matriculas(incidencia_ids)
+
+
+@receiver(pre_save, sender=Venta)
+@receiver(pre_save, sender=Incidencia)
+def asignar_instalacion(sender, instance, **kwargs):
+    # Ventas e incidencias nuevas quedan en la instalacion de su usuario. No se
+    # mueven si despues cambia el perfil: el historico sigue en su instalacion.
+    if instance._state.adding and instance.instalacion_id is None:
+        usuario_id = (
+            instance.usuario_id if sender is Venta else instance.reportado_por_id
+        )
+        instance.instalacion_id = _instalacion_de_usuario(usuario_id)
+
+
+@receiver(pre_save, sender=Venta)
+def guardar_mes_anterior_venta(sender, instance, **kwargs):
+    instance._resumen_mes_anterior = (
+        _mes_de_venta_id(instance.pk) if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Venta)
+def actualizar_resumen_por_venta(sender, instance, **kwargs):
+    _recalcular_resumenes(
+        getattr(instance, "_resumen_mes_anterior", None),
+        _mes_de_venta(instance.usuario_id, instance.fecha_venta),
+    )
+
+
+@receiver(post_delete, sender=Venta)
+def actualizar_resumen_por_venta_borrada(sender, instance, **kwargs):
+    _recalcular_resumenes(_mes_de_venta(instance.usuario_id, instance.fecha_venta))
+
+
+@receiver(pre_save, sender=Comision)
+def guardar_venta_anterior_comision(sender, instance, **kwargs):
+    venta_anterior_id = None
+    if instance.pk:
+        venta_anterior_id = (
+            Comision.objects.filter(pk=instance.pk)
+            .values_list("venta_id", flat=True)
+            .first()
+        )
+    instance._resumen_venta_anterior_id = venta_anterior_id
+
+
+@receiver(post_save, sender=Comision)
+def actualizar_resumen_por_comision(sender, instance, **kwargs):
+    venta_anterior_id = getattr(instance, "_resumen_venta_anterior_id", None)
+    _recalcular_resumenes(
+        _mes_de_venta_id(venta_anterior_id)
+        if venta_anterior_id not in (None, instance.venta_id)
+        else None,
+        _mes_de_venta_id(instance.venta_id),
+    )
+
+
+@receiver(post_delete, sender=Comision)
+def actualizar_resumen_por_comision_borrada(sender, instance, **kwargs):
+    # En un borrado en cascada la venta sigue existiendo en este punto.
+    _recalcular_resumenes(_mes_de_venta_id(instance.venta_id))
@@ -0,0 +1,146 @@
+"""Paginacion por cursor (keyset) para los listados.
+
+En lugar de `OFFSET`, cada pagina se pide a partir del ultimo registro
+mostrado: el cursor guarda el valor del campo de orden y el `id` de esa fila,
+y la siguiente consulta filtra por "lo que va despues" en el mismo orden
+`(campo, id)` que usa el listado. Asi el coste de cada pagina no depende de lo
+lejos que este en el resultado. Con el mismo filtro se obtienen los vecinos y
+la posicion de una fila (navegacion anterior/siguiente de los detalles).
+
+El cursor tambien firma el campo y el sentido del orden: si cambian (p. ej.
+`sort` en la URL conservando el `cursor`), se vuelve a la primera pagina.
+
+Los nulos se ordenan siempre al principio en orden ascendente y al final en
+descendente (el comportamiento por defecto de SQLite) para que el filtro del
+cursor sea coherente en cualquier base de datos.
+"""
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Q
+
+CURSOR_SALT = "comisiones.paginacion.cursor"
+
+
+def orden_keyset(campo, sort_dir):
+    """Expresiones de `order_by` para `campo` con `id` como desempate."""
+    if sort_dir == "asc":
+        orden = [F(campo).asc(nulls_first=True)]
+    else:
+        orden = [F(campo).desc(nulls_last=True)]
+    if campo != "id":
+        orden.append("id" if sort_dir == "asc" else "-id")
+    return orden
+
+
+def _filtro_despues_de(campo, sort_dir, valor, pk):
+    if campo == "id":
+        return Q(id__gt=pk) if sort_dir == "asc" else Q(id__lt=pk)
+
+    if sort_dir == "asc":
+        if valor is None:
+            return Q(**{f"{campo}__isnull": True, "id__gt": pk}) | Q(
+                **{f"{campo}__isnull": False}
+            )
+        return Q(**{f"{campo}__gt": valor}) | Q(**{campo: valor, "id__gt": pk})
+
+    if valor is None:
+        return Q(**{f"{campo}__isnull": True, "id__lt": pk})
+    return (
+        Q(**{f"{campo}__lt": valor})
+        | Q(**{campo: valor, "id__lt": pk})
+        | Q(**{f"{campo}__isnull": True})
+    )
+
+
+def codificar_cursor(campo, sort_dir, valor, pk):
+    return signing.dumps(
+        {
+            "c": campo,
+            "d": sort_dir,
+            "v": None if valor is None else str(valor),
+            "id": pk,
+        },
+        salt=CURSOR_SALT,
+        compress=True,
+    )
+
+
+def decodificar_cursor(cursor, modelo, campo, sort_dir):
+    """Devuelve `(valor, pk)` o `None` si el cursor falta o no es valido.
+
+    No es valido si la firma no cuadra, si le faltan datos, si se firmo para
+    otro campo u otro sentido de orden o si su valor no encaja en el tipo de
+    `campo`.
+    """
+    if not cursor:
+        return None
+    try:
+        datos = signing.loads(cursor, salt=CURSOR_SALT)
+        if (datos["c"], datos["d"]) != (campo, sort_dir):
+            return None
+        pk = int(datos["id"])
+        valor = datos["v"]
+        if valor is not None:
+            valor = modelo._meta.get_field(campo).to_python(valor)
+    except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+        return None
+    return valor, pk
+
+
+def paginar_keyset(queryset, campo, sort_dir, cursor, tamano_pagina):
+    """Devuelve `(filas, siguiente_cursor)` de la pagina que sigue a `cursor`.
+
+    `queryset` debe venir ordenado con `orden_keyset(campo, sort_dir)`.
+    `siguiente_cursor` es una cadena vacia cuando no quedan mas filas.
+    """
+    posicion = decodificar_cursor(cursor, queryset.model, campo, sort_dir)
+    if posicion is not None:
+        queryset = queryset.filter(_filtro_despues_de(campo, sort_dir, *posicion))
+
+    filas = list(queryset[: tamano_pagina + 1])
+    if len(filas) <= tamano_pagina:
+        return filas, ""
+
+    filas = filas[:tamano_pagina]
+    ultima = filas[-1]
+    return filas, codificar_cursor(campo, sort_dir, getattr(ultima, campo), ultima.pk)
+
+
+def _direccion_inversa(sort_dir):
+    return "asc" if sort_dir == "desc" else "desc"
+
+
+def posicion_keyset(queryset, campo, sort_dir, fila):
+    """Devuelve `(posicion, total)` de `fila` en `queryset` en una sola consulta.
+
+    `posicion` empieza en 1 y es `None` si `fila` no esta en `queryset`.
+    """
+    antes = _filtro_despues_de(
+        campo, _direccion_inversa(sort_dir), getattr(fila, campo), fila.pk
+    )
+    datos = queryset.order_by().aggregate(
+        total=Count("id"),
+        anteriores=Count("id", filter=antes),
+        incluida=Count("id", filter=Q(pk=fila.pk)),
+    )
+    posicion = datos["anteriores"] + 1 if datos["incluida"] else None
+    return posicion, datos["total"]
+
+
+def vecinos_keyset(queryset, campo, sort_dir, fila):
+    """Devuelve los ids `(anterior, siguiente)` de `fila` en el orden `(campo, id)`.
+
+    Cada vecino es la primera fila "despues de" `fila` en un sentido, asi que
+    son dos consultas de una fila sin recorrer el listado.
+    """
+    valor = getattr(fila, campo)
+    vecinos = []
+    for direccion in (_direccion_inversa(sort_dir), sort_dir):
+        vecinos.append(
+            queryset.filter(_filtro_despues_de(campo, direccion, valor, fila.pk))
+            .order_by(*orden_keyset(campo, direccion))
+            .values_list("id", flat=True)
+            .first()
+        )
+    return tuple(vecinos)
@@ -0,0 +1,99 @@
+"""Cambios de estado en bloque desde las pantallas de gerencia.
+
+Una revision aplica una accion (aprobar, rechazar, reabrir...) a las filas
+marcadas, o a todas las que cumplen los filtros, con un unico
+`UPDATE ... WHERE`, y guarda una `RevisionMasiva` como registro del lote.
+
+Concurrencia optimista: la pantalla envia `leido_en`, el momento en que leyo
+el listado. Solo se actualizan las filas que siguen en un estado de origen de
+la accion y que nadie ha modificado despues (`modificada_en`); las que siguen
+en origen pero han cambiado se cuentan como conflictos.
+
+El `UPDATE` no lanza las senales de `Comision`, asi que los meses afectados de
+`ResumenMensualVentas` se recalculan despues en un numero fijo de consultas.
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import ExtractMonth, ExtractYear
+from django.utils import timezone
+
+from .models import Comision, ResumenMensualVentas, RevisionMasiva
+from .selecciones import MODO_IDS
+
+# accion -> (estados de origen, valores que se escriben)
+ACCIONES_COMISION = {
+    "aprobar": (("pendiente",), {"estado": "aprobada"}),
+    "rechazar": (("pendiente",), {"estado": "rechazada"}),
+    "reabrir": (("aprobada", "rechazada"), {"estado": "pendiente"}),
+}
+ACCIONES_INCIDENCIA = {
+    "aceptar": (("pte_revision",), {"estado": "aceptada", "validacion_ok": True}),
+    "rechazar": (("pte_revision",), {"estado": "rechazada", "validacion_ok": False}),
+    "reabrir": (
+        ("aceptada", "rechazada"),
+        {"estado": "pte_revision", "validacion_ok": False},
+    ),
+}
+ACCIONES = {
+    RevisionMasiva.TIPO_COMISION: ACCIONES_COMISION,
+    RevisionMasiva.TIPO_INCIDENCIA: ACCIONES_INCIDENCIA,
+}
+
+
+def _meses_revision(revision):
+    """`(usuario_id, anio, mes)` de las ventas cuyas comisiones ha cambiado."""
+    return (
+        Comision.objects.filter(revision_masiva=revision)
+        .annotate(
+            usuario_id=F("venta__usuario_id"),
+            anio=ExtractYear("venta__fecha_venta"),
+            mes=ExtractMonth("venta__fecha_venta"),
+        )
+        .values_list("usuario_id", "anio", "mes")
+        .order_by()
+        .distinct()
+    )
+
+
+def aplicar_revision(
+    tipo, accion, filas_qs, leido_en, usuario=None, modo=MODO_IDS, parametros=None
+):
+    """Aplica `accion` a `filas_qs` y devuelve la `RevisionMasiva` del lote.
+
+    `filas_qs` son las comisiones o incidencias seleccionadas, en cualquier
+    estado: las que no estan en un estado de origen de la accion se ignoran.
+    """
+    if accion not in ACCIONES.get(tipo, {}):
+        raise ValueError(f"Accion no valida para {tipo}: {accion}")
+    origen, valores = ACCIONES[tipo][accion]
+
+    ahora = timezone.now()
+    # Un `leido_en` futuro no puede saltarse los cambios de otros.
+    leido_en = min(leido_en, ahora)
+    candidatas = filas_qs.filter(estado__in=origen)
+    with transaction.atomic():
+        revision = RevisionMasiva.objects.create(
+            usuario=usuario,
+            tipo=tipo,
+            accion=accion,
+            estado_nuevo=valores["estado"],
+            modo=modo,
+            parametros=parametros or {},
+            leido_en=leido_en,
+        )
+        revision.actualizadas = candidatas.filter(modificada_en__lte=leido_en).update(
+            **valores, modificada_en=ahora, revision_masiva=revision
+        )
+        # Las actualizadas ya no estan en origen: las que quedan cambiaron
+        # despues de leer el listado.
+        revision.conflictos = candidatas.count()
+        revision.save(update_fields=["actualizadas", "conflictos"])
+        if tipo == RevisionMasiva.TIPO_COMISION and revision.actualizadas:
+            ResumenMensualVentas.recalcular_totales_comision(_meses_revision(revision))
+    return revision
+
+
+def comisiones_de_ventas(ventas_qs):
+    """Comisiones de las ventas de un listado, para revisarlas en bloque."""
+    return Comision.objects.filter(venta_id__in=ventas_qs.values("id"))
@@ -0,0 +1,48 @@
+"""Selecciones de filas guardadas en sesion para las exportaciones.
+
+En lugar de enviar todos los ids seleccionados en la URL de exportacion, el
+navegador registra la seleccion una vez y recibe un token corto. Una
+seleccion puede ser:
+
+- `ids`: lista explicita de filas marcadas.
+- `filtros`: "todas las filas que cumplen estos filtros" menos una lista de
+  exclusiones, de modo que seleccionar todo no depende de cuantas filas haya
+  cargadas en pantalla.
+"""
+
+import secrets
+
+MODO_IDS = "ids"
+MODO_FILTROS = "filtros"
+MODOS = {MODO_IDS, MODO_FILTROS}
+
+SESION_CLAVE = "selecciones_ventas"
+# Solo se conservan las ultimas selecciones de cada sesion.
+MAX_SELECCIONES_POR_SESION = 5
+
+
+def guardar_seleccion(session, modo, parametros, ids=(), excluidos=()):
+    """Guarda la seleccion en la sesion y devuelve su token."""
+    if modo not in MODOS:
+        raise ValueError(f"Modo de seleccion no valido: {modo}")
+
+    token = secrets.token_urlsafe(12)
+    selecciones = dict(session.get(SESION_CLAVE, {}))
+    selecciones[token] = {
+        "modo": modo,
+        "parametros": dict(parametros),
+        "ids": list(ids) if modo == MODO_IDS else [],
+        "excluidos": list(excluidos) if modo == MODO_FILTROS else [],
+    }
+    # Los dict conservan el orden de insercion: se descartan las mas antiguas.
+    while len(selecciones) > MAX_SELECCIONES_POR_SESION:
+        selecciones.pop(next(iter(selecciones)))
+    session[SESION_CLAVE] = selecciones
+    return token
+
+
+def obtener_seleccion(session, token):
+    """Devuelve la seleccion del token o `None` si no existe en esta sesion."""
+    if not token:
+        return None
+    return session.get(SESION_CLAVE, {}).get(token)
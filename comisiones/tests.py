@@ -1,3 +1,2567 @@
-from django.test import TestCase
+import csv
+import os
+import re
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from smtplib import SMTPException
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.contrib.auth import authenticate
+from django.core.cache import cache, caches
+from django.core import mail, signing
+from django.core.exceptions import ValidationError
+from django.core.mail.backends import locmem
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from . import views
+from .busqueda import TABLA_USUARIOS, fts_disponible, ids_usuarios, ids_ventas
+from .contexto_usuario import contexto_usuario
+from .correos import (
+    encolar_correo,
+    encolar_resumenes_incidencias,
+    procesar_correos_pendientes,
+)
+from .equipo import resumen_equipo
+from .exportaciones import procesar_exportacion, purgar_exportaciones_caducadas
+from .facetas import calcular_facetas
+from .hashers import PBKDF2AjustableHasher, ScryptAjustableHasher
+from .limite_login import ip_de_request
+from .middleware import SessionIdleTimeoutMiddleware
+from .models import (
+    Boletin,
+    Comision,
+    CorreoSalida,
+    ExportacionVentas,
+    Incidencia,
+    Instalacion,
+    JerarquiaPerfil,
+    Perfil,
+    ResumenMensualVentas,
+    RevisionMasiva,
+    Venta,
+)
+from .paginacion import (
+    codificar_cursor,
+    decodificar_cursor,
+    orden_keyset,
+    paginar_keyset,
+)
+from .selecciones import (
+    MAX_SELECCIONES_POR_SESION,
+    MODO_FILTROS,
+    MODO_IDS,
+    guardar_seleccion,
+    obtener_seleccion,
+)
+
+
+PERIODO_COMPLETO = {"desde": "2000-01", "hasta": "2099-12"}
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN es especifico de SQLite")
+class IndicesListadosTests(TestCase):
+    """Los listados por usuario y periodo deben resolverse con los indices compuestos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("vendedor_indices", password="x")
+        otro = User.objects.create_user("otro_indices", password="x")
+        for idx, propietario in enumerate([cls.usuario, otro] * 5):
+            venta = Venta.objects.create(
+                usuario=propietario,
+                matricula=f"{1000 + idx}ABC",
+                idv=idx,
+                tipo_venta="RENTING",
+                dni="12345678Z",
+                tipo_cliente="NIF",
+                nombre_cliente="Cliente",
+            )
+            Comision.objects.create(venta=venta, monto=Decimal("100"), estado="aprobada")
+            Incidencia.objects.create(
+                reportado_por=propietario, tipo="Otro", detalle="Detalle"
+            )
+        Boletin.objects.create(boletin="Activo", fecha=date.today())
+        Boletin.objects.create(boletin="Inactivo", fecha=date.today(), activo=False)
+
+    def _request(self, **params):
+        request = RequestFactory().get("/", params)
+        request.user = self.usuario
+        return request
+
+    def assertUsaIndice(self, queryset, indice):
+        plan = queryset.explain()
+        self.assertIn(indice, plan)
+        self.assertNotRegex(plan, r"(?m)SCAN comisiones_\w+$")
+
+    def test_listado_ventas_usa_indice_usuario_fecha(self):
+        listado = views._listado_ventas(
+            self.usuario, {"desde": "2020-01", "hasta": "2030-12"}
+        )
+        self.assertUsaIndice(listado["ventas_qs"], "venta_usuario_fecha_idx")
+
+    def test_suma_comisiones_aprobadas_usa_indice_cubriente(self):
+        ventas_qs = views._listado_ventas(self.usuario, {})["ventas_qs"]
+        comisiones = Comision.objects.filter(
+            venta__in=ventas_qs, estado="aprobada"
+        ).values_list("monto")
+        plan = comisiones.explain()
+        self.assertIn("COVERING INDEX comision_venta_estado_idx", plan)
+
+    def test_listado_incidencias_usa_indice_usuario_fecha(self):
+        listado = views._listado_incidencias_desde_request(
+            self._request(desde="2020-01", hasta="2030-12")
+        )
+        self.assertUsaIndice(
+            listado["incidencias_periodo_qs"], "incidencia_usuario_fecha_idx"
+        )
+
+    def test_listado_comunicaciones_usa_indice_activo_fecha(self):
+        listado = views._listado_comunicaciones_desde_request(
+            self._request(desde="2020-01", hasta="2030-12")
+        )
+        self.assertUsaIndice(listado["comunicaciones_qs"], "boletin_activo_fecha_idx")
+
+
+# `leido_en` lejano: la cota de consultas se mide con todas las filas candidatas.
+REVISION_TODAS = {"modo": "filtros", "leido_en": "2099-12-31T00:00:00+00:00"}
+
+# Usuario demo del comando `seed` para cada rol.
+USUARIOS_POR_ROL = {
+    "Vendedor": "vendedor_1_demo",
+    "Jefe de ventas": "jefe_demo",
+    "Gerente": "gerente_demo",
+    "Director Comercial": "director_demo",
+}
+
+
+class ConsultasPorVistaTests(TestCase):
+    """Cota de consultas SQL y de filas devueltas por cada URL y rol.
+
+    Con datos demo de varias paginas, un N+1 en una vista o plantilla hace que
+    el numero de consultas crezca con las filas y supere la cota.
+    """
+
+    # (nombre, metodo, url, parametros, max_consultas, max_filas)
+    # Las URL con `{incidencia}`, `{boletin}` o `{exportacion}` se completan
+    # con objetos del usuario de cada caso.
+    CASOS = [
+        ("root_login", "get", "/", {}, 2, None),
+        ("login", "get", "/accounts/login/", {}, 2, None),
+        ("admin", "get", "/admin/", {}, 4, None),
+        ("redirigir_por_rol", "get", "/redirigir/", {}, 4, None),
+        ("logout", "post", "/accounts/logout/", {}, 4, None),
+        ("comisiones_gerencia", "get", "/comisiones/", PERIODO_COMPLETO, 7, 25),
+        (
+            "comisiones_gerencia_resultados",
+            "get",
+            "/comisiones/resultados/",
+            PERIODO_COMPLETO,
+            6,
+            25,
+        ),
+        (
+            "revisar_comisiones_gerencia",
+            "post",
+            "/comisiones/revision/?desde=2000-01&hasta=2099-12&instalacion=todas",
+            {**REVISION_TODAS, "accion": "aprobar"},
+            16,
+            None,
+        ),
+        ("mis_ventas", "get", "/comisiones/mis_ventas/", PERIODO_COMPLETO, 9, 25),
+        (
+            "mis_ventas_resultados",
+            "get",
+            "/comisiones/mis_ventas/resultados/",
+            PERIODO_COMPLETO,
+            5,
+            25,
+        ),
+        (
+            "seleccionar_mis_ventas",
+            "post",
+            "/comisiones/mis_ventas/seleccion/?desde=2000-01&hasta=2099-12",
+            {"modo": "filtros"},
+            6,
+            None,
+        ),
+        (
+            "estado_exportacion_mis_ventas",
+            "get",
+            "/comisiones/mis_ventas/exportaciones/{exportacion}/",
+            {},
+            4,
+            None,
+        ),
+        ("mis_incidencias", "get", "/comisiones/mis_incidencias/", PERIODO_COMPLETO, 8, 25),
+        (
+            "mis_incidencias_matricula",
+            "get",
+            "/comisiones/mis_incidencias/",
+            {**PERIODO_COMPLETO, "sort": "matricula"},
+            8,
+            25,
+        ),
+        (
+            "mis_incidencias_resultados",
+            "get",
+            "/comisiones/mis_incidencias/resultados/",
+            PERIODO_COMPLETO,
+            6,
+            25,
+        ),
+        (
+            "detalle_incidencia_personal",
+            "get",
+            "/comisiones/mis_incidencias/{incidencia}/",
+            {},
+            8,
+            None,
+        ),
+        ("boletin", "get", "/comisiones/boletin/", PERIODO_COMPLETO, 8, 25),
+        (
+            "mis_comunicaciones",
+            "get",
+            "/comisiones/mis_comunicaciones/",
+            PERIODO_COMPLETO,
+            8,
+            25,
+        ),
+        (
+            "mis_comunicaciones_resultados",
+            "get",
+            "/comisiones/mis_comunicaciones/resultados/",
+            PERIODO_COMPLETO,
+            6,
+            25,
+        ),
+        (
+            "descargar_boletin_mock",
+            "get",
+            "/comisiones/mis_comunicaciones/boletin/{boletin}/descargar/",
+            {},
+            4,
+            None,
+        ),
+        ("normativas", "get", "/comisiones/normativas/", {}, 4, None),
+        ("manuales", "get", "/comisiones/manuales/", {}, 4, None),
+        ("avisos_sin_leer", "get", "/comisiones/avisos_sin_leer/", {}, 4, None),
+        ("vehiculos_en_uso", "get", "/comisiones/vehiculos_en_uso/", {}, 4, None),
+        ("registrar_incidencia", "get", "/comisiones/registrar_incidencia/", {}, 5, None),
+        ("mi_perfil", "get", "/comisiones/mi_perfil/", {}, 11, None),
+        ("incidencias_gerencia", "get", "/comisiones/incidencias/", PERIODO_COMPLETO, 9, None),
+        (
+            "revisar_incidencias_gerencia",
+            "post",
+            "/comisiones/incidencias/revision/?desde=2000-01&hasta=2099-12&instalacion=todas",
+            {**REVISION_TODAS, "accion": "aceptar"},
+            12,
+            None,
+        ),
+        ("mi_equipo", "get", "/comisiones/equipo/", {}, 7, None),
+        ("mi_equipo_resumen", "get", "/comisiones/equipo/resumen/", {}, 7, None),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("seed", n_ventas=120, n_incidencias=120, stdout=StringIO())
+        cls.boletin = Boletin.objects.filter(activo=True).first()
+
+    def setUp(self):
+        # El contexto de usuario en cache sobrevive al rollback entre tests.
+        cache.clear()
+
+    def _url(self, plantilla, usuario):
+        if "{" not in plantilla:
+            return plantilla
+        incidencia = (
+            Incidencia.objects.filter(reportado_por=usuario).first()
+            or Incidencia.objects.first()
+        )
+        exportacion = ExportacionVentas.objects.create(usuario=usuario)
+        return plantilla.format(
+            incidencia=incidencia.pk,
+            boletin=self.boletin.pk,
+            exportacion=exportacion.pk,
+        )
+
+    def _filas(self, response):
+        if response.get("Content-Type", "").startswith("application/json"):
+            return response.json().get("filas", 0)
+        return response.content.decode().count("data-result-row")
+
+    def test_consultas_y_filas_por_url_y_rol(self):
+        for rol, username in USUARIOS_POR_ROL.items():
+            usuario = User.objects.get(username=username)
+            self.assertTrue(usuario.groups.filter(name=rol).exists())
+            for nombre, metodo, url, params, max_consultas, max_filas in self.CASOS:
+                url = self._url(url, usuario)
+                with self.subTest(rol=rol, vista=nombre):
+                    self.client.force_login(usuario)
+                    with CaptureQueriesContext(connection) as consultas:
+                        response = getattr(self.client, metodo)(url, params)
+                    self.assertLess(response.status_code, 500)
+                    self.assertLessEqual(
+                        len(consultas),
+                        max_consultas,
+                        "\n".join(q["sql"] for q in consultas.captured_queries),
+                    )
+                    if max_filas is not None:
+                        self.assertLessEqual(self._filas(response), max_filas)
+
+    def test_todas_las_rutas_tienen_caso(self):
+        from comisiones import urls as comisiones_urls
+        from intranet import urls as intranet_urls
+
+        cubiertas = {caso[0] for caso in self.CASOS}
+        # Descargas y exportaciones se prueban aparte: su coste depende del
+        # fichero, no de la pagina.
+        cubiertas |= {
+            "exportar_mis_ventas",
+            "solicitar_exportacion_mis_ventas",
+            "descargar_exportacion_mis_ventas",
+        }
+        for patron in comisiones_urls.urlpatterns + intranet_urls.urlpatterns:
+            if getattr(patron, "name", None):
+                self.assertIn(patron.name, cubiertas)
+
+    def test_exportacion_no_depende_del_numero_de_filas(self):
+        usuario = User.objects.get(username="vendedor_1_demo")
+        self.client.force_login(usuario)
+        seleccion = self.client.post(
+            reverse("seleccionar_mis_ventas") + "?desde=2000-01&hasta=2099-12",
+            {"modo": "filtros"},
+        ).json()
+        self.assertGreater(seleccion["total"], 0)
+
+        for formato in ("csv", "excel"):
+            with self.subTest(formato=formato):
+                with CaptureQueriesContext(connection) as consultas:
+                    response = self.client.get(
+                        reverse("exportar_mis_ventas"),
+                        {"formato": formato, "seleccion": seleccion["seleccion"]},
+                    )
+                    b"".join(response.streaming_content)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(consultas), 5)
+
+
+
+@override_settings(
+    SESSION_IDLE_TIMEOUT_SECONDS=600, SESSION_IDLE_ACTIVITY_GRANULARITY_SECONDS=60
+)
+class SessionIdleTimeoutMiddlewareTests(TestCase):
+    """La ultima actividad se escribe con granularidad y el cierre la respeta."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("vendedor_sesion", password="x")
+
+    def _procesar(self, hace_segundos, path="/comisiones/normativas/"):
+        request = RequestFactory().get(path)
+        SessionMiddleware(lambda r: HttpResponse()).process_request(request)
+        request.user = self.usuario
+        request.session["last_activity_ts"] = int(time.time()) - hace_segundos
+        request.session.save()
+        request.session.modified = False
+        response = SessionIdleTimeoutMiddleware(lambda r: HttpResponse())(request)
+        return request, response
+
+    def test_no_escribe_sesion_dentro_de_la_granularidad(self):
+        request, response = self._procesar(30)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(request.session.modified)
+
+    def test_actualiza_actividad_pasada_la_granularidad(self):
+        request, response = self._procesar(120)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(request.session.modified)
+        self.assertGreaterEqual(request.session["last_activity_ts"], int(time.time()) - 1)
+
+    @override_settings(SESSION_IDLE_TIMEOUT_SECONDS=100)
+    def test_granularidad_limitada_por_el_timeout(self):
+        # Con 100 s de timeout se escribe a partir de 40 s, no de 60.
+        request, _ = self._procesar(45)
+        self.assertTrue(request.session.modified)
+
+    def test_no_cierra_antes_del_timeout(self):
+        _, response = self._procesar(599)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cierra_sesion_tras_inactividad(self):
+        _, response = self._procesar(601)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, f"{settings.LOGIN_URL}?session_expired=1")
+
+
+class ContextoUsuarioTests(TestCase):
+    """Perfil y grupos se leen de BD una vez por peticion y nunca de otra anterior."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = Group.objects.create(name="Vendedor")
+        cls.gerente = Group.objects.create(name="Gerente")
+        cls.usuario = User.objects.create_user("vendedor_contexto", password="x")
+        cls.usuario.groups.add(cls.vendedor)
+
+    def _contexto(self):
+        # Instancia nueva, como la de cada peticion.
+        return contexto_usuario(User.objects.get(pk=self.usuario.pk))
+
+    def test_perfil_y_grupos_una_vez_por_peticion(self):
+        self.client.force_login(self.usuario)
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as consultas:
+                self.client.get(reverse("mi_perfil"))
+            sql = [q["sql"] for q in consultas.captured_queries]
+            self.assertEqual(
+                sum('FROM "comisiones_perfil"' in consulta for consulta in sql), 1
+            )
+            self.assertEqual(sum('FROM "auth_group"' in consulta for consulta in sql), 1)
+
+    def test_misma_peticion_reutiliza_el_contexto(self):
+        usuario = User.objects.get(pk=self.usuario.pk)
+        with self.assertNumQueries(2):
+            contexto = contexto_usuario(usuario)
+        with self.assertNumQueries(0):
+            self.assertIs(contexto_usuario(usuario), contexto)
+
+    def test_cambio_de_grupos_se_ve_en_la_siguiente_peticion(self):
+        self.assertEqual(self._contexto().rol, "Vendedor")
+        self.usuario.groups.add(self.gerente)
+        self.assertEqual(self._contexto().rol, "Gerente")
+        self.assertTrue(self._contexto().es_gerencia)
+        # Como si lo cambiara otro proceso: sin senales de por medio.
+        User.groups.through.objects.filter(group=self.gerente).delete()
+        self.assertFalse(self._contexto().es_gerencia)
+
+    def test_renombrar_grupo_cambia_el_rol(self):
+        self.assertEqual(self._contexto().rol, "Vendedor")
+        Group.objects.filter(pk=self.vendedor.pk).update(name="Jefe de ventas")
+        self.assertEqual(self._contexto().rol, "Jefe de ventas")
+
+    def test_perfil_guardado_en_mi_perfil_se_ve_en_la_siguiente_peticion(self):
+        self.client.force_login(self.usuario)
+        self.client.get(reverse("mi_perfil"))
+        self.client.post(
+            reverse("mi_perfil"),
+            {"email": "vendedor@example.com", "telefono": "600000000"},
+        )
+        response = self.client.get(reverse("mi_perfil"))
+        formulario = response.context["editable_form"]
+        self.assertEqual(formulario.initial["telefono"], "600000000")
+        Perfil.objects.filter(user=self.usuario).update(telefono="611111111")
+        self.assertEqual(self._contexto().perfil.telefono, "611111111")
+
+
+class LoginPorDNITests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("vendedor_dni", password="clave-segura")
+        perfil = cls.usuario.perfil
+        perfil.dni = "12345678z"
+        perfil.save()
+
+    def setUp(self):
+        # Los contadores de intentos fallidos viven en la cache compartida.
+        caches[settings.LOGIN_INTENTOS_CACHE].clear()
+
+    def test_login_con_dni_normalizado(self):
+        for dni in ("12345678Z", " 12345678z ", "12.345.678-Z"):
+            with self.subTest(dni=dni):
+                self.assertEqual(
+                    authenticate(username=dni, password="clave-segura"), self.usuario
+                )
+        self.assertIsNone(authenticate(username="12345678Z", password="otra"))
+
+    def test_busqueda_por_igualdad_sobre_indice_unico(self):
+        with CaptureQueriesContext(connection) as consultas:
+            authenticate(username="12345678Z", password="clave-segura")
+        sql = next(
+            consulta["sql"]
+            for consulta in consultas.captured_queries
+            if "comisiones_perfil" in consulta["sql"]
+        )
+        self.assertIn('"dni_normalizado" = ', sql)
+        self.assertNotIn("LIKE", sql)
+
+    def test_dni_duplicado_rechazado(self):
+        otro = User.objects.create_user("vendedor_dni_2", password="x")
+        otro.perfil.dni = "12345678-Z"
+        with self.assertRaises(IntegrityError):
+            otro.perfil.save()
+
+    def test_dni_duplicado_es_error_del_formulario_del_admin(self):
+        otro = User.objects.create_user("vendedor_dni_2", password="x")
+        request = RequestFactory().get("/")
+        request.user = User.objects.create_superuser("admin_dni", password="x")
+        Formulario = admin.site._registry[Perfil].get_form(request, otro.perfil)
+        datos = {
+            campo: valor
+            for campo, valor in Formulario(instance=otro.perfil).initial.items()
+            if valor is not None
+        }
+        formulario = Formulario(
+            {**datos, "dni": " 12.345.678-z"}, instance=otro.perfil
+        )
+        self.assertFalse(formulario.is_valid())
+        self.assertIn("dni", formulario.errors)
+
+    def test_duplicados_sin_clave_de_la_migracion(self):
+        # Como los deja la migracion 0019: mismo DNI y `dni_normalizado` nulo.
+        otro = User.objects.create_user("vendedor_dni_2", password="x")
+        Perfil.objects.filter(user=otro).update(dni="12345678Z")
+        perfil = Perfil.objects.get(user=otro)
+        self.assertIsNone(perfil.dni_normalizado)
+
+        perfil.telefono = "600000000"
+        perfil.save()
+        perfil.refresh_from_db()
+        self.assertIsNone(perfil.dni_normalizado)
+
+        with self.assertRaises(ValidationError) as error:
+            perfil.full_clean()
+        self.assertIn("dni", error.exception.message_dict)
+        perfil.dni = "87654321X"
+        perfil.full_clean()
+        perfil.save()
+        perfil.refresh_from_db()
+        self.assertEqual(perfil.dni_normalizado, "87654321X")
+
+    def test_valida_formato_dni_nie(self):
+        perfil = self.usuario.perfil
+        for dni in ("X1234567L", "12345678Z", ""):
+            perfil.dni = dni
+            perfil.full_clean()
+        perfil.dni = "1234"
+        with self.assertRaises(ValidationError):
+            perfil.full_clean()
+
+
+@override_settings(
+    LOGIN_INTENTOS_MAX_POR_DNI=3,
+    LOGIN_INTENTOS_MAX_POR_IP=5,
+    LOGIN_INTENTOS_VENTANA_SEGUNDOS=60,
+    LOGIN_BLOQUEO_SEGUNDOS=60,
+)
+class LimiteLoginTests(TestCase):
+    """Tras varios fallos el DNI o la IP quedan bloqueados sin tocar la BD."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("vendedor_limite", password="clave-segura")
+        perfil = cls.usuario.perfil
+        perfil.dni = "87654321X"
+        perfil.save()
+
+    def setUp(self):
+        caches[settings.LOGIN_INTENTOS_CACHE].clear()
+
+    def _login(self, dni, password, ip="10.0.0.1", **extra):
+        return self.client.post(
+            reverse("login"),
+            {"username": dni, "password": password},
+            REMOTE_ADDR=ip,
+            **extra,
+        )
+
+    def test_bloquea_dni_sin_consultar_bd(self):
+        for _ in range(3):
+            self._login("87654321X", "mala")
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._login("87654321x", "clave-segura", ip="10.0.0.2")
+        self.assertContains(response, "Demasiados intentos fallidos")
+        self.assertNotIn("_auth_user_id", self.client.session)
+        tablas = " ".join(q["sql"] for q in consultas.captured_queries)
+        self.assertNotIn("comisiones_perfil", tablas)
+        self.assertNotIn("auth_user", tablas)
+
+    def test_bloquea_ip_para_cualquier_dni(self):
+        for idx in range(5):
+            self._login(f"1111111{idx}A", "mala")
+        response = self._login("87654321X", "clave-segura")
+        self.assertContains(response, "Demasiados intentos fallidos")
+        response = self._login("87654321X", "clave-segura", ip="10.0.0.2")
+        self.assertEqual(response.status_code, 302)
+
+    def test_backend_rechaza_durante_bloqueo(self):
+        for _ in range(3):
+            authenticate(username="87654321X", password="mala")
+        self.assertIsNone(authenticate(username="87654321X", password="clave-segura"))
+
+    def test_login_correcto_reinicia_contador_del_dni(self):
+        for _ in range(2):
+            self._login("87654321X", "mala")
+        self.assertEqual(self._login("87654321X", "clave-segura").status_code, 302)
+        self.client.logout()
+        for _ in range(2):
+            self._login("87654321X", "mala")
+        self.assertEqual(self._login("87654321X", "clave-segura").status_code, 302)
+
+    @override_settings(LOGIN_PROXIES_DE_CONFIANZA=["10.0.0.0/24"])
+    def test_ip_del_cliente_tras_proxy_de_confianza(self):
+        casos = (
+            # (REMOTE_ADDR, X-Forwarded-For, IP esperada)
+            ("10.0.0.5", "203.0.113.7", "203.0.113.7"),
+            ("10.0.0.5", "198.51.100.1, 203.0.113.7", "203.0.113.7"),
+            ("10.0.0.5", "203.0.113.7, 10.0.0.9", "203.0.113.7"),
+            ("10.0.0.5", "no-es-una-ip", "10.0.0.5"),
+            ("10.0.0.5", None, "10.0.0.5"),
+            ("198.51.100.1", "203.0.113.7", "198.51.100.1"),
+        )
+        for remote_addr, reenviada, esperada in casos:
+            with self.subTest(remote_addr=remote_addr, reenviada=reenviada):
+                meta = {"REMOTE_ADDR": remote_addr}
+                if reenviada is not None:
+                    meta["HTTP_X_FORWARDED_FOR"] = reenviada
+                request = RequestFactory().post("/", **meta)
+                self.assertEqual(ip_de_request(request), esperada)
+
+    @override_settings(LOGIN_PROXIES_DE_CONFIANZA=["10.0.0.1"])
+    def test_bloqueo_por_ip_tras_proxy_es_por_cliente(self):
+        for idx in range(5):
+            self._login(f"1111111{idx}A", "mala", HTTP_X_FORWARDED_FOR="203.0.113.1")
+        response = self._login(
+            "87654321X", "clave-segura", HTTP_X_FORWARDED_FOR="203.0.113.1"
+        )
+        self.assertContains(response, "Demasiados intentos fallidos")
+        response = self._login(
+            "87654321X", "clave-segura", HTTP_X_FORWARDED_FOR="203.0.113.2"
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+@override_settings(
+    PASSWORD_HASHER_COSTES={
+        "scrypt": {"work_factor": 2**10, "block_size": 8, "parallelism": 1},
+        "pbkdf2_sha256": {"iterations": 1000},
+    }
+)
+class HashersAjustablesTests(TestCase):
+    """El coste sale de settings y el login por DNI actualiza los hashes antiguos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("vendedor_hash")
+        cls.usuario.password = PBKDF2AjustableHasher(iterations=500).encode(
+            "clave-segura", "salanterior"
+        )
+        cls.usuario.save(update_fields=["password"])
+        perfil = cls.usuario.perfil
+        perfil.dni = "11223344B"
+        perfil.save()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_coste_desde_settings(self):
+        hasher = ScryptAjustableHasher()
+        self.assertEqual(hasher.work_factor, 2**10)
+        self.assertTrue(hasher.encode("x", hasher.salt()).startswith("scrypt$1024$"))
+        self.assertEqual(ScryptAjustableHasher(work_factor=2**11).work_factor, 2**11)
+
+    def _login_correcto(self):
+        self.assertEqual(
+            authenticate(username="11223344B", password="clave-segura"), self.usuario
+        )
+        self.usuario.refresh_from_db()
+
+    def test_login_recalcula_hash_con_el_coste_configurado(self):
+        self._login_correcto()
+        self.assertTrue(self.usuario.password.startswith("pbkdf2_sha256$1000$"))
+        self._login_correcto()
+
+    def test_login_recalcula_hash_con_el_hasher_preferido(self):
+        hashers = list(settings.PASSWORD_HASHERS)
+        hashers.remove("comisiones.hashers.ScryptAjustableHasher")
+        with override_settings(
+            PASSWORD_HASHERS=["comisiones.hashers.ScryptAjustableHasher", *hashers]
+        ):
+            self._login_correcto()
+            self.assertTrue(self.usuario.password.startswith("scrypt$1024$"))
+            self._login_correcto()
+
+    def test_login_fallido_no_recalcula_hash(self):
+        anterior = self.usuario.password
+        self.assertIsNone(authenticate(username="11223344B", password="otra"))
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.password, anterior)
+
+    def test_medir_hashers_propone_costes(self):
+        salida = StringIO()
+        call_command(
+            "medir_hashers",
+            "--algoritmo",
+            "scrypt",
+            "--objetivo-ms",
+            "1000",
+            "--repeticiones",
+            "1",
+            stdout=salida,
+        )
+        self.assertIn("scrypt: work_factor=1024", salida.getvalue())
+        self.assertIn("PASSWORD_HASHER_COSTES = {", salida.getvalue())
+
+
+class JerarquiaPerfilTests(TestCase):
+    """La tabla de cierre y la cadena de los subordinados siguen a `Perfil.save`."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuarios = {
+            nombre: User.objects.create_user(f"jerarquia_{nombre}")
+            for nombre in ("director", "director2", "gerente", "gerente2", "jefe", "vendedor")
+        }
+        cls._asignar("gerente", director_comercial="director")
+        cls._asignar("gerente2", director_comercial="director2")
+        cls._asignar("jefe", gerente="gerente")
+        cls._asignar("vendedor", jefe_ventas="jefe")
+
+    @classmethod
+    def _asignar(cls, nombre, **superiores):
+        perfil = Perfil.objects.get(user=cls.usuarios[nombre])
+        for campo, superior in superiores.items():
+            setattr(perfil, campo, cls.usuarios[superior] if superior else None)
+        perfil.save()
+        return perfil
+
+    def _equipo(self, nombre):
+        return set(
+            JerarquiaPerfil.usuarios_bajo(self.usuarios[nombre]).values_list(
+                "username", flat=True
+            )
+        )
+
+    def test_equipo_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            equipo = self._equipo("director")
+        self.assertEqual(
+            equipo, {"jerarquia_gerente", "jerarquia_jefe", "jerarquia_vendedor"}
+        )
+        self.assertEqual(self._equipo("jefe"), {"jerarquia_vendedor"})
+        self.assertEqual(self._equipo("vendedor"), set())
+
+    def test_cambio_de_gerente_se_propaga_al_equipo(self):
+        self._asignar("jefe", gerente="gerente2")
+        vendedor = Perfil.objects.get(user=self.usuarios["vendedor"])
+        self.assertEqual(vendedor.gerente, self.usuarios["gerente2"])
+        self.assertEqual(vendedor.director_comercial, self.usuarios["director2"])
+        # El gerente original sigue bajo su director; su antiguo equipo no.
+        self.assertEqual(self._equipo("director"), {"jerarquia_gerente"})
+        self.assertEqual(
+            self._equipo("director2"),
+            {"jerarquia_gerente2", "jerarquia_jefe", "jerarquia_vendedor"},
+        )
+        self.assertEqual(
+            JerarquiaPerfil.objects.get(
+                superior=self.usuarios["director2"], subordinado=self.usuarios["vendedor"]
+            ).profundidad,
+            3,
+        )
+
+    def test_cambio_de_director_se_propaga_al_equipo(self):
+        self._asignar("gerente", director_comercial="director2")
+        for nombre in ("jefe", "vendedor"):
+            perfil = Perfil.objects.get(user=self.usuarios[nombre])
+            self.assertEqual(perfil.director_comercial, self.usuarios["director2"])
+        self.assertEqual(
+            self._equipo("director2"),
+            {
+                "jerarquia_gerente",
+                "jerarquia_gerente2",
+                "jerarquia_jefe",
+                "jerarquia_vendedor",
+            },
+        )
+
+    def test_guardar_sin_cambiar_la_cadena_no_toca_el_equipo(self):
+        jefe = Perfil.objects.get(user=self.usuarios["jefe"])
+        jefe.telefono = "600000000"
+        with CaptureQueriesContext(connection) as consultas:
+            jefe.save()
+        sql = " ".join(q["sql"] for q in consultas.captured_queries)
+        self.assertNotIn("comisiones_jerarquiaperfil", sql)
+        self.assertNotIn('UPDATE "comisiones_perfil" SET "gerente_id"', sql)
+
+    def test_no_permite_ciclos(self):
+        gerente = Perfil.objects.get(user=self.usuarios["gerente"])
+        gerente.director_comercial = self.usuarios["vendedor"]
+        with self.assertRaises(ValidationError):
+            gerente.clean()
+
+    def test_borrar_jefe_recuelga_a_sus_vendedores(self):
+        self.usuarios["jefe"].delete()
+        self.assertEqual(self._equipo("gerente"), {"jerarquia_vendedor"})
+        self.assertEqual(
+            JerarquiaPerfil.objects.get(
+                superior=self.usuarios["director"], subordinado=self.usuarios["vendedor"]
+            ).profundidad,
+            2,
+        )
+
+    def test_reconstruir_coincide_con_la_mantenida(self):
+        self._asignar("jefe", gerente="gerente2")
+        mantenida = set(
+            JerarquiaPerfil.objects.values_list("superior", "subordinado", "profundidad")
+        )
+        JerarquiaPerfil.reconstruir()
+        self.assertEqual(
+            set(
+                JerarquiaPerfil.objects.values_list(
+                    "superior", "subordinado", "profundidad"
+                )
+            ),
+            mantenida,
+        )
+
+
+class ResumenEquipoTests(TestCase):
+    """El resumen agrega por subordinado con consultas agrupadas y se cachea."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gerente = User.objects.create_user("equipo_gerente")
+        cls.gerente.groups.add(Group.objects.create(name="Gerente"))
+        cls.jefe = User.objects.create_user("equipo_jefe")
+        cls.jefe.groups.add(Group.objects.create(name="Jefe de ventas"))
+        cls.vendedor = User.objects.create_user("equipo_vendedor")
+        cls.vendedor.groups.add(Group.objects.create(name="Vendedor"))
+        for usuario, jefe_ventas, gerente in (
+            (cls.jefe, None, cls.gerente),
+            (cls.vendedor, cls.jefe, None),
+        ):
+            perfil = Perfil.objects.get(user=usuario)
+            perfil.jefe_ventas = jefe_ventas
+            perfil.gerente = gerente
+            perfil.save()
+
+        cls.hoy = date.today()
+        for idx, tipo in enumerate(("RENTING", "RENTING", "EXENTA")):
+            venta = Venta.objects.create(
+                usuario=cls.vendedor,
+                matricula=f"{2000 + idx}EQP",
+                idv=idx,
+                tipo_venta=tipo,
+                dni="12345678Z",
+                tipo_cliente="NIF",
+                nombre_cliente="Cliente",
+            )
+            Comision.objects.create(venta=venta, monto=Decimal("100"), estado="aprobada")
+        Incidencia.objects.create(reportado_por=cls.vendedor, tipo="Otro", detalle="x")
+        Incidencia.objects.create(
+            reportado_por=cls.jefe, tipo="Otro", detalle="x", estado="aceptada"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def _filas(self, usuario):
+        resumen = resumen_equipo(usuario, self.hoy.year, self.hoy.month)
+        return {fila["nombre"]: fila for fila in resumen["filas"]}, resumen["totales"]
+
+    def test_agrega_por_subordinado(self):
+        filas, totales = self._filas(self.gerente)
+        self.assertEqual(set(filas), {"equipo_jefe", "equipo_vendedor"})
+        vendedor = filas["equipo_vendedor"]
+        self.assertEqual(vendedor["profundidad"], 2)
+        self.assertEqual(vendedor["ventas_total"], 3)
+        self.assertEqual(vendedor["ventas_renting"], 2)
+        self.assertEqual(vendedor["comision_aprobada"], Decimal("300"))
+        self.assertEqual(vendedor["incidencias_pendientes"], 1)
+        self.assertEqual(filas["equipo_jefe"]["ventas_total"], 0)
+        self.assertEqual(totales["incidencias_total"], 2)
+        self.assertEqual(totales["incidencias_pendientes"], 1)
+
+        filas, _ = self._filas(self.jefe)
+        self.assertEqual(set(filas), {"equipo_vendedor"})
+
+    def test_consultas_fijas_y_cache_por_mes(self):
+        with self.assertNumQueries(3):
+            self._filas(self.gerente)
+        with self.assertNumQueries(0):
+            self._filas(self.gerente)
+
+    def test_jefe_de_ventas_entra_a_su_equipo(self):
+        self.client.force_login(self.jefe)
+        response = self.client.get(reverse("redirigir_por_rol"))
+        self.assertRedirects(response, reverse("mi_equipo"))
+        response = self.client.get(reverse("mi_equipo_resumen"))
+        self.assertEqual(response.json()["filas"], 1)
+
+    def test_vendedor_sin_acceso(self):
+        self.client.force_login(self.vendedor)
+        self.assertEqual(self.client.get(reverse("mi_equipo_resumen")).status_code, 403)
+        self.assertRedirects(
+            self.client.get(reverse("mi_equipo")),
+            reverse("redirigir_por_rol"),
+            fetch_redirect_response=False,
+        )
+
+
+class ComisionesGerenciaTests(TestCase):
+    """El listado de gerencia trae los importes de `Comision`, pagina y totaliza."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gerente = User.objects.create_superuser("gerencia_comisiones", password="x")
+        vendedor = User.objects.create_user("vendedor_comisiones", password="x")
+        for idx in range(30):
+            venta = Venta.objects.create(
+                usuario=vendedor,
+                matricula=f"{3000 + idx}GER",
+                idv=idx,
+                tipo_venta="RENTING",
+                dni="12345678Z",
+                tipo_cliente="CIF",
+                nombre_cliente="Flota",
+            )
+            Comision.objects.create(
+                venta=venta,
+                monto=Decimal("10"),
+                facturacion=Decimal("1000.50"),
+                imp_comision=Decimal("25"),
+                estado="aprobada",
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.gerente)
+
+    def test_importes_reales_y_totales_del_periodo(self):
+        response = self.client.get(reverse("comisiones_gerencia"), PERIODO_COMPLETO)
+        self.assertEqual(response.content.decode().count("data-result-row"), 25)
+        self.assertContains(response, "1.000,50")
+        self.assertContains(response, "Aprobada / Venta Renting")
+        totales = response.context["totales_comision"]
+        self.assertEqual(totales["total_ventas"], 30)
+        self.assertEqual(totales["facturacion"], "30.015,00")
+        self.assertEqual(totales["imp_comision"], "750,00")
+        self.assertEqual(totales["margen_bruto"], "-")
+
+    def test_siguiente_pagina_por_cursor(self):
+        response = self.client.get(reverse("comisiones_gerencia"), PERIODO_COMPLETO)
+        cursor = response.context["siguiente_cursor"]
+        self.assertTrue(cursor)
+        datos = self.client.get(
+            reverse("comisiones_gerencia_resultados"),
+            {**PERIODO_COMPLETO, "cursor": cursor},
+        ).json()
+        self.assertEqual(datos["filas"], 5)
+        self.assertEqual(datos["total_resultados"], 30)
+        self.assertEqual(datos["siguiente_cursor"], "")
+
+
+class InstalacionTests(TestCase):
+    """Ventas e incidencias se asignan a la instalacion del usuario y gerencia filtra por ella."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.orihuela = Instalacion.objects.create(codigo="2901", nombre="Nissan Orihuela")
+        cls.elche = Instalacion.objects.create(codigo="2902", nombre="Nissan Elche")
+        cls.gerente = User.objects.create_user("gerente_instalacion", password="x")
+        cls.gerente.groups.add(Group.objects.create(name="Gerente"))
+        cls._asignar(cls.gerente, cls.orihuela)
+        cls.ventas = {}
+        for instalacion in (cls.orihuela, cls.elche):
+            vendedor = User.objects.create_user(f"vendedor_{instalacion.codigo}")
+            cls._asignar(vendedor, instalacion)
+            cls.ventas[instalacion.codigo] = Venta.objects.create(
+                usuario=vendedor,
+                matricula=f"{instalacion.codigo}INS",
+                idv=1,
+                tipo_venta="RENTING",
+                dni="12345678Z",
+                tipo_cliente="NIF",
+                nombre_cliente="Cliente",
+            )
+            Incidencia.objects.create(
+                reportado_por=vendedor, tipo="Otro", detalle="Detalle"
+            )
+
+    @staticmethod
+    def _asignar(usuario, instalacion):
+        perfil = usuario.perfil
+        perfil.instalacion = instalacion
+        perfil.save()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.gerente)
+
+    def test_venta_e_incidencia_heredan_la_instalacion_del_perfil(self):
+        self.assertEqual(self.ventas["2902"].instalacion, self.elche)
+        self.assertEqual(
+            Incidencia.objects.filter(instalacion=self.elche).count(), 1
+        )
+        # Cambiar de instalacion no mueve el historico.
+        self._asignar(self.ventas["2902"].usuario, self.orihuela)
+        self.ventas["2902"].refresh_from_db()
+        self.assertEqual(self.ventas["2902"].instalacion, self.elche)
+
+    def test_gerencia_filtra_por_su_instalacion_por_defecto(self):
+        response = self.client.get(reverse("comisiones_gerencia"), PERIODO_COMPLETO)
+        self.assertEqual(response.context["instalacion"], str(self.orihuela.pk))
+        self.assertEqual(response.context["totales_comision"]["total_ventas"], 1)
+        self.assertContains(response, "2901INS")
+        self.assertNotContains(response, "2902INS")
+
+        response = self.client.get(
+            reverse("incidencias_gerencia"), {**PERIODO_COMPLETO, "instalacion": self.elche.pk}
+        )
+        self.assertEqual(len(response.context["incidencias"]), 1)
+
+    def test_todas_las_instalaciones(self):
+        response = self.client.get(
+            reverse("comisiones_gerencia"), {**PERIODO_COMPLETO, "instalacion": "todas"}
+        )
+        self.assertEqual(response.context["totales_comision"]["total_ventas"], 2)
+        response = self.client.get(
+            reverse("incidencias_gerencia"), {**PERIODO_COMPLETO, "instalacion": "todas"}
+        )
+        self.assertEqual(len(response.context["incidencias"]), 2)
+
+    def test_perfil_toma_la_instalacion_de_concesionario_y_sede(self):
+        perfiles = []
+        for nombre in ("vendedor_alicante_1", "vendedor_alicante_2"):
+            perfil = User.objects.create_user(nombre).perfil
+            perfil.concesionario = "Francisco Marcos"
+            perfil.sede = "Alicante"
+            perfil.save()
+            perfiles.append(perfil)
+        alicante = perfiles[0].instalacion
+        self.assertEqual(alicante.nombre, "Francisco Marcos Alicante")
+        self.assertTrue(alicante.codigo.startswith("P"))
+        self.assertEqual(perfiles[1].instalacion, alicante)
+
+        # Cambiar de sede cambia de instalacion; una elegida a mano se respeta.
+        self.orihuela.concesionario, self.orihuela.sede = "Nissan", "Orihuela"
+        self.orihuela.save()
+        perfil = Perfil.objects.get(pk=perfiles[0].pk)
+        perfil.concesionario, perfil.sede = "Nissan", "Orihuela"
+        perfil.save()
+        self.assertEqual(perfil.instalacion, self.orihuela)
+        perfil = Perfil.objects.get(pk=perfiles[1].pk)
+        perfil.sede = "Elche"
+        perfil.instalacion = self.elche
+        perfil.save()
+        self.assertEqual(Perfil.objects.get(pk=perfil.pk).instalacion, self.elche)
+
+    def test_filas_sin_instalacion_visibles_por_defecto(self):
+        vendedor = User.objects.create_user("vendedor_sin_instalacion")
+        self.assertIsNone(vendedor.perfil.instalacion)
+        venta = Venta.objects.create(
+            usuario=vendedor,
+            matricula="0000SIN",
+            idv=1,
+            tipo_venta="RENTING",
+            dni="12345678Z",
+            tipo_cliente="NIF",
+            nombre_cliente="Cliente",
+        )
+        Incidencia.objects.create(reportado_por=vendedor, tipo="Otro", detalle="Detalle")
+        self.assertIsNone(venta.instalacion)
+
+        response = self.client.get(reverse("comisiones_gerencia"), PERIODO_COMPLETO)
+        self.assertEqual(response.context["totales_comision"]["total_ventas"], 2)
+        self.assertContains(response, "0000SIN")
+        response = self.client.get(reverse("incidencias_gerencia"), PERIODO_COMPLETO)
+        self.assertEqual(len(response.context["incidencias"]), 2)
+
+        # Elegir una instalacion concreta si filtra solo por ella.
+        response = self.client.get(
+            reverse("comisiones_gerencia"),
+            {**PERIODO_COMPLETO, "instalacion": self.orihuela.pk},
+        )
+        self.assertNotContains(response, "0000SIN")
+
+    @skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN es especifico de SQLite")
+    def test_listado_usa_indice_instalacion_fecha(self):
+        listado = views._listado_comisiones_gerencia(
+            {**PERIODO_COMPLETO, "instalacion": str(self.elche.pk)}, self.gerente
+        )
+        self.assertIn("venta_instalacion_fecha_idx", listado["ventas_qs"].explain())
+
+
+@skipUnless(connection.vendor == "sqlite", "Las tablas FTS5 son especificas de SQLite")
+class BusquedaVendedoresTests(TestCase):
+    """El filtro "Vendedor" de gerencia busca en las tablas FTS5 trigram."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user(
+            "busqueda_vendedor", first_name="Lucia", last_name="Ferrandiz"
+        )
+        otro = User.objects.create_user("busqueda_otro", first_name="Pablo")
+        cls.venta = Venta.objects.create(
+            usuario=otro,
+            matricula="4321XYZ",
+            idv=1,
+            tipo_venta="RENTING",
+            dni="12345678Z",
+            tipo_cliente="NIF",
+            nombre_cliente="Cliente",
+        )
+        cls.incidencia = Incidencia.objects.create(
+            reportado_por=otro, tipo="Otro", detalle="Detalle"
+        )
+        cls.incidencia.ventas.add(cls.venta)
+
+    def _usuarios(self, termino):
+        return set(
+            User.objects.filter(pk__in=ids_usuarios(termino)).values_list(
+                "username", flat=True
+            )
+        )
+
+    def test_busca_subcadenas_sin_distinguir_mayusculas(self):
+        self.assertTrue(fts_disponible())
+        self.assertEqual(self._usuarios("FERRAN"), {"busqueda_vendedor"})
+        self.assertEqual(self._usuarios("ci"), {"busqueda_vendedor"})
+        self.assertEqual(
+            list(Venta.objects.filter(pk__in=ids_ventas("21xy"))), [self.venta]
+        )
+
+    def test_senales_mantienen_el_indice(self):
+        self.vendedor.last_name = "Soler"
+        self.vendedor.save()
+        self.assertEqual(self._usuarios("ferran"), set())
+        self.assertEqual(self._usuarios("soler"), {"busqueda_vendedor"})
+        self.venta.matricula = "9999AAA"
+        self.venta.save()
+        self.assertFalse(Venta.objects.filter(pk__in=ids_ventas("4321")).exists())
+        self.venta.delete()
+        self.assertFalse(Venta.objects.filter(pk__in=ids_ventas("9999")).exists())
+
+    def test_usa_la_tabla_virtual(self):
+        plan = User.objects.filter(pk__in=ids_usuarios("lucia")).explain()
+        self.assertIn("VIRTUAL TABLE", plan)
+
+    def test_incidencias_gerencia_por_matricula_sin_distinct(self):
+        self.client.force_login(User.objects.create_superuser("busqueda_admin"))
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(
+                reverse("incidencias_gerencia"), {**PERIODO_COMPLETO, "vendedor": "4321"}
+            )
+        self.assertEqual(len(response.context["incidencias"]), 1)
+        sql = " ".join(q["sql"] for q in consultas.captured_queries)
+        self.assertNotIn("DISTINCT", sql)
+
+    def test_reconstruir_busqueda(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_USUARIOS}")
+        self.assertEqual(self._usuarios("lucia"), set())
+        call_command("reconstruir_busqueda", stdout=StringIO())
+        self.assertEqual(self._usuarios("lucia"), {"busqueda_vendedor"})
+
+
+class MatriculasIncidenciaTests(TestCase):
+    """`Incidencia.matriculas` sigue a sus ventas y permite ordenar y filtrar en SQL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("vendedor_matriculas", password="x")
+        cls.ventas = [
+            Venta.objects.create(
+                usuario=cls.usuario,
+                matricula=matricula,
+                idv=idx,
+                tipo_venta="RENTING",
+                dni="12345678Z",
+                tipo_cliente="NIF",
+                nombre_cliente="Cliente",
+            )
+            for idx, matricula in enumerate(["1111AAA", "2222BBB"])
+        ]
+
+    def _incidencia(self, *ventas, **campos):
+        incidencia = Incidencia.objects.create(
+            reportado_por=self.usuario, tipo="Otro", detalle="Detalle", **campos
+        )
+        incidencia.ventas.add(*ventas)
+        return incidencia
+
+    def _matriculas(self, incidencia):
+        incidencia.refresh_from_db(fields=["matriculas"])
+        return incidencia.matriculas
+
+    def test_no_recorta_las_matriculas(self):
+        ventas = [
+            Venta.objects.create(
+                usuario=self.usuario,
+                matricula=f"{idx:04d}LRG",
+                idv=idx,
+                tipo_venta="RENTING",
+                dni="12345678Z",
+                tipo_cliente="NIF",
+                nombre_cliente="Cliente",
+            )
+            for idx in range(40)
+        ]
+        incidencia = self._incidencia(*ventas)
+        esperado = ", ".join(venta.matricula for venta in ventas)
+        self.assertGreater(len(esperado), 255)
+        self.assertEqual(self._matriculas(incidencia), esperado)
+        self.assertEqual(
+            list(Incidencia.objects.filter(matriculas__icontains="0039LRG")),
+            [incidencia],
+        )
+
+    def test_sigue_a_las_ventas_asociadas(self):
+        incidencia = self._incidencia(*self.ventas)
+        self.assertEqual(incidencia.matricula_display, "1111AAA, 2222BBB")
+        self.assertEqual(self._matriculas(incidencia), "1111AAA, 2222BBB")
+
+        incidencia.ventas.remove(self.ventas[0])
+        self.assertEqual(self._matriculas(incidencia), "2222BBB")
+        self.ventas[0].incidencias.add(incidencia)
+        self.assertEqual(self._matriculas(incidencia), "1111AAA, 2222BBB")
+        self.ventas[1].incidencias.clear()
+        self.assertEqual(self._matriculas(incidencia), "1111AAA")
+        incidencia.ventas.clear()
+        self.assertEqual(self._matriculas(incidencia), "GENERAL")
+
+    def test_cambios_de_venta_y_de_es_general(self):
+        incidencia = self._incidencia(self.ventas[0])
+        self.ventas[0].matricula = "9999ZZZ"
+        self.ventas[0].save()
+        self.assertEqual(self._matriculas(incidencia), "9999ZZZ")
+
+        incidencia.es_general = True
+        incidencia.save(update_fields=["es_general"])
+        self.assertEqual(self._matriculas(incidencia), "GENERAL")
+        incidencia.es_general = False
+        incidencia.save(update_fields=["es_general"])
+        self.assertEqual(self._matriculas(incidencia), "9999ZZZ")
+
+        self.ventas[0].delete()
+        self.assertEqual(self._matriculas(incidencia), "GENERAL")
+
+    def test_ordena_filtra_y_pagina_en_sql(self):
+        for idx in range(30):
+            self._incidencia(self.ventas[idx % 2])
+        self._incidencia(es_general=True)
+        self.client.force_login(self.usuario)
+        params = {**PERIODO_COMPLETO, "sort": "matricula", "dir": "asc"}
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse("mis_incidencias"), params)
+        incidencias = response.context["incidencias"]
+        self.assertEqual(len(incidencias), 25)
+        self.assertEqual(response.context["total_resultados"], 31)
+        self.assertEqual(incidencias[0].matriculas, "1111AAA")
+        sql = " ".join(q["sql"] for q in consultas.captured_queries)
+        self.assertIn('ORDER BY "comisiones_incidencia"."matriculas" ASC', sql)
+
+        datos = self.client.get(
+            reverse("mis_incidencias_resultados"),
+            {**params, "cursor": response.context["siguiente_cursor"]},
+        ).json()
+        self.assertEqual(datos["filas"], 6)
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(
+                reverse("mis_incidencias"), {**PERIODO_COMPLETO, "matricula": "2222"}
+            )
+        self.assertEqual(response.context["total_resultados"], 15)
+        filtradas = [q["sql"] for q in consultas.captured_queries if "LIKE" in q["sql"]]
+        self.assertTrue(filtradas)
+        for sql in filtradas:
+            self.assertNotIn("DISTINCT", sql)
+            self.assertNotIn("comisiones_incidencia_ventas", sql)
+
+    def test_reconstruir_matriculas_incidencias(self):
+        incidencia = self._incidencia(self.ventas[1])
+        Incidencia.objects.update(matriculas="")
+        call_command("reconstruir_matriculas_incidencias", stdout=StringIO())
+        self.assertEqual(self._matriculas(incidencia), "2222BBB")
+
+
+class NavegacionDetalleIncidenciaTests(TestCase):
+    """Anterior/siguiente y posicion del detalle sin cargar el listado entero."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user("vendedor_navegacion", password="x")
+        # Varias incidencias por dia para que el desempate por id importe.
+        for idx in range(12):
+            Incidencia.objects.create(
+                reportado_por=cls.usuario,
+                fecha_incidencia=date(2024, 1, 1 + idx // 3),
+                tipo="Otro",
+                detalle="Detalle",
+                estado="aceptada" if idx % 2 else "pte_revision",
+            )
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _detalle(self, incidencia_id, **params):
+        return self.client.get(
+            reverse("detalle_incidencia_personal", args=[incidencia_id]),
+            {**PERIODO_COMPLETO, **params},
+        ).context
+
+    def test_coincide_con_el_orden_del_listado(self):
+        for params in ({}, {"estado": "aceptada"}):
+            qs = Incidencia.objects.filter(reportado_por=self.usuario, **params)
+            ids = list(qs.order_by("-fecha_incidencia", "-id").values_list("id", flat=True))
+            for idx, incidencia_id in enumerate(ids):
+                context = self._detalle(incidencia_id, **params)
+                self.assertEqual(context["posicion_actual"], idx + 1)
+                self.assertEqual(context["total_incidencias"], len(ids))
+                self.assertEqual(context["anterior_id"], ids[idx - 1] if idx else None)
+                self.assertEqual(
+                    context["siguiente_id"], ids[idx + 1] if idx + 1 < len(ids) else None
+                )
+
+    def test_fuera_del_filtro_no_tiene_vecinos(self):
+        incidencia = Incidencia.objects.filter(estado="pte_revision").first()
+        context = self._detalle(incidencia.pk, estado="aceptada")
+        self.assertIsNone(context["posicion_actual"])
+        self.assertIsNone(context["anterior_id"])
+        self.assertIsNone(context["siguiente_id"])
+        self.assertEqual(context["total_incidencias"], 6)
+
+    def test_consultas_no_dependen_del_numero_de_incidencias(self):
+        incidencia = Incidencia.objects.first()
+        self._detalle(incidencia.pk)  # contexto de usuario y sesion ya en cache
+        with CaptureQueriesContext(connection) as antes:
+            self._detalle(incidencia.pk)
+        for idx in range(30):
+            Incidencia.objects.create(
+                reportado_por=self.usuario, tipo="Otro", detalle="Detalle"
+            )
+        with CaptureQueriesContext(connection) as despues:
+            self._detalle(incidencia.pk)
+        self.assertEqual(len(despues), len(antes))
+        for consulta in despues.captured_queries:
+            if "comisiones_incidencia" in consulta["sql"] and "COUNT" not in consulta["sql"]:
+                self.assertRegex(consulta["sql"], r"LIMIT \d+")
+
+
+class BackendCorreoPruebas(locmem.EmailBackend):
+    """`locmem` que cuenta las conexiones abiertas y rechaza `falla@...`."""
+
+    aperturas = 0
+
+    def open(self):
+        type(self).aperturas += 1
+        return super().open()
+
+    def send_messages(self, email_messages):
+        for mensaje in email_messages:
+            if any(destino.startswith("falla@") for destino in mensaje.to):
+                raise SMTPException("Destinatario rechazado")
+        return super().send_messages(email_messages)
+
+
+@override_settings(
+    EMAIL_BACKEND="comisiones.tests.BackendCorreoPruebas",
+    INCIDENCIAS_EMAIL_TO="incidencias@local.test",
+    CORREOS_MAX_INTENTOS=2,
+    CORREOS_REINTENTO_SEGUNDOS=60,
+)
+class BandejaSalidaCorreosTests(TestCase):
+    """Los avisos se encolan en la peticion y los envia `enviar_correos`."""
+
+    def setUp(self):
+        BackendCorreoPruebas.aperturas = 0
+
+    def test_registrar_incidencia_solo_encola(self):
+        usuario = User.objects.create_user("vendedor_correos", password="x")
+        self.client.force_login(usuario)
+        response = self.client.post(
+            reverse("registrar_incidencia"),
+            {
+                "fecha_incidencia": date.today().isoformat(),
+                "matricula": "GENERAL",
+                "tipo": "Falta venta",
+                "detalle": "Detalle",
+            },
+        )
+        self.assertRedirects(response, reverse("mis_incidencias"), fetch_redirect_response=False)
+        self.assertEqual(mail.outbox, [])
+        correo = CorreoSalida.objects.get()
+        self.assertEqual(correo.estado, CorreoSalida.ESTADO_PENDIENTE)
+        self.assertEqual(correo.destinatarios, ["incidencias@local.test"])
+        self.assertEqual(correo.asunto, "Nueva incidencia registrada - GENERAL")
+        self.assertEqual(correo.incidencia.reportado_por, usuario)
+        self.assertIsNotNone(correo.incidencia.avisada_en)
+
+        call_command("enviar_correos", "--una-vez", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        correo.refresh_from_db()
+        self.assertEqual(correo.estado, CorreoSalida.ESTADO_ENVIADO)
+
+    def test_lotes_en_paralelo_con_una_conexion_por_lote(self):
+        for idx in range(45):
+            encolar_correo(f"Aviso {idx}", "Cuerpo", [f"destino{idx}@local.test"])
+        enviados, fallidos = procesar_correos_pendientes(hilos=3, tamano_lote=20)
+        self.assertEqual((enviados, fallidos), (45, 0))
+        self.assertEqual(len(mail.outbox), 45)
+        self.assertEqual(BackendCorreoPruebas.aperturas, 3)
+        self.assertFalse(
+            CorreoSalida.objects.exclude(estado=CorreoSalida.ESTADO_ENVIADO).exists()
+        )
+
+    def test_reintenta_con_espera_y_marca_error(self):
+        encolar_correo("Bueno", "Cuerpo", ["ok@local.test"])
+        fallido = encolar_correo("Malo", "Cuerpo", ["falla@local.test"])
+        self.assertEqual(procesar_correos_pendientes(), (1, 1))
+
+        fallido.refresh_from_db()
+        self.assertEqual(fallido.estado, CorreoSalida.ESTADO_PENDIENTE)
+        self.assertEqual(fallido.intentos, 1)
+        self.assertIn("rechazado", fallido.error)
+        self.assertGreater(fallido.proximo_intento, timezone.now() + timedelta(seconds=50))
+        # Hasta que pase la espera no se vuelve a intentar.
+        self.assertEqual(procesar_correos_pendientes(), (0, 0))
+
+        CorreoSalida.objects.filter(pk=fallido.pk).update(proximo_intento=timezone.now())
+        self.assertEqual(procesar_correos_pendientes(), (0, 1))
+        fallido.refresh_from_db()
+        self.assertEqual(fallido.estado, CorreoSalida.ESTADO_ERROR)
+        self.assertEqual(fallido.intentos, 2)
+
+    def test_recupera_los_reclamados_por_un_worker_caido(self):
+        correo = encolar_correo("Aviso", "Cuerpo", ["ok@local.test"])
+        CorreoSalida.objects.filter(pk=correo.pk).update(
+            estado=CorreoSalida.ESTADO_ENVIANDO,
+            reclamado_en=timezone.now() - timedelta(minutes=5),
+        )
+        self.assertEqual(procesar_correos_pendientes(), (0, 0))
+        CorreoSalida.objects.filter(pk=correo.pk).update(
+            reclamado_en=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(procesar_correos_pendientes(), (1, 0))
+
+
+@override_settings(
+    INCIDENCIAS_AVISO_MODO="resumen", INCIDENCIAS_EMAIL_TO="incidencias@local.test"
+)
+class ResumenIncidenciasTests(TestCase):
+    """En modo resumen cada mando recibe un correo con las incidencias de su equipo."""
+
+    @classmethod
+    def setUpTestData(cls):
+        gerente = User.objects.create_user("gerente_resumen", email="gerente@local.test")
+        cls.vendedores = []
+        for idx in range(2):
+            jefe = User.objects.create_user(
+                f"jefe_resumen_{idx}", email=f"jefe{idx}@local.test"
+            )
+            perfil = jefe.perfil
+            perfil.gerente = gerente
+            perfil.save()
+            vendedor = User.objects.create_user(f"vendedor_resumen_{idx}", password="x")
+            perfil = vendedor.perfil
+            perfil.jefe_ventas = jefe
+            perfil.save()
+            cls.vendedores.append(vendedor)
+        cls.sin_mandos = User.objects.create_user("vendedor_sin_mandos")
+
+    def _registrar(self, usuario, detalle="Detalle"):
+        self.client.force_login(usuario)
+        self.client.post(
+            reverse("registrar_incidencia"),
+            {
+                "fecha_incidencia": date.today().isoformat(),
+                "matricula": "GENERAL",
+                "tipo": "Falta venta",
+                "detalle": detalle,
+            },
+        )
+
+    def test_agrupa_por_mando_en_un_correo(self):
+        for vendedor in self.vendedores * 3:
+            self._registrar(vendedor)
+        self._registrar(self.sin_mandos, detalle="Sin <jefe>")
+        self.assertFalse(CorreoSalida.objects.exists())
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(encolar_resumenes_incidencias(), 4)
+        self.assertLessEqual(len(consultas), 5)
+
+        correos = {
+            correo.destinatarios[0]: correo for correo in CorreoSalida.objects.all()
+        }
+        self.assertEqual(
+            set(correos),
+            {
+                "jefe0@local.test",
+                "jefe1@local.test",
+                "gerente@local.test",
+                "incidencias@local.test",
+            },
+        )
+        self.assertEqual(correos["jefe0@local.test"].asunto, "Resumen de incidencias nuevas (3)")
+        self.assertEqual(correos["gerente@local.test"].asunto, "Resumen de incidencias nuevas (6)")
+        self.assertIn("Sin <jefe>", correos["incidencias@local.test"].cuerpo)
+        self.assertFalse(Incidencia.objects.filter(avisada_en__isnull=True).exists())
+
+        # Lo ya resumido no se vuelve a enviar.
+        self.assertEqual(encolar_resumenes_incidencias(), 0)
+
+    def test_enviar_correos_encola_y_envia_los_resumenes(self):
+        self._registrar(self.vendedores[0])
+        call_command("enviar_correos", "--una-vez", stdout=StringIO())
+        self.assertEqual(
+            sorted(mensaje.to[0] for mensaje in mail.outbox),
+            ["gerente@local.test", "jefe0@local.test"],
+        )
+
+
+class RevisionMasivaTests(TestCase):
+    """Gerencia cambia el estado de muchas filas con un UPDATE y deja registro del lote."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.gerente = User.objects.create_user("gerente_revision", password="x")
+        cls.gerente.groups.add(Group.objects.create(name="Gerente"))
+        cls.vendedor = User.objects.create_user("vendedor_revision", password="x")
+        cls.ventas = []
+        for idx in range(3):
+            venta = Venta.objects.create(
+                usuario=cls.vendedor,
+                matricula=f"{idx}REV",
+                idv=idx,
+                tipo_venta="RENTING",
+                dni="12345678Z",
+                tipo_cliente="NIF",
+                nombre_cliente="Cliente",
+            )
+            Comision.objects.create(venta=venta, monto=Decimal("100"))
+            cls.ventas.append(venta)
+        cls.incidencias = [
+            Incidencia.objects.create(
+                reportado_por=cls.vendedor, tipo="Otro", detalle=f"Detalle {idx}"
+            )
+            for idx in range(2)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.gerente)
+
+    def _revisar(self, nombre, accion, leido_en=None, **datos):
+        url = reverse(nombre) + "?desde=2000-01&hasta=2099-12"
+        leido_en = leido_en or timezone.now()
+        return self.client.post(
+            url, {"accion": accion, "leido_en": leido_en.isoformat(), **datos}
+        )
+
+    def _resumen(self):
+        hoy = date.today()
+        return ResumenMensualVentas.objects.get(
+            usuario=self.vendedor, anio=hoy.year, mes=hoy.month
+        )
+
+    def test_aprueba_las_seleccionadas_con_un_update(self):
+        ids = f"{self.ventas[0].pk},{self.ventas[1].pk}"
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._revisar("revisar_comisiones_gerencia", "aprobar", ids=ids)
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual((datos["actualizadas"], datos["conflictos"]), (2, 0))
+        updates = [
+            q["sql"]
+            for q in consultas.captured_queries
+            if q["sql"].startswith('UPDATE "comisiones_comision"')
+        ]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(
+            Comision.objects.filter(estado="aprobada").count(), 2
+        )
+        revision = RevisionMasiva.objects.get(pk=datos["revision"])
+        self.assertEqual(revision.usuario, self.gerente)
+        self.assertEqual(revision.estado_nuevo, "aprobada")
+        self.assertEqual(revision.parametros["ids"], [self.ventas[0].pk, self.ventas[1].pk])
+        self.assertEqual(revision.comisiones.count(), 2)
+
+        # El UPDATE no lanza senales: el resumen mensual se recalcula aparte.
+        resumen = self._resumen()
+        self.assertEqual(resumen.comision_aprobada, Decimal("200"))
+        self.assertEqual(resumen.comision_pendiente, Decimal("100"))
+
+    def test_todas_las_del_filtro_menos_las_excluidas(self):
+        response = self._revisar(
+            "revisar_comisiones_gerencia",
+            "rechazar",
+            modo="filtros",
+            excluidos=str(self.ventas[2].pk),
+        )
+        self.assertEqual(response.json()["actualizadas"], 2)
+        self.assertEqual(
+            Comision.objects.get(venta=self.ventas[2]).estado, "pendiente"
+        )
+        self.assertEqual(self._resumen().comision_rechazada, Decimal("200"))
+
+    def test_no_pisa_cambios_posteriores_a_la_lectura(self):
+        leido_en = timezone.now() - timedelta(minutes=5)
+        comision = Comision.objects.get(venta=self.ventas[0])
+        comision.monto = Decimal("150")
+        comision.save()
+
+        response = self._revisar(
+            "revisar_comisiones_gerencia",
+            "aprobar",
+            leido_en=leido_en,
+            ids=str(self.ventas[0].pk),
+        )
+        self.assertEqual(
+            (response.json()["actualizadas"], response.json()["conflictos"]), (0, 1)
+        )
+        comision.refresh_from_db()
+        self.assertEqual(comision.estado, "pendiente")
+
+    def test_solo_desde_los_estados_de_origen(self):
+        Comision.objects.filter(venta=self.ventas[0]).update(estado="rechazada")
+        response = self._revisar("revisar_comisiones_gerencia", "aprobar", modo="filtros")
+        self.assertEqual(response.json()["actualizadas"], 2)
+        self.assertEqual(
+            Comision.objects.get(venta=self.ventas[0]).estado, "rechazada"
+        )
+
+    def test_acepta_incidencias(self):
+        response = self._revisar(
+            "revisar_incidencias_gerencia",
+            "aceptar",
+            ids=str(self.incidencias[0].pk),
+        )
+        self.assertEqual(response.json()["actualizadas"], 1)
+        aceptada, pendiente = (
+            Incidencia.objects.get(pk=incidencia.pk) for incidencia in self.incidencias
+        )
+        self.assertEqual((aceptada.estado, aceptada.validacion_ok), ("aceptada", True))
+        self.assertEqual(pendiente.estado, "pte_revision")
+
+        response = self._revisar(
+            "revisar_incidencias_gerencia", "reabrir", modo="filtros"
+        )
+        self.assertEqual(response.json()["actualizadas"], 1)
+        self.assertFalse(Incidencia.objects.filter(validacion_ok=True).exists())
+
+    def test_peticiones_no_validas(self):
+        self.assertEqual(
+            self._revisar("revisar_comisiones_gerencia", "borrar", ids="1").status_code,
+            400,
+        )
+        self.assertEqual(
+            self.client.post(
+                reverse("revisar_incidencias_gerencia"), {"accion": "aceptar", "ids": "1"}
+            ).status_code,
+            400,
+        )
+        self.assertEqual(
+            self._revisar("revisar_comisiones_gerencia", "aprobar").status_code, 400
+        )
+        self.assertEqual(
+            self.client.post(
+                reverse("revisar_comisiones_gerencia"),
+                {"accion": "aprobar", "leido_en": "2026-13-40T00:00", "ids": "1"},
+            ).status_code,
+            400,
+        )
+        self.client.force_login(self.vendedor)
+        self.assertEqual(
+            self._revisar(
+                "revisar_comisiones_gerencia", "aprobar", modo="filtros"
+            ).status_code,
+            403,
+        )
+        self.assertFalse(RevisionMasiva.objects.exists())
+
+
+class FacetasTests(TestCase):
+    """Las opciones de los filtros salen de una consulta y coinciden con las de antes."""
+
+    CAMPOS_VENTAS = ("matricula", "idv", "tipo_venta", "dni", "tipo_cliente", "nombre_cliente")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user("vendedor_facetas", password="x")
+        otro = User.objects.create_user("otro_facetas", password="x")
+        ventas = []
+        for usuario, matricula, idv, tipo_venta, tipo_cliente, nombre in (
+            (cls.vendedor, "2222FAC", 9, "RENTING", "NIF", "Cliente B"),
+            (cls.vendedor, "1111FAC", 10, "EXENTA", "CIF", ""),
+            (cls.vendedor, "1111FAC", 10, "RENTING", "NIF", "Cliente A"),
+            (otro, "9999FAC", 99, "PARTICULAR", "NIF", "Ajeno"),
+        ):
+            ventas.append(
+                Venta.objects.create(
+                    usuario=usuario,
+                    matricula=matricula,
+                    idv=idv,
+                    tipo_venta=tipo_venta,
+                    dni="12345678Z",
+                    tipo_cliente=tipo_cliente,
+                    nombre_cliente=nombre,
+                )
+            )
+        Incidencia.objects.create(
+            reportado_por=cls.vendedor, tipo="Otro", detalle="x", es_general=True
+        )
+        incidencia = Incidencia.objects.create(
+            reportado_por=cls.vendedor, tipo="Otro", detalle="x", estado="aceptada"
+        )
+        incidencia.ventas.add(ventas[0], ventas[1])
+        Incidencia.objects.create(
+            reportado_por=otro, tipo="Otro", detalle="x", estado="rechazada"
+        ).ventas.add(ventas[3])
+        Boletin.objects.create(boletin="B1", marca="Marca B", tipo="Precios")
+        Boletin.objects.create(boletin="B2", marca="Marca A", tipo="")
+
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def _por_campo(queryset, campo):
+        # La consulta que se lanzaba antes para cada desplegable.
+        return list(
+            queryset.exclude(**{f"{campo}__isnull": True})
+            .annotate(valor=Cast(campo, output_field=CharField()))
+            .exclude(valor="")
+            .values_list("valor", flat=True)
+            .distinct()
+            .order_by("valor")
+        )
+
+    def test_coincide_con_una_consulta_por_campo(self):
+        ventas = Venta.objects.filter(usuario=self.vendedor)
+        with self.assertNumQueries(1):
+            facetas = calcular_facetas(
+                ventas, {campo: campo for campo in self.CAMPOS_VENTAS}
+            )
+        for campo in self.CAMPOS_VENTAS:
+            with self.subTest(campo=campo):
+                self.assertEqual(facetas[campo], self._por_campo(ventas, campo))
+        # Texto ordenado como texto y sin vacios, igual que antes.
+        self.assertEqual(facetas["idv"], ["10", "9"])
+        self.assertEqual(facetas["nombre_cliente"], ["Cliente A", "Cliente B"])
+
+        boletines = Boletin.objects.all()
+        facetas = calcular_facetas(boletines, {"marca": "marca", "tipo": "tipo"})
+        self.assertEqual(facetas["marca"], self._por_campo(boletines, "marca"))
+        self.assertEqual(facetas["tipo"], ["Precios"])
+
+    def test_sin_facetas_ni_filas(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(calcular_facetas(Venta.objects.all(), {}), {})
+        self.assertEqual(
+            calcular_facetas(Venta.objects.none(), {"matricula": "matricula"}),
+            {"matricula": []},
+        )
+
+    def test_opciones_de_mis_ventas(self):
+        self.client.force_login(self.vendedor)
+        contexto = self.client.get(reverse("mis_ventas"), PERIODO_COMPLETO).context
+        ventas = Venta.objects.filter(usuario=self.vendedor)
+        self.assertEqual(contexto["matriculas_opciones"], ["1111FAC", "2222FAC"])
+        self.assertEqual(contexto["idv_opciones"], self._por_campo(ventas, "idv"))
+        self.assertEqual(contexto["dni_opciones"], ["12345678Z"])
+        self.assertEqual(
+            contexto["tipo_venta_opciones"],
+            [
+                {"value": "EXENTA", "label": dict(Venta.TIPO_VENTA_CHOICES)["EXENTA"]},
+                {"value": "RENTING", "label": dict(Venta.TIPO_VENTA_CHOICES)["RENTING"]},
+            ],
+        )
+        self.assertEqual(
+            [opcion["value"] for opcion in contexto["tipo_cliente_opciones"]],
+            ["CIF", "NIF"],
+        )
+
+    def test_opciones_de_mis_incidencias(self):
+        self.client.force_login(self.vendedor)
+        contexto = self.client.get(reverse("mis_incidencias"), PERIODO_COMPLETO).context
+        incidencias = Incidencia.objects.filter(reportado_por=self.vendedor)
+        # Antes: GENERAL si habia alguna general y las matriculas de sus ventas.
+        esperadas = ["GENERAL"] + self._por_campo(
+            Venta.objects.filter(incidencias__in=incidencias), "matricula"
+        )
+        self.assertEqual(contexto["matriculas_opciones"], esperadas)
+        self.assertEqual(esperadas, ["GENERAL", "1111FAC", "2222FAC"])
+        self.assertEqual(
+            contexto["estado_opciones"],
+            [
+                {"value": "aceptada", "label": dict(Incidencia.ESTADOS)["aceptada"]},
+                {
+                    "value": "pte_revision",
+                    "label": dict(Incidencia.ESTADOS)["pte_revision"],
+                },
+            ],
+        )
+
+
+class PaginacionKeysetTests(TestCase):
+    """Recorrer un listado por cursor devuelve cada fila una vez y en su orden."""
+
+    UD_FINANCIADAS = (None, 2, 1, None, 1, 2, 1, None, 3)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user("vendedor_keyset", password="x")
+        for idx, ud in enumerate(cls.UD_FINANCIADAS):
+            Venta.objects.create(
+                usuario=cls.vendedor,
+                matricula=f"{idx}KEY",
+                idv=idx,
+                tipo_venta="RENTING",
+                ud_financiadas=ud,
+                dni="12345678Z",
+                tipo_cliente="NIF",
+                nombre_cliente="Cliente",
+            )
+        cls.ventas = Venta.objects.filter(usuario=cls.vendedor)
+
+    def _recorrer(self, campo, sort_dir, tamano):
+        ordenadas = self.ventas.order_by(*orden_keyset(campo, sort_dir))
+        ids, paginas, cursor = [], 0, None
+        while True:
+            filas, cursor = paginar_keyset(ordenadas, campo, sort_dir, cursor, tamano)
+            ids.extend(fila.pk for fila in filas)
+            paginas += 1
+            if not cursor:
+                return ids, paginas
+
+    def test_nulos_al_principio_en_asc_y_al_final_en_desc(self):
+        filas = list(self.ventas.values_list("ud_financiadas", "id"))
+        asc = [
+            pk
+            for ud, pk in sorted(filas, key=lambda f: (f[0] is not None, f[0] or 0, f[1]))
+        ]
+        desc = [
+            pk
+            for ud, pk in sorted(filas, key=lambda f: (f[0] is None, -(f[0] or 0), -f[1]))
+        ]
+        for tamano in (1, 2, 4):
+            with self.subTest(tamano=tamano):
+                self.assertEqual(self._recorrer("ud_financiadas", "asc", tamano)[0], asc)
+                self.assertEqual(self._recorrer("ud_financiadas", "desc", tamano)[0], desc)
+
+    def test_empates_en_el_campo_de_orden(self):
+        # Todas las ventas tienen el mismo cliente y fecha: decide el `id`.
+        ids = sorted(self.ventas.values_list("id", flat=True))
+        for campo in ("nombre_cliente", "fecha_venta"):
+            with self.subTest(campo=campo):
+                self.assertEqual(self._recorrer(campo, "asc", 2)[0], ids)
+                self.assertEqual(self._recorrer(campo, "desc", 2)[0], ids[::-1])
+
+    def test_sin_pagina_vacia_al_final(self):
+        # 9 filas de 3 en 3: la tercera pagina ya no trae cursor.
+        ids, paginas = self._recorrer("ud_financiadas", "asc", 3)
+        self.assertEqual((len(ids), paginas), (9, 3))
+
+    def test_cursor_manipulado_vuelve_a_la_primera_pagina(self):
+        ordenadas = self.ventas.order_by(*orden_keyset("fecha_venta", "desc"))
+        primera, cursor = paginar_keyset(ordenadas, "fecha_venta", "desc", None, 2)
+        self.assertIsNotNone(decodificar_cursor(cursor, Venta, "fecha_venta", "desc"))
+
+        ultima = primera[-1]
+        ultimo = "A" if cursor[-1] != "A" else "B"
+        firmado = {"c": "fecha_venta", "d": "desc", "v": None}
+        no_validos = {
+            "firma": cursor[:-1] + ultimo,
+            "sin_firma": "no-es-un-cursor",
+            "otra_sal": signing.dumps({**firmado, "id": 1}, salt="otra"),
+            "sin_id": signing.dumps(firmado, salt="comisiones.paginacion.cursor"),
+            "sin_orden": signing.dumps(
+                {"v": None, "id": ultima.pk}, salt="comisiones.paginacion.cursor"
+            ),
+            "id_no_numerico": signing.dumps(
+                {**firmado, "id": "x"}, salt="comisiones.paginacion.cursor"
+            ),
+            "otro_campo": codificar_cursor("matricula", "desc", "0KEY", ultima.pk),
+            "otro_sentido": codificar_cursor(
+                "fecha_venta", "asc", ultima.fecha_venta, ultima.pk
+            ),
+            "valor_de_otro_tipo": codificar_cursor(
+                "fecha_venta", "desc", "0KEY", ultima.pk
+            ),
+        }
+        for motivo, valor in no_validos.items():
+            with self.subTest(motivo=motivo):
+                self.assertIsNone(decodificar_cursor(valor, Venta, "fecha_venta", "desc"))
+                filas, _ = paginar_keyset(ordenadas, "fecha_venta", "desc", valor, 2)
+                self.assertEqual(filas, primera)
+
+    def test_cambiar_el_orden_conservando_el_cursor_vuelve_a_la_primera_pagina(self):
+        self.client.force_login(self.vendedor)
+        url = reverse("mis_ventas_resultados")
+        with mock.patch("comisiones.views.RESULTADOS_POR_PAGINA", 4):
+            por_matricula = self.client.get(
+                url, {**PERIODO_COMPLETO, "sort": "matricula", "dir": "asc"}
+            ).json()
+            self.assertTrue(por_matricula["siguiente_cursor"])
+            for sort, sort_dir in (("matricula", "desc"), ("ud_financiadas", "asc")):
+                with self.subTest(sort=sort, dir=sort_dir):
+                    params = {**PERIODO_COMPLETO, "sort": sort, "dir": sort_dir}
+                    primera = self.client.get(url, params).json()
+                    response = self.client.get(
+                        url, {**params, "cursor": por_matricula["siguiente_cursor"]}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json()["html"], primera["html"])
+                    self.assertEqual(response.json()["filas"], 4)
+
+
+class ResultadosJSONTests(TestCase):
+    """Los endpoints `*_resultados` devuelven las mismas filas que la pagina completa."""
+
+    # nombre de la pagina -> (endpoint JSON, regex de la columna identificativa)
+    LISTADOS = {
+        "mis_ventas": ("mis_ventas_resultados", r'bold is-primary-col">([^<]+)<'),
+        "mis_incidencias": (
+            "mis_incidencias_resultados",
+            r'col-detalle-incidencia">([^<]+)<',
+        ),
+        "mis_comunicaciones": (
+            "mis_comunicaciones_resultados",
+            r'<td class="is-primary-col">([^<]+)<',
+        ),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user("vendedor_resultados", password="x")
+        otro = User.objects.create_user("otro_resultados", password="x")
+        for usuario, prefijo in ((cls.vendedor, "RES"), (otro, "OTR")):
+            for idx in range(30):
+                Venta.objects.create(
+                    usuario=usuario,
+                    matricula=f"{idx:04d}{prefijo}",
+                    idv=idx,
+                    tipo_venta="RENTING",
+                    dni="12345678Z",
+                    tipo_cliente="NIF",
+                    nombre_cliente="Cliente",
+                )
+                Incidencia.objects.create(
+                    reportado_por=usuario, tipo="Otro", detalle=f"{prefijo} {idx:02d}"
+                )
+        for idx in range(30):
+            Boletin.objects.create(boletin=f"Boletin {idx:02d}", marca="Marca")
+        Boletin.objects.create(boletin="Boletin retirado", activo=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.vendedor)
+
+    def _filas_html(self, pagina, html):
+        return re.findall(self.LISTADOS[pagina][1], html)
+
+    def _recorrer(self, pagina, params):
+        """Pide las paginas por cursor. Devuelve `(filas, filas por pagina, totales)`."""
+        url = reverse(self.LISTADOS[pagina][0])
+        filas, por_pagina, totales, cursor = [], [], set(), ""
+        while True:
+            response = self.client.get(url, {**params, "cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/json")
+            datos = response.json()
+            filas_pagina = self._filas_html(pagina, datos["html"])
+            self.assertEqual(len(filas_pagina), datos["filas"])
+            filas.extend(filas_pagina)
+            por_pagina.append(datos["filas"])
+            totales.add(datos["total_resultados"])
+            cursor = datos["siguiente_cursor"]
+            if not cursor:
+                return filas, por_pagina, totales
+
+    def test_paginas_en_orden_y_sin_repetidos(self):
+        esperadas = {
+            "mis_ventas": [f"{idx:04d}RES" for idx in range(30)],
+            "mis_incidencias": [f"RES {idx:02d}" for idx in range(30)],
+            "mis_comunicaciones": [f"Boletin {idx:02d}" for idx in range(30)],
+        }
+        orden = {
+            "mis_ventas": "matricula",
+            "mis_incidencias": "detalle",
+            "mis_comunicaciones": "boletin",
+        }
+        for pagina, filas_esperadas in esperadas.items():
+            params = {**PERIODO_COMPLETO, "sort": orden[pagina], "dir": "asc"}
+            with self.subTest(pagina=pagina):
+                filas, por_pagina, totales = self._recorrer(pagina, params)
+                self.assertEqual(filas, filas_esperadas)
+                self.assertEqual(por_pagina, [25, 5])
+                self.assertEqual(totales, {30})
+
+                # La primera pagina JSON es la que pinta la pagina completa.
+                completa = self.client.get(reverse(pagina), params)
+                self.assertEqual(
+                    self._filas_html(pagina, completa.content.decode()),
+                    filas_esperadas[:25],
+                )
+
+    def test_aplica_filtros_y_orden_descendente(self):
+        filas, por_pagina, totales = self._recorrer(
+            "mis_ventas", {**PERIODO_COMPLETO, "matricula": "001", "dir": "desc"}
+        )
+        # 0001RES y 0010RES..0019RES, de mayor a menor.
+        self.assertEqual(totales, {11})
+        self.assertEqual(por_pagina, [11])
+        self.assertEqual(filas, [f"{idx:04d}RES" for idx in (*range(19, 9, -1), 1)])
+
+        filas, _, totales = self._recorrer(
+            "mis_comunicaciones",
+            {**PERIODO_COMPLETO, "sort": "boletin", "dir": "desc", "marca": "marca"},
+        )
+        self.assertEqual(totales, {30})
+        self.assertEqual(filas[0], "Boletin 29")
+
+    def test_requiere_sesion(self):
+        self.client.logout()
+        for endpoint, _ in self.LISTADOS.values():
+            with self.subTest(endpoint=endpoint):
+                response = self.client.get(reverse(endpoint), PERIODO_COMPLETO)
+                self.assertEqual(response.status_code, 302)
+                self.assertIn(settings.LOGIN_URL, response["Location"])
+
+
+class ExportacionVentasTests(TestCase):
+    """Los ficheros exportados, directos o en segundo plano, repiten las filas originales."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user("vendedor_exportacion", password="x")
+        otro = User.objects.create_user("otro_exportacion", password="x")
+        for usuario, matricula, ud, dni, tipo_cliente, nombre in (
+            (cls.vendedor, "3333EXP", 2, "12345678Z", "CIF", 'Peña; "La Flota"'),
+            (cls.vendedor, "1111EXP", None, "", "NIF", ""),
+            (cls.vendedor, "2222EXP", 0, "X1234567L", "NIF", "Cliente"),
+            (otro, "9999EXP", 1, "12345678Z", "NIF", "Ajeno"),
+        ):
+            Venta.objects.create(
+                usuario=usuario,
+                matricula=matricula,
+                idv=int(matricula[:4]),
+                tipo_venta="RENTING",
+                ud_financiadas=ud,
+                dni=dni,
+                tipo_cliente=tipo_cliente,
+                nombre_cliente=nombre,
+            )
+        cls.ventas = Venta.objects.filter(usuario=cls.vendedor)
+        cls.ajena = Venta.objects.get(usuario=otro)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.vendedor)
+
+    @staticmethod
+    def _fila_baseline(venta):
+        # Fila tal y como la escribia la exportacion original.
+        return [
+            venta.matricula or "--",
+            venta.fecha_venta.strftime("%d/%m/%Y") if venta.fecha_venta else "--",
+            venta.idv if venta.idv is not None else "--",
+            venta.get_tipo_venta_display() or "--",
+            venta.ud_financiadas if venta.ud_financiadas is not None else "--",
+            venta.dni or "--",
+            venta.get_tipo_cliente_display() or "--",
+            venta.nombre_cliente or "--",
+        ]
+
+    CABECERAS_BASELINE = [
+        "Matricula",
+        "Fecha",
+        "IDV",
+        "Tipo venta",
+        "UD financiadas",
+        "DNI",
+        "Tipo cliente",
+        "Nombre cliente",
+    ]
+
+    def _csv_baseline(self, ventas):
+        salida = StringIO()
+        salida.write("\ufeff")
+        writer = csv.writer(salida, delimiter=";")
+        writer.writerow(self.CABECERAS_BASELINE)
+        for venta in ventas:
+            writer.writerow(self._fila_baseline(venta))
+        return salida.getvalue().encode("utf-8")
+
+    def _seleccion(self, modo="filtros", **datos):
+        response = self.client.post(
+            reverse("seleccionar_mis_ventas") + "?desde=2000-01&hasta=2099-12",
+            {"modo": modo, **datos},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["seleccion"]
+
+    def _exportar(self, formato, seleccion, **params):
+        response = self.client.get(
+            reverse("exportar_mis_ventas"),
+            {"formato": formato, "seleccion": seleccion, **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        contenido = b"".join(response.streaming_content)
+        return response, contenido
+
+    def test_csv_igual_que_la_exportacion_original(self):
+        response, contenido = self._exportar("csv", self._seleccion())
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertRegex(
+            response["Content-Disposition"],
+            r'^attachment; filename="mis_ventas_\d{8}_\d{6}\.csv"$',
+        )
+        # Orden por defecto del listado: fecha descendente y, a igual fecha, id.
+        self.assertEqual(
+            contenido, self._csv_baseline(self.ventas.order_by("-fecha_venta", "-id"))
+        )
+
+    def test_csv_respeta_orden_y_seleccion(self):
+        ids = list(self.ventas.order_by("-pk").values_list("pk", flat=True)[:2])
+        seleccion = self._seleccion("ids", ids=",".join(map(str, ids)))
+        _, contenido = self._exportar("csv", seleccion, sort="matricula", dir="asc")
+        self.assertEqual(
+            contenido,
+            self._csv_baseline(self.ventas.filter(pk__in=ids).order_by("matricula")),
+        )
+
+        excluida = self.ventas.get(matricula="2222EXP")
+        seleccion = self._seleccion("filtros", excluidos=str(excluida.pk))
+        _, contenido = self._exportar("csv", seleccion, sort="matricula", dir="asc")
+        self.assertEqual(
+            contenido,
+            self._csv_baseline(self.ventas.exclude(pk=excluida.pk).order_by("matricula")),
+        )
+
+    def test_csv_no_incluye_ventas_de_otro_usuario(self):
+        seleccion = self._seleccion(
+            "ids", ids=f"{self.ventas.first().pk},{self.ajena.pk}"
+        )
+        _, contenido = self._exportar("csv", seleccion)
+        lineas = contenido.decode("utf-8-sig").splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertNotIn("9999EXP", contenido.decode("utf-8"))
+
+    def _filas_excel(self, contenido):
+        libro = load_workbook(BytesIO(contenido))
+        self.assertEqual(libro.sheetnames, ["Mis Ventas"])
+        hoja = libro["Mis Ventas"]
+        self.assertTrue(all(celda.font.bold for celda in hoja[1]))
+        return [list(fila) for fila in hoja.iter_rows(values_only=True)]
+
+    def _excel_baseline(self, ventas):
+        return [self.CABECERAS_BASELINE] + [self._fila_baseline(venta) for venta in ventas]
+
+    def test_excel_igual_que_la_exportacion_original(self):
+        response, contenido = self._exportar(
+            "excel", self._seleccion(), sort="ud_financiadas", dir="desc"
+        )
+        self.assertEqual(
+            response["Content-Type"],
+            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        self.assertRegex(
+            response["Content-Disposition"],
+            r'^attachment; filename="mis_ventas_\d{8}_\d{6}\.xlsx"$',
+        )
+        # Numeros como numeros y "--" donde faltaba el dato; nulos al final.
+        filas = self._filas_excel(contenido)
+        ordenadas = self.ventas.order_by(*orden_keyset("ud_financiadas", "desc"))
+        self.assertEqual(filas, self._excel_baseline(ordenadas))
+        self.assertEqual([fila[4] for fila in filas[1:]], [2, 0, "--"])
+
+    def test_excel_por_bloques_y_en_disco(self):
+        # Bloques de una fila y fichero temporal en disco desde el primer byte.
+        with mock.patch("comisiones.views.EXPORT_CHUNK_SIZE", 1), mock.patch(
+            "comisiones.views.EXPORT_EXCEL_SPOOL_BYTES", 1
+        ):
+            _, contenido = self._exportar(
+                "excel", self._seleccion(), sort="matricula", dir="asc"
+            )
+        self.assertEqual(
+            self._filas_excel(contenido),
+            self._excel_baseline(self.ventas.order_by("matricula")),
+        )
+
+    def _solicitar(self, formato, seleccion=None):
+        """Encola una exportacion de todas las ventas y devuelve el trabajo."""
+        seleccion = seleccion or self._seleccion()
+        response = self.client.post(
+            reverse("solicitar_exportacion_mis_ventas")
+            + f"?formato={formato}&seleccion={seleccion}&sort=matricula&dir=asc"
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()["estado"], ExportacionVentas.ESTADO_PENDIENTE)
+        return ExportacionVentas.objects.get(pk=response.json()["id"])
+
+    def _procesar(self):
+        salida = StringIO()
+        call_command("procesar_exportaciones", una_vez=True, stdout=salida)
+        return salida.getvalue()
+
+    def _en_media_root(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directorio.name))
+
+    def test_trabajo_completado_igual_que_la_descarga_directa(self):
+        self._en_media_root()
+        ordenadas = self.ventas.order_by("matricula")
+        trabajos = {formato: self._solicitar(formato) for formato in ("csv", "excel")}
+        self.assertIn("Exportaciones generadas: 2.", self._procesar())
+
+        for formato, exportacion in trabajos.items():
+            with self.subTest(formato=formato):
+                exportacion.refresh_from_db()
+                self.assertEqual(exportacion.estado, ExportacionVentas.ESTADO_COMPLETADA)
+                self.assertEqual(
+                    (exportacion.filas_totales, exportacion.filas_procesadas), (3, 3)
+                )
+                self.assertTrue(os.path.exists(exportacion.archivo.path))
+
+                estado = self.client.get(
+                    reverse("estado_exportacion_mis_ventas", args=[exportacion.pk])
+                ).json()
+                self.assertEqual(estado["progreso"], 100)
+                response = self.client.get(estado["url_descarga"])
+                contenido = b"".join(response.streaming_content)
+                response.close()
+                if formato == "csv":
+                    self.assertEqual(contenido, self._csv_baseline(ordenadas))
+                else:
+                    self.assertEqual(
+                        self._filas_excel(contenido), self._excel_baseline(ordenadas)
+                    )
+
+        # Un trabajo ya cogido por otro proceso no se vuelve a generar.
+        self.assertFalse(procesar_exportacion(trabajos["csv"]))
+
+    def test_error_queda_en_el_trabajo_y_sigue_la_cola(self):
+        self._en_media_root()
+        fallida = self._solicitar("excel")
+        correcta = self._solicitar("csv")
+        with mock.patch(
+            "comisiones.exportaciones.escribir_excel_ventas",
+            side_effect=OSError("Disco lleno"),
+        ):
+            self.assertIn("Exportaciones generadas: 1.", self._procesar())
+
+        fallida.refresh_from_db()
+        self.assertEqual(fallida.estado, ExportacionVentas.ESTADO_ERROR)
+        self.assertEqual(fallida.error, "Disco lleno")
+        self.assertIsNotNone(fallida.finalizada_en)
+        self.assertFalse(fallida.archivo)
+        self.assertEqual(
+            self.client.get(
+                reverse("descargar_exportacion_mis_ventas", args=[fallida.pk])
+            ).status_code,
+            404,
+        )
+        correcta.refresh_from_db()
+        self.assertEqual(correcta.estado, ExportacionVentas.ESTADO_COMPLETADA)
+
+    def test_purga_los_ficheros_caducados(self):
+        self._en_media_root()
+        caducada = self._solicitar("csv")
+        reciente = self._solicitar("csv")
+        olvidada = self._solicitar("csv")
+        self._procesar()
+        caducada.refresh_from_db()
+        ruta = caducada.archivo.path
+
+        hace_dias = timezone.now() - timedelta(
+            hours=settings.EXPORTACIONES_CADUCIDAD_HORAS + 1
+        )
+        ExportacionVentas.objects.filter(pk=caducada.pk).update(
+            finalizada_en=hace_dias
+        )
+        # Un trabajo que nunca termino caduca por su fecha de creacion.
+        ExportacionVentas.objects.filter(pk=olvidada.pk).update(
+            estado=ExportacionVentas.ESTADO_EN_CURSO,
+            finalizada_en=None,
+            creada_en=hace_dias,
+        )
+        self.assertIn("Caducadas: 2.", self._procesar())
+
+        caducada.refresh_from_db()
+        self.assertEqual(caducada.estado, ExportacionVentas.ESTADO_CADUCADA)
+        self.assertFalse(caducada.archivo)
+        self.assertEqual(caducada.ventas_ids, [])
+        self.assertFalse(os.path.exists(ruta))
+        self.assertEqual(
+            ExportacionVentas.objects.get(pk=olvidada.pk).estado,
+            ExportacionVentas.ESTADO_CADUCADA,
+        )
+        self.assertEqual(
+            self.client.get(
+                reverse("descargar_exportacion_mis_ventas", args=[caducada.pk])
+            ).status_code,
+            404,
+        )
+
+        reciente.refresh_from_db()
+        self.assertEqual(reciente.estado, ExportacionVentas.ESTADO_COMPLETADA)
+        self.assertTrue(os.path.exists(reciente.archivo.path))
+        # Las ya caducadas no se vuelven a contar.
+        self.assertEqual(purgar_exportaciones_caducadas(), 0)
+
+    def test_trabajos_de_otro_usuario(self):
+        exportacion = self._solicitar("csv")
+        self.client.force_login(self.ajena.usuario)
+        for nombre in (
+            "estado_exportacion_mis_ventas",
+            "descargar_exportacion_mis_ventas",
+        ):
+            with self.subTest(vista=nombre):
+                response = self.client.get(reverse(nombre, args=[exportacion.pk]))
+                self.assertEqual(response.status_code, 404)
+
+    def test_seleccion_en_sesion(self):
+        sesion = {}
+        token = guardar_seleccion(
+            sesion, MODO_IDS, {"desde": "2000-01"}, ids=[3, 1], excluidos=[2]
+        )
+        self.assertEqual(
+            obtener_seleccion(sesion, token),
+            {
+                "modo": MODO_IDS,
+                "parametros": {"desde": "2000-01"},
+                "ids": [3, 1],
+                "excluidos": [],
+            },
+        )
+        token = guardar_seleccion(sesion, MODO_FILTROS, {}, ids=[3], excluidos=[2])
+        self.assertEqual(obtener_seleccion(sesion, token)["ids"], [])
+        self.assertEqual(obtener_seleccion(sesion, token)["excluidos"], [2])
+        self.assertIsNone(obtener_seleccion(sesion, "otro"))
+        self.assertIsNone(obtener_seleccion(sesion, ""))
+        with self.assertRaises(ValueError):
+            guardar_seleccion(sesion, "todas", {})
+
+        # Solo se guardan las ultimas selecciones de la sesion.
+        tokens = [
+            guardar_seleccion(sesion, MODO_IDS, {}, ids=[idx])
+            for idx in range(MAX_SELECCIONES_POR_SESION + 1)
+        ]
+        self.assertIsNone(obtener_seleccion(sesion, tokens[0]))
+        self.assertEqual(
+            obtener_seleccion(sesion, tokens[-1])["ids"], [MAX_SELECCIONES_POR_SESION]
+        )
+
+    def test_seleccion_ida_y_vuelta(self):
+        ventas = list(self.ventas.order_by("matricula"))
+        response = self.client.post(
+            reverse("seleccionar_mis_ventas") + "?desde=2000-01&hasta=2099-12",
+            {"modo": MODO_IDS, "ids": f"{ventas[0].pk},{ventas[2].pk}"},
+        ).json()
+        self.assertEqual(response["total"], 2)
+        # Los filtros de la seleccion mandan: los de la descarga se ignoran
+        # salvo el orden.
+        _, contenido = self._exportar(
+            "csv",
+            response["seleccion"],
+            matricula="NO-EXISTE",
+            sort="matricula",
+            dir="desc",
+        )
+        self.assertEqual(contenido, self._csv_baseline([ventas[2], ventas[0]]))
+
+        response = self.client.post(
+            reverse("seleccionar_mis_ventas")
+            + "?desde=2000-01&hasta=2099-12&matricula=EXP",
+            {"modo": MODO_FILTROS, "excluidos": str(ventas[1].pk)},
+        ).json()
+        self.assertEqual(response["total"], 2)
+        seleccion = obtener_seleccion(self.client.session, response["seleccion"])
+        self.assertEqual(seleccion["parametros"]["matricula"], "EXP")
+
+    def test_seleccion_no_valida(self):
+        url = reverse("seleccionar_mis_ventas") + "?desde=2000-01&hasta=2099-12"
+        self.assertEqual(self.client.post(url, {"modo": "todas"}).status_code, 400)
+        self.assertEqual(self.client.post(url, {"modo": MODO_IDS}).status_code, 400)
+        # Ids de otro usuario no cuentan como seleccion.
+        response = self.client.post(url, {"modo": MODO_IDS, "ids": str(self.ajena.pk)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 405)
+
+    def test_token_de_otro_usuario(self):
+        token = self._seleccion()
+
+        # Otro usuario en otro navegador: el token no esta en su sesion.
+        otro = self.client_class()
+        otro.force_login(self.ajena.usuario)
+        for nombre, metodo in (
+            ("exportar_mis_ventas", otro.get),
+            ("solicitar_exportacion_mis_ventas", otro.post),
+        ):
+            with self.subTest(vista=nombre):
+                response = metodo(reverse(nombre) + f"?formato=csv&seleccion={token}")
+                self.assertEqual(response.status_code, 400)
+
+        # Otro usuario en el mismo navegador: el login vacia la sesion anterior.
+        self.client.force_login(self.ajena.usuario)
+        response = self.client.get(
+            reverse("exportar_mis_ventas"), {"formato": "csv", "seleccion": token}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportacionVentas.objects.exists())
+
+    def test_sin_seleccion(self):
+        response = self.client.get(reverse("exportar_mis_ventas"), {"formato": "csv"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse("exportar_mis_ventas"), {"formato": "csv", "seleccion": "no-existe"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ResumenMensualVentasTests(TestCase):
+    """Las senales dejan el resumen igual que si se regenerara desde las ventas."""
+
+    MARZO = date(2026, 3, 15)
+    ABRIL = date(2026, 4, 2)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendedor = User.objects.create_user("vendedor_resumen_mensual")
+        cls.otro = User.objects.create_user("otro_resumen_mensual")
+
+    def _venta(self, fecha, *comisiones, usuario=None, tipo_venta="RENTING"):
+        venta = Venta.objects.create(
+            usuario=usuario or self.vendedor,
+            matricula="1234RSM",
+            idv=1,
+            tipo_venta=tipo_venta,
+            dni="12345678Z",
+            tipo_cliente="NIF",
+            nombre_cliente="Cliente",
+        )
+        # `fecha_venta` es `auto_now_add`: se cambia despues de crearla.
+        venta.fecha_venta = fecha
+        venta.save()
+        for monto, estado in comisiones:
+            Comision.objects.create(venta=venta, monto=Decimal(monto), estado=estado)
+        return venta
+
+    @staticmethod
+    def _tabla():
+        return {
+            (fila.pop("usuario_id"), fila.pop("anio"), fila.pop("mes")): fila
+            for fila in ResumenMensualVentas.objects.values(
+                *(
+                    campo.attname
+                    for campo in ResumenMensualVentas._meta.concrete_fields
+                    if campo.name not in ("id", "actualizado_en")
+                )
+            )
+        }
+
+    def _mes(self, fecha, usuario=None):
+        usuario = usuario or self.vendedor
+        return self._tabla().get((usuario.pk, fecha.year, fecha.month))
+
+    def assertIgualQueReconstruir(self):
+        mantenida = self._tabla()
+        ResumenMensualVentas.reconstruir()
+        self.assertEqual(mantenida, self._tabla())
+
+    def test_venta_cambia_de_mes(self):
+        venta = self._venta(self.MARZO, ("100", "pendiente"), ("50", "aprobada"))
+        otra = self._venta(self.MARZO, tipo_venta="EXENTA")
+        marzo = self._mes(self.MARZO)
+        self.assertEqual(
+            (marzo["ventas_total"], marzo["ventas_renting"], marzo["ventas_exenta"]),
+            (2, 1, 1),
+        )
+        self.assertEqual(
+            (marzo["comision_pendiente"], marzo["comision_aprobada"]),
+            (Decimal("100"), Decimal("50")),
+        )
+        self.assertIsNone(self._mes(self.ABRIL))
+        self.assertIgualQueReconstruir()
+
+        venta.fecha_venta = self.ABRIL
+        venta.save()
+        marzo, abril = self._mes(self.MARZO), self._mes(self.ABRIL)
+        self.assertEqual((marzo["ventas_total"], marzo["ventas_renting"]), (1, 0))
+        self.assertIsNone(marzo["comision_pendiente"])
+        self.assertEqual((abril["ventas_total"], abril["ventas_renting"]), (1, 1))
+        self.assertEqual(abril["comision_aprobada"], Decimal("50"))
+        self.assertIgualQueReconstruir()
+
+        # Un mes sin ventas desaparece.
+        otra.fecha_venta = self.ABRIL
+        otra.save(update_fields=["fecha_venta"])
+        self.assertIsNone(self._mes(self.MARZO))
+        self.assertEqual(self._mes(self.ABRIL)["ventas_total"], 2)
+        self.assertIgualQueReconstruir()
+
+    def test_comision_cambia_de_estado_y_de_venta(self):
+        venta_marzo = self._venta(self.MARZO)
+        venta_abril = self._venta(self.ABRIL)
+        comision = Comision.objects.create(venta=venta_marzo, monto=Decimal("80"))
+        self.assertEqual(self._mes(self.MARZO)["comision_pendiente"], Decimal("80"))
+
+        for estado in ("aprobada", "rechazada"):
+            comision.estado = estado
+            comision.save()
+            marzo = self._mes(self.MARZO)
+            self.assertEqual(marzo[f"comision_{estado}"], Decimal("80"))
+            self.assertIsNone(marzo["comision_pendiente"])
+            self.assertIgualQueReconstruir()
+
+        # Las comisiones cuentan en el mes de su venta.
+        comision.venta = venta_abril
+        comision.save()
+        self.assertIsNone(self._mes(self.MARZO)["comision_rechazada"])
+        self.assertEqual(self._mes(self.ABRIL)["comision_rechazada"], Decimal("80"))
+        self.assertIgualQueReconstruir()
+
+        comision.delete()
+        self.assertIsNone(self._mes(self.ABRIL)["comision_rechazada"])
+        self.assertEqual(self._mes(self.ABRIL)["ventas_total"], 1)
+        self.assertIgualQueReconstruir()
+
+    def test_venta_cambia_de_usuario_y_se_borra(self):
+        venta = self._venta(self.MARZO, ("10", "aprobada"))
+        venta.usuario = self.otro
+        venta.save()
+        self.assertIsNone(self._mes(self.MARZO))
+        self.assertEqual(
+            self._mes(self.MARZO, self.otro)["comision_aprobada"], Decimal("10")
+        )
+        self.assertIgualQueReconstruir()
+
+        venta.delete()
+        self.assertEqual(self._tabla(), {})
+
+    def test_reconstruir_por_usuario_y_comando(self):
+        self._venta(self.MARZO, ("10", "pendiente"))
+        self._venta(self.ABRIL)
+        self._venta(self.ABRIL, usuario=self.otro)
+        correcta = self._tabla()
+        ResumenMensualVentas.objects.update(ventas_total=99, comision_pendiente=None)
+
+        self.assertEqual(ResumenMensualVentas.reconstruir(usuario=self.vendedor), 2)
+        self.assertEqual(self._mes(self.MARZO), correcta[(self.vendedor.pk, 2026, 3)])
+        self.assertEqual(self._mes(self.ABRIL, self.otro)["ventas_total"], 99)
+
+        salida = StringIO()
+        call_command("reconstruir_resumenes", stdout=salida)
+        self.assertIn("3 filas", salida.getvalue())
+        self.assertEqual(self._tabla(), correcta)
+        with self.assertRaises(CommandError):
+            call_command("reconstruir_resumenes", usuario="no_existe", stdout=StringIO())
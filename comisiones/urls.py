@@ -13,17 +13,62 @@ urlpatterns = [
     # Vista principal para gerencia (resumen de comisiones).
     # Temporalmente desactivada.
     path("", views.comisiones_gerencia, name="comisiones_gerencia"),
+    path(
+        "resultados/",
+        views.comisiones_gerencia_resultados,
+        name="comisiones_gerencia_resultados",
+    ),
+    path(
+        "revision/",
+        views.revisar_comisiones_gerencia,
+        name="revisar_comisiones_gerencia",
+    ),
     # Vista activa del comercial.
     path("mis_ventas/", views.mis_ventas, name="mis_ventas"),
+    path(
+        "mis_ventas/resultados/",
+        views.mis_ventas_resultados,
+        name="mis_ventas_resultados",
+    ),
+    path(
+        "mis_ventas/seleccion/",
+        views.seleccionar_mis_ventas,
+        name="seleccionar_mis_ventas",
+    ),
     path("mis_ventas/exportar/", views.exportar_mis_ventas, name="exportar_mis_ventas"),
+    path(
+        "mis_ventas/exportaciones/",
+        views.solicitar_exportacion_mis_ventas,
+        name="solicitar_exportacion_mis_ventas",
+    ),
+    path(
+        "mis_ventas/exportaciones/<int:exportacion_id>/",
+        views.estado_exportacion_mis_ventas,
+        name="estado_exportacion_mis_ventas",
+    ),
+    path(
+        "mis_ventas/exportaciones/<int:exportacion_id>/descargar/",
+        views.descargar_exportacion_mis_ventas,
+        name="descargar_exportacion_mis_ventas",
+    ),
     # Vistas de incidencias del comercial.
     path("mis_incidencias/", views.mis_incidencias, name="mis_incidencias"),
+    path(
+        "mis_incidencias/resultados/",
+        views.mis_incidencias_resultados,
+        name="mis_incidencias_resultados",
+    ),
     path("boletin/", views.mis_comunicaciones, name="boletin"),
     path(
         "mis_comunicaciones/",
         views.mis_comunicaciones,
         name="mis_comunicaciones",
     ),
+    path(
+        "mis_comunicaciones/resultados/",
+        views.mis_comunicaciones_resultados,
+        name="mis_comunicaciones_resultados",
+    ),
     path("normativas/", views.normativas, name="normativas"),
     path("manuales/", views.manuales, name="manuales"),
     path("avisos_sin_leer/", views.avisos_sin_leer, name="avisos_sin_leer"),
@@ -45,4 +90,12 @@ urlpatterns = [
     ),
     path("mi_perfil/", views.mi_perfil, name="mi_perfil"),
     path("incidencias/", views.incidencias_gerencia, name="incidencias_gerencia"),
+    path(
+        "incidencias/revision/",
+        views.revisar_incidencias_gerencia,
+        name="revisar_incidencias_gerencia",
+    ),
+    # Resumen mensual por subordinado para jefes de ventas, gerentes y directores.
+    path("equipo/", views.mi_equipo, name="mi_equipo"),
+    path("equipo/resumen/", views.mi_equipo_resumen, name="mi_equipo_resumen"),
 ]
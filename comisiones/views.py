@@ -1,23 +1,63 @@
 ﻿from calendar import monthrange
 from datetime import date
-from io import BytesIO
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.db.models import Q, Sum, CharField
-from django.db.models.functions import Cast
-from django.http import FileResponse, HttpResponse
+from django.db import transaction
+from django.db.models import Case, Count, Exists, OuterRef, Q, Subquery, Sum, Value, When
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
 
-import csv
+import os
+import tempfile
 
-from openpyxl import Workbook
-from openpyxl.styles import Font
 from django.utils import timezone
-
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_POST
+
+from .busqueda import ids_usuarios, ids_ventas
+from .contexto_usuario import contexto_usuario
+from .correos import avisar_nueva_incidencia
+from .equipo import resumen_equipo
+from .exportaciones import (
+    EXPORT_CHUNK_SIZE,
+    EXPORT_EXCEL_SPOOL_BYTES,
+    crear_exportacion,
+    escribir_excel_ventas,
+    lineas_csv_ventas,
+)
+from .facetas import calcular_facetas, opciones_con_etiqueta
 from .forms import MiPerfilEditableForm
-from .models import Boletin, Comision, Incidencia, LecturaBoletin, Perfil, Venta
+from .models import (
+    Boletin,
+    Comision,
+    ExportacionVentas,
+    Incidencia,
+    Instalacion,
+    LecturaBoletin,
+    Perfil,
+    ResumenMensualVentas,
+    RevisionMasiva,
+    Venta,
+)
+from .paginacion import orden_keyset, paginar_keyset, posicion_keyset, vecinos_keyset
+from .revision import ACCIONES, aplicar_revision, comisiones_de_ventas
+from .selecciones import (
+    MODO_FILTROS,
+    MODO_IDS,
+    MODOS,
+    guardar_seleccion,
+    obtener_seleccion,
+)
+
+RESULTADOS_POR_PAGINA = 25
 
 # Envio de correo temporalmente desactivado:
 # import logging
@@ -29,10 +69,7 @@ from .models import Boletin, Comision, Incidencia, LecturaBoletin, Perfil, Venta
 
 
 def _es_gerencia(user):
-    return (
-        user.is_superuser
-        or user.groups.filter(name__in=["Gerente", "Director Comercial"]).exists()
-    )
+    return contexto_usuario(user).es_gerencia
 
 
 def _contexto_base_usuario(request, perfil):
@@ -43,21 +80,12 @@ def _contexto_base_usuario(request, perfil):
         "sede": perfil.sede,
         "foto_perfil_url": perfil.foto_perfil.url if perfil.foto_perfil else "",
         "ultima_conexion": request.user.last_login,
+        "es_mando": contexto_usuario(request.user).es_mando,
     }
 
 
 def _rol_usuario(user):
-    prioridad = [
-        "Director Comercial",
-        "Gerente",
-        "Jefe de ventas",
-        "Vendedor",
-    ]
-    grupos = set(user.groups.values_list("name", flat=True))
-    for rol in prioridad:
-        if rol in grupos:
-            return rol
-    return "Usuario"
+    return contexto_usuario(user).rol
 
 
 def _nombre_usuario(user, default="--"):
@@ -67,7 +95,7 @@ def _nombre_usuario(user, default="--"):
 
 
 def _obtener_perfil(user):
-    return Perfil.objects.get_or_create(user=user)[0]
+    return contexto_usuario(user).perfil
 
 
 def _resolver_orden_generico(sort_by_param, sort_dir_param, default_sort, campos_validos):
@@ -126,6 +154,18 @@ def _parse_iso_date(value):
         return date.fromisoformat(value)
     except ValueError:
         return None
+
+
+def _parse_iso_datetime(value):
+    """Fecha y hora ISO con zona horaria (la actual si no trae); `None` si no es valida."""
+    try:
+        valor = parse_datetime((value or "").strip())
+    except ValueError:
+        # Bien formada pero imposible, p. ej. `2026-13-40T00:00`.
+        return None
+    if valor is not None and timezone.is_naive(valor):
+        valor = timezone.make_aware(valor)
+    return valor
 
 
 def _parse_year_month(value):
@@ -250,14 +290,26 @@ def _ventas_periodo_qs_usuario(user, fecha_desde_date, fecha_hasta_date):
     return qs
 
 
-def _extraer_filtros_ventas_desde_request(request):
+FILTROS_VENTAS = (
+    "matricula",
+    "idv",
+    "tipo_venta",
+    "dni",
+    "tipo_cliente",
+    "nombre_cliente",
+)
+
+
+def _extraer_filtros_ventas(params):
+    return {nombre: params.get(nombre, "").strip() for nombre in FILTROS_VENTAS}
+
+
+def _parametros_filtro_ventas(params):
+    """Periodo y filtros no vacios de la querystring, sin orden ni paginacion."""
     return {
-        "matricula": request.GET.get("matricula", "").strip(),
-        "idv": request.GET.get("idv", "").strip(),
-        "tipo_venta": request.GET.get("tipo_venta", "").strip(),
-        "dni": request.GET.get("dni", "").strip(),
-        "tipo_cliente": request.GET.get("tipo_cliente", "").strip(),
-        "nombre_cliente": request.GET.get("nombre_cliente", "").strip(),
+        nombre: params.get(nombre, "").strip()
+        for nombre in ("desde", "hasta", *FILTROS_VENTAS)
+        if params.get(nombre, "").strip()
     }
 
 
@@ -309,96 +361,97 @@ def _resolver_orden_ventas(sort_by_param, sort_dir_param):
 
 def _aplicar_orden_ventas_qs(ventas_qs, sort_by, sort_dir, campos_ordenables):
     campo_orden = campos_ordenables[sort_by]
-    prefijo = "" if sort_dir == "asc" else "-"
-    orden = [f"{prefijo}{campo_orden}"]
-    if campo_orden != "id":
-        orden.append("id" if sort_dir == "asc" else "-id")
-    return ventas_qs.order_by(*orden)
+    return ventas_qs.order_by(*orden_keyset(campo_orden, sort_dir))
+
+
+def _listado_ventas(usuario, params):
+    """Resuelve periodo, filtros y orden de `Mis Ventas` desde `params` (querystring)."""
+    fecha_desde, fecha_hasta, fecha_desde_date, fecha_hasta_date = _resolve_month_range(
+        params.get("desde"), params.get("hasta"), default_to_current=True
+    )
+    ventas_periodo_qs = _ventas_periodo_qs_usuario(
+        usuario, fecha_desde_date, fecha_hasta_date
+    )
+    filtros = _extraer_filtros_ventas(params)
+    sort_by, sort_dir, campos_ordenables = _resolver_orden_ventas(
+        params.get("sort", "fecha"),
+        params.get("dir", "desc"),
+    )
+    ventas_qs = _aplicar_filtros_ventas_qs(ventas_periodo_qs, filtros)
+    ventas_qs = _aplicar_orden_ventas_qs(ventas_qs, sort_by, sort_dir, campos_ordenables)
+    return {
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "ventas_periodo_qs": ventas_periodo_qs,
+        "filtros": filtros,
+        "sort_by": sort_by,
+        "sort_dir": sort_dir,
+        "campos_ordenables": campos_ordenables,
+        "ventas_qs": ventas_qs,
+    }
+
+
+def _listado_ventas_desde_request(request):
+    return _listado_ventas(request.user, request.GET)
+
+
+def _pagina_listado(request, queryset, campo_orden, sort_dir):
+    return paginar_keyset(
+        queryset,
+        campo_orden,
+        sort_dir,
+        request.GET.get("cursor"),
+        RESULTADOS_POR_PAGINA,
+    )
+
+
+def _respuesta_fragmento_resultados(
+    request, template_name, context, filas, total, cursor
+):
+    """Respuesta JSON con solo las filas de una pagina y los totales del listado."""
+    return JsonResponse(
+        {
+            "html": render_to_string(template_name, context, request=request),
+            "filas": len(filas),
+            "total_resultados": total,
+            "siguiente_cursor": cursor,
+        }
+    )
 
 
 def _respuesta_export_ventas_csv(ventas_qs):
-    response = HttpResponse(content_type="text/csv; charset=utf-8")
+    # Se envia en streaming: la memoria no crece con el numero de ventas.
+    response = StreamingHttpResponse(
+        lineas_csv_ventas(ventas_qs.iterator(chunk_size=EXPORT_CHUNK_SIZE)),
+        content_type="text/csv; charset=utf-8",
+    )
     timestamp = timezone.localtime().strftime("%Y%m%d_%H%M%S")
     response["Content-Disposition"] = (
         f'attachment; filename="mis_ventas_{timestamp}.csv"'
     )
-    response.write("\ufeff")
-
-    writer = csv.writer(response, delimiter=";")
-    writer.writerow(
-        [
-            "Matricula",
-            "Fecha",
-            "IDV",
-            "Tipo venta",
-            "UD financiadas",
-            "DNI",
-            "Tipo cliente",
-            "Nombre cliente",
-        ]
-    )
-    for venta in ventas_qs:
-        writer.writerow(
-            [
-                venta.matricula or "--",
-                venta.fecha_venta.strftime("%d/%m/%Y") if venta.fecha_venta else "--",
-                venta.idv if venta.idv is not None else "--",
-                venta.get_tipo_venta_display() or "--",
-                venta.ud_financiadas if venta.ud_financiadas is not None else "--",
-                venta.dni or "--",
-                venta.get_tipo_cliente_display() or "--",
-                venta.nombre_cliente or "--",
-            ]
-        )
     return response
 
 
 def _respuesta_export_ventas_excel(ventas_qs):
     timestamp = timezone.localtime().strftime("%Y%m%d_%H%M%S")
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = (
-        f'attachment; filename="mis_ventas_{timestamp}.xlsx"'
-    )
 
-    workbook = Workbook()
-    sheet = workbook.active
-    sheet.title = "Mis Ventas"
-
-    headers = [
-        "Matricula",
-        "Fecha",
-        "IDV",
-        "Tipo venta",
-        "UD financiadas",
-        "DNI",
-        "Tipo cliente",
-        "Nombre cliente",
-    ]
-    sheet.append(headers)
-    for cell in sheet[1]:
-        cell.font = Font(bold=True)
-
-    for venta in ventas_qs:
-        sheet.append(
-            [
-                venta.matricula or "--",
-                venta.fecha_venta.strftime("%d/%m/%Y") if venta.fecha_venta else "--",
-                venta.idv if venta.idv is not None else "--",
-                venta.get_tipo_venta_display() or "--",
-                venta.ud_financiadas if venta.ud_financiadas is not None else "--",
-                venta.dni or "--",
-                venta.get_tipo_cliente_display() or "--",
-                venta.nombre_cliente or "--",
-            ]
+    # Hasta EXPORT_EXCEL_SPOOL_BYTES el fichero vive en memoria; por encima se
+    # pasa a disco. FileResponse lo envia por bloques y lo cierra al terminar.
+    output = tempfile.SpooledTemporaryFile(max_size=EXPORT_EXCEL_SPOOL_BYTES)
+    try:
+        escribir_excel_ventas(
+            ventas_qs.iterator(chunk_size=EXPORT_CHUNK_SIZE), output
         )
-
-    output = BytesIO()
-    workbook.save(output)
+    except Exception:
+        output.close()
+        raise
     output.seek(0)
-    response.write(output.getvalue())
-    return response
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=f"mis_ventas_{timestamp}.xlsx",
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
 
 
 def _registrar_lectura_boletin(boletin, usuario):
@@ -431,142 +484,62 @@ def descargar_boletin_mock(request, boletin_id):
     return response
 
 
-def _enviar_correo_nueva_incidencia(incidencia):
-    destinatario = getattr(settings, "INCIDENCIAS_EMAIL_TO", "").strip()
-    if not destinatario:
-        destinatario = (
-            incidencia.reportado_por.email
-            if incidencia.reportado_por and incidencia.reportado_por.email
-            else "test@local.test"
-        )
-
-    usuario = (
-        incidencia.reportado_por.get_full_name().strip()
-        if incidencia.reportado_por
-        else ""
-    ) or (incidencia.reportado_por.username if incidencia.reportado_por else "Sin usuario")
-
-    asunto = f"Nueva incidencia registrada - {incidencia.matricula_display}"
-    cuerpo = (
-        "Se ha registrado una nueva incidencia.\n\n"
-        f"Usuario: {usuario}\n"
-        f"Fecha incidencia: {incidencia.fecha_incidencia:%d/%m/%Y}\n"
-        f"Matricula: {incidencia.matricula_display}\n"
-        f"Tipo: {incidencia.tipo}\n"
-        f"Estado: {incidencia.get_estado_display()}\n\n"
-        f"Detalle:\n{incidencia.detalle}\n"
-    )
-    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", "") or "no-reply@local.test"
-
-    send_mail(
-        subject=asunto,
-        message=cuerpo,
-        from_email=from_email,
-        recipient_list=[destinatario],
-        fail_silently=False,
-    )
-
-
 @login_required
 def mis_ventas(request):
 
     # Por defecto se muestra el mes actual
-    fecha_desde, fecha_hasta, fecha_desde_date, fecha_hasta_date = _resolve_month_range(
-        request.GET.get("desde"), request.GET.get("hasta"), default_to_current=True
-    )
-
-    # Se obtienen las ventas del usuario en el rango de fechas seleccionado.
-    ventas_periodo_qs = _ventas_periodo_qs_usuario(
-        request.user, fecha_desde_date, fecha_hasta_date
-    ).order_by("-fecha_venta", "-id")
-
-    # Se generan las opciones únicas para los filtros de búsqueda en base a las ventas obtenidas, asegurando que no haya valores vacíos ni duplicados.
-
-    matriculas_opciones = list(
-        ventas_periodo_qs.exclude(matricula__isnull=True)
-        .exclude(matricula="")
-        .values_list("matricula", flat=True)
-        .distinct()
-        .order_by("matricula")
-    )
-
-    idv_opciones = list(
-        ventas_periodo_qs.exclude(idv__isnull=True)
-        .annotate(idv_str=Cast("idv", output_field=CharField()))
-        .values_list("idv_str", flat=True)
-        .distinct()
-        .order_by("idv_str")
-    )
-
-    tipo_venta_codes = list(
-        ventas_periodo_qs.exclude(tipo_venta__isnull=True)
-        .exclude(tipo_venta="")
-        .values_list("tipo_venta", flat=True)
-        .distinct()
-        .order_by("tipo_venta")
-    )
-
-    dni_opciones = list(
-        ventas_periodo_qs.exclude(dni__isnull=True)
-        .exclude(dni="")
-        .values_list("dni", flat=True)
-        .distinct()
-        .order_by("dni")
-    )
-
-    tipo_cliente_codes = list(
-        ventas_periodo_qs.exclude(tipo_cliente__isnull=True)
-        .exclude(tipo_cliente="")
-        .values_list("tipo_cliente", flat=True)
-        .distinct()
-        .order_by("tipo_cliente")
-    )
-
-    nombre_cliente_opciones = list(
-        ventas_periodo_qs.exclude(nombre_cliente__isnull=True)
-        .exclude(nombre_cliente="")
-        .values_list("nombre_cliente", flat=True)
-        .distinct()
-        .order_by("nombre_cliente")
-    )
-
-    tipo_venta_dict = dict(Venta.TIPO_VENTA_CHOICES)
-    tipo_cliente_dict = dict(Venta.TIPO_CLIENTE_CHOICES)
-    tipo_venta_opciones = [
-        {"value": code, "label": tipo_venta_dict.get(code, code)}
-        for code in tipo_venta_codes
-    ]
-    tipo_cliente_opciones = [
-        {"value": code, "label": tipo_cliente_dict.get(code, code)}
-        for code in tipo_cliente_codes
-    ]
-
-    filtros = _extraer_filtros_ventas_desde_request(request)
-
-    ventas_qs = _aplicar_filtros_ventas_qs(ventas_periodo_qs, filtros)
-    sort_by, sort_dir, campos_ordenables = _resolver_orden_ventas(
-        request.GET.get("sort", "fecha"),
-        request.GET.get("dir", "desc"),
+    listado = _listado_ventas_desde_request(request)
+    fecha_desde = listado["fecha_desde"]
+    fecha_hasta = listado["fecha_hasta"]
+
+    # Se generan las opciones únicas para los filtros de búsqueda en una sola consulta sobre las ventas del periodo.
+    facetas = calcular_facetas(
+        listado["ventas_periodo_qs"],
+        {
+            "matricula": "matricula",
+            "idv": "idv",
+            "tipo_venta": "tipo_venta",
+            "dni": "dni",
+            "tipo_cliente": "tipo_cliente",
+            "nombre_cliente": "nombre_cliente",
+        },
+    )
+    matriculas_opciones = facetas["matricula"]
+    idv_opciones = facetas["idv"]
+    dni_opciones = facetas["dni"]
+    nombre_cliente_opciones = facetas["nombre_cliente"]
+    tipo_venta_opciones = opciones_con_etiqueta(
+        facetas["tipo_venta"], Venta.TIPO_VENTA_CHOICES
+    )
+    tipo_cliente_opciones = opciones_con_etiqueta(
+        facetas["tipo_cliente"], Venta.TIPO_CLIENTE_CHOICES
     )
-    ventas_qs = _aplicar_orden_ventas_qs(ventas_qs, sort_by, sort_dir, campos_ordenables)
 
+    filtros = listado["filtros"]
+    sort_by = listado["sort_by"]
+    sort_dir = listado["sort_dir"]
+    ventas_qs = listado["ventas_qs"]
+
     siguiente_direccion = _siguiente_direccion_por_campo(
-        campos_ordenables, sort_by, sort_dir
+        listado["campos_ordenables"], sort_by, sort_dir
+    )
+
+    total_resultados = ventas_qs.count()
+    ventas, siguiente_cursor = _pagina_listado(
+        request, ventas_qs, listado["campos_ordenables"][sort_by], sort_dir
     )
-
-    ventas = list(ventas_qs)
-    total_resultados = len(ventas)
     ym_referencia = _parse_year_month(fecha_hasta) or (date.today().year, date.today().month)
     if ym_referencia[1] == 1:
         ym_mes_anterior = (ym_referencia[0] - 1, 12)
     else:
         ym_mes_anterior = (ym_referencia[0], ym_referencia[1] - 1)
-    mes_anterior_desde, mes_anterior_hasta = _year_month_bounds(ym_mes_anterior)
-    ventas_mes_anterior = Venta.objects.filter(
-        usuario=request.user,
-        fecha_venta__gte=mes_anterior_desde,
-        fecha_venta__lte=mes_anterior_hasta,
-    ).count()
+    # Los KPI salen de la tabla de resumenes mensuales en lugar de agregar ventas.
+    resumen_mes_anterior = ResumenMensualVentas.objects.filter(
+        usuario=request.user, anio=ym_mes_anterior[0], mes=ym_mes_anterior[1]
+    ).first()
+    ventas_mes_anterior = (
+        resumen_mes_anterior.ventas_total if resumen_mes_anterior else 0
+    )
     delta_mes_anterior = total_resultados - ventas_mes_anterior
     if ventas_mes_anterior > 0:
         delta_mes_anterior_pct = (delta_mes_anterior / ventas_mes_anterior) * 100
@@ -585,11 +558,19 @@ def mis_ventas(request):
         delta_mes_anterior_estado = "neutral"
         delta_mes_anterior_arrow = "flat"
     mes_anterior_label = _format_year_month_label(_format_year_month(ym_mes_anterior))
-    initial_visible_rows = 25
-    initial_visible_count = min(total_resultados, initial_visible_rows)
-    total_comision_aprobada = Comision.objects.filter(
-        venta__in=ventas_qs, estado="aprobada"
-    ).aggregate(total=Sum("monto"))["total"]
+    initial_visible_rows = RESULTADOS_POR_PAGINA
+    initial_visible_count = len(ventas)
+    if any(filtros.values()):
+        # Con filtros por columna el resumen mensual no aplica.
+        total_comision_aprobada = Comision.objects.filter(
+            venta__in=ventas_qs, estado="aprobada"
+        ).aggregate(total=Sum("monto"))["total"]
+    else:
+        total_comision_aprobada = ResumenMensualVentas.del_periodo(
+            request.user,
+            _parse_year_month(fecha_desde),
+            _parse_year_month(fecha_hasta),
+        ).aggregate(total=Sum("comision_aprobada"))["total"]
     comision_aprobada = (
         f"{total_comision_aprobada:,.2f}".replace(",", "X")
         .replace(".", ",")
@@ -643,6 +624,7 @@ def mis_ventas(request):
         "total_resultados": total_resultados,
         "initial_visible_rows": initial_visible_rows,
         "initial_visible_count": initial_visible_count,
+        "siguiente_cursor": siguiente_cursor,
         "active_filters": active_filters,
         "filtros": filtros,
         "matriculas_opciones": matriculas_opciones,
@@ -660,102 +642,197 @@ def mis_ventas(request):
 
 
 @login_required
-def exportar_mis_ventas(request):
-    formato = (request.GET.get("formato", "csv") or "csv").strip().lower()
-    if formato not in {"csv", "excel"}:
-        formato = "csv"
-
-    fecha_desde, fecha_hasta, fecha_desde_date, fecha_hasta_date = _resolve_month_range(
-        request.GET.get("desde"), request.GET.get("hasta"), default_to_current=True
+def mis_ventas_resultados(request):
+    listado = _listado_ventas_desde_request(request)
+    ventas_qs = listado["ventas_qs"]
+    ventas, siguiente_cursor = _pagina_listado(
+        request,
+        ventas_qs,
+        listado["campos_ordenables"][listado["sort_by"]],
+        listado["sort_dir"],
     )
-    filtros = _extraer_filtros_ventas_desde_request(request)
-    ventas_qs = _ventas_periodo_qs_usuario(request.user, fecha_desde_date, fecha_hasta_date)
-    ventas_qs = _aplicar_filtros_ventas_qs(ventas_qs, filtros)
-    sort_by, sort_dir, campos_ordenables = _resolver_orden_ventas(
-        request.GET.get("sort", "fecha"),
-        request.GET.get("dir", "desc"),
+    return _respuesta_fragmento_resultados(
+        request,
+        "comisiones/mis_ventas_filas.html",
+        {"ventas": ventas},
+        ventas,
+        ventas_qs.count(),
+        siguiente_cursor,
     )
-    ventas_qs = _aplicar_orden_ventas_qs(ventas_qs, sort_by, sort_dir, campos_ordenables)
 
-    selected_ids = _parse_selected_ids(request.GET.get("selected_ids", ""))
-    if not selected_ids:
+
+@login_required
+@require_POST
+def seleccionar_mis_ventas(request):
+    """Guarda en sesion la seleccion a exportar y devuelve su token.
+
+    Los filtros llegan en la querystring; en el cuerpo, `modo=ids` con `ids`
+    o `modo=filtros` con los `excluidos` de "seleccionar todo".
+    """
+    modo = request.POST.get("modo", MODO_IDS)
+    if modo not in MODOS:
         return HttpResponse(
-            "Debes seleccionar al menos una venta para exportar.",
+            "Modo de seleccion no valido.",
             status=400,
             content_type="text/plain; charset=utf-8",
         )
-    ventas_qs = ventas_qs.filter(id__in=selected_ids)
 
-    ventas_qs = list(ventas_qs)
+    parametros = _parametros_filtro_ventas(request.GET)
+    ventas_qs = _listado_ventas(request.user, parametros)["ventas_qs"]
+    if modo == MODO_FILTROS:
+        excluidos = _parse_selected_ids(request.POST.get("excluidos", ""))
+        total = ventas_qs.exclude(id__in=excluidos).count()
+        token = guardar_seleccion(
+            request.session, modo, parametros, excluidos=excluidos
+        )
+    else:
+        ids = _parse_selected_ids(request.POST.get("ids", ""))
+        total = ventas_qs.filter(id__in=ids).count() if ids else 0
+        token = guardar_seleccion(request.session, modo, parametros, ids=ids)
+
+    if not total:
+        return _respuesta_export_sin_seleccion()
+    return JsonResponse({"seleccion": token, "total": total})
+
+
+def _export_ventas_desde_request(request):
+    """Devuelve `(formato, parametros, ventas_qs)`; `ventas_qs` es `None` sin seleccion.
+
+    El periodo y los filtros salen de la seleccion guardada; de la peticion
+    solo se toma el orden.
+    """
+    formato = (request.GET.get("formato", "csv") or "csv").strip().lower()
+    if formato not in {"csv", "excel"}:
+        formato = "csv"
+
+    seleccion = obtener_seleccion(request.session, request.GET.get("seleccion"))
+    if seleccion is None:
+        return formato, {}, None
+
+    parametros = dict(seleccion["parametros"])
+    for nombre in ("sort", "dir"):
+        if request.GET.get(nombre):
+            parametros[nombre] = request.GET[nombre]
+    ventas_qs = _listado_ventas(request.user, parametros)["ventas_qs"]
+    if seleccion["modo"] == MODO_FILTROS:
+        if seleccion["excluidos"]:
+            ventas_qs = ventas_qs.exclude(id__in=seleccion["excluidos"])
+    else:
+        ventas_qs = ventas_qs.filter(id__in=seleccion["ids"])
+    parametros["seleccion"] = seleccion["modo"]
+    return formato, parametros, ventas_qs
+
+
+def _respuesta_export_sin_seleccion():
+    return HttpResponse(
+        "Debes seleccionar al menos una venta para exportar.",
+        status=400,
+        content_type="text/plain; charset=utf-8",
+    )
+
+
+@login_required
+def exportar_mis_ventas(request):
+    formato, _, ventas_qs = _export_ventas_desde_request(request)
+    if ventas_qs is None:
+        return _respuesta_export_sin_seleccion()
+
     if formato == "excel":
         return _respuesta_export_ventas_excel(ventas_qs)
     return _respuesta_export_ventas_csv(ventas_qs)
 
 
+def _estado_exportacion_json(exportacion):
+    url_descarga = ""
+    if exportacion.estado == ExportacionVentas.ESTADO_COMPLETADA:
+        url_descarga = reverse(
+            "descargar_exportacion_mis_ventas", args=[exportacion.pk]
+        )
+    return {
+        "id": exportacion.pk,
+        "formato": exportacion.formato,
+        "estado": exportacion.estado,
+        "estado_display": exportacion.get_estado_display(),
+        "filas_totales": exportacion.filas_totales,
+        "filas_procesadas": exportacion.filas_procesadas,
+        "progreso": exportacion.progreso,
+        "url_estado": reverse("estado_exportacion_mis_ventas", args=[exportacion.pk]),
+        "url_descarga": url_descarga,
+    }
+
+
 @login_required
-def mis_incidencias(request):
+@require_POST
+def solicitar_exportacion_mis_ventas(request):
+    """Encola la exportacion; recibe los mismos parametros que la descarga directa."""
+    formato, parametros, ventas_qs = _export_ventas_desde_request(request)
+    if ventas_qs is None:
+        return _respuesta_export_sin_seleccion()
+
+    exportacion = crear_exportacion(request.user, formato, parametros, ventas_qs)
+    return JsonResponse(_estado_exportacion_json(exportacion), status=202)
 
+
+@login_required
+def estado_exportacion_mis_ventas(request, exportacion_id):
+    exportacion = get_object_or_404(
+        ExportacionVentas, pk=exportacion_id, usuario=request.user
+    )
+    return JsonResponse(_estado_exportacion_json(exportacion))
+
+
+@login_required
+def descargar_exportacion_mis_ventas(request, exportacion_id):
+    exportacion = get_object_or_404(
+        ExportacionVentas,
+        pk=exportacion_id,
+        usuario=request.user,
+        estado=ExportacionVentas.ESTADO_COMPLETADA,
+    )
+    if not exportacion.archivo:
+        raise Http404("La exportacion ya no esta disponible.")
+    return FileResponse(
+        exportacion.archivo.open("rb"),
+        as_attachment=True,
+        filename=os.path.basename(exportacion.archivo.name),
+    )
+
+
+def _listado_incidencias_desde_request(request):
+    """Resuelve periodo, filtros y orden de `Mis Incidencias` desde la querystring."""
     fecha_desde, fecha_hasta, fecha_desde_date, fecha_hasta_date = _resolve_month_range(
         request.GET.get("desde"), request.GET.get("hasta"), default_to_current=True
     )
-    perfil = _obtener_perfil(request.user)
-    incidencias_periodo_qs = Incidencia.objects.filter(
-        reportado_por=request.user
-    ).prefetch_related("ventas")
-    if fecha_desde_date:
-        incidencias_periodo_qs = incidencias_periodo_qs.filter(
-            fecha_incidencia__gte=fecha_desde_date
-        )
+    incidencias_periodo_qs = Incidencia.objects.filter(reportado_por=request.user)
+    if fecha_desde_date:
+        incidencias_periodo_qs = incidencias_periodo_qs.filter(
+            fecha_incidencia__gte=fecha_desde_date
+        )
     if fecha_hasta_date:
         incidencias_periodo_qs = incidencias_periodo_qs.filter(
             fecha_incidencia__lte=fecha_hasta_date
         )
-
-    matriculas_opciones = []
-    if incidencias_periodo_qs.filter(es_general=True).exists():
-        matriculas_opciones.append("GENERAL")
-    matriculas_opciones.extend(
-        list(
-            Venta.objects.filter(incidencias__in=incidencias_periodo_qs)
-            .exclude(matricula__isnull=True)
-            .exclude(matricula="")
-            .values_list("matricula", flat=True)
-            .distinct()
-            .order_by("matricula")
-        )
-    )
-
-    estado_codes = list(
-        incidencias_periodo_qs.exclude(estado__isnull=True)
-        .exclude(estado="")
-        .values_list("estado", flat=True)
-        .distinct()
-        .order_by("estado")
-    )
-    estado_dict = dict(Incidencia.ESTADOS)
-    estado_opciones = [
-        {"value": code, "label": estado_dict.get(code, code)} for code in estado_codes
-    ]
-
-    filtros = {
-        "matricula": request.GET.get("matricula", "").strip(),
-        "estado": request.GET.get("estado", "").strip(),
-    }
-
-    incidencias = incidencias_periodo_qs
-
-    if filtros["matricula"]:
-        matricula_val = filtros["matricula"]
-        condicion_matricula = Q(ventas__matricula__icontains=matricula_val)
-        if "general" in matricula_val.lower():
-            condicion_matricula |= Q(es_general=True)
-        incidencias = incidencias.filter(condicion_matricula).distinct()
-
-    if filtros["estado"] in estado_codes:
-        incidencias = incidencias.filter(estado=filtros["estado"])
-    else:
-        filtros["estado"] = ""
-
+
+    filtros = {
+        "matricula": request.GET.get("matricula", "").strip(),
+        "estado": request.GET.get("estado", "").strip(),
+    }
+
+    incidencias_qs = incidencias_periodo_qs
+
+    if filtros["matricula"]:
+        incidencias_qs = incidencias_qs.filter(
+            matriculas__icontains=filtros["matricula"]
+        )
+
+    # Un estado que no aparece en el periodo se ignora, igual que en el desplegable.
+    if filtros["estado"] and (
+        incidencias_periodo_qs.filter(estado=filtros["estado"]).exists()
+    ):
+        incidencias_qs = incidencias_qs.filter(estado=filtros["estado"])
+    else:
+        filtros["estado"] = ""
+
     campos_ordenables = {"matricula", "fecha", "tipo", "detalle", "estado"}
     sort_by, sort_dir = _resolver_orden_generico(
         sort_by_param=request.GET.get("sort", "fecha"),
@@ -763,38 +840,71 @@ def mis_incidencias(request):
         default_sort="fecha",
         campos_validos=campos_ordenables,
     )
-
-    reverse_order = sort_dir == "desc"
-    if sort_by == "matricula":
-        incidencias = list(incidencias)
-        incidencias = sorted(
-            incidencias,
-            key=lambda item: (item.matricula_display.lower(), item.id),
-            reverse=reverse_order,
-        )
-    else:
-        campos_orden_db = {
-            "fecha": "fecha_incidencia",
-            "tipo": "tipo",
-            "detalle": "detalle",
-            "estado": "estado",
-        }
-        campo_orden = campos_orden_db.get(sort_by, "fecha_incidencia")
-        prefijo = "" if sort_dir == "asc" else "-"
-        incidencias = incidencias.order_by(
-            f"{prefijo}{campo_orden}", "id" if sort_dir == "asc" else "-id"
-        )
-
+
+    campos_orden_db = {
+        "matricula": "matriculas",
+        "fecha": "fecha_incidencia",
+        "tipo": "tipo",
+        "detalle": "detalle",
+        "estado": "estado",
+    }
+    campo_orden = campos_orden_db[sort_by]
+    incidencias_qs = incidencias_qs.order_by(*orden_keyset(campo_orden, sort_dir))
+
+    return {
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "incidencias_periodo_qs": incidencias_periodo_qs,
+        "filtros": filtros,
+        "campos_ordenables": campos_ordenables,
+        "sort_by": sort_by,
+        "sort_dir": sort_dir,
+        "campo_orden": campo_orden,
+        "incidencias_qs": incidencias_qs,
+    }
+
+
+def _pagina_incidencias(request, listado):
+    """Devuelve `(incidencias, siguiente_cursor, total_resultados)`."""
+    incidencias_qs = listado["incidencias_qs"]
+    pagina, siguiente_cursor = _pagina_listado(
+        request, incidencias_qs, listado["campo_orden"], listado["sort_dir"]
+    )
+    return pagina, siguiente_cursor, incidencias_qs.count()
+
+
+@login_required
+def mis_incidencias(request):
+
+    listado = _listado_incidencias_desde_request(request)
+    fecha_desde = listado["fecha_desde"]
+    fecha_hasta = listado["fecha_hasta"]
+    perfil = _obtener_perfil(request.user)
+    facetas = calcular_facetas(
+        listado["incidencias_periodo_qs"],
+        {
+            "general": Case(When(es_general=True, then=Value("GENERAL"))),
+            "matricula": "ventas__matricula",
+            "estado": "estado",
+        },
+    )
+    matriculas_opciones = [*facetas["general"], *facetas["matricula"]]
+    estado_dict = dict(Incidencia.ESTADOS)
+    estado_opciones = opciones_con_etiqueta(facetas["estado"], Incidencia.ESTADOS)
+
+    filtros = listado["filtros"]
+    sort_by = listado["sort_by"]
+    sort_dir = listado["sort_dir"]
+
     siguiente_direccion = _siguiente_direccion_por_campo(
-        campos_ordenables, sort_by, sort_dir
+        listado["campos_ordenables"], sort_by, sort_dir
     )
 
-    if isinstance(incidencias, list):
-        total_resultados = len(incidencias)
-    else:
-        total_resultados = incidencias.count()
-    initial_visible_rows = 25
-    initial_visible_count = min(total_resultados, initial_visible_rows)
+    incidencias, siguiente_cursor, total_resultados = _pagina_incidencias(
+        request, listado
+    )
+    initial_visible_rows = RESULTADOS_POR_PAGINA
+    initial_visible_count = len(incidencias)
 
     current_month = _format_year_month((date.today().year, date.today().month))
     active_filters = []
@@ -829,6 +939,7 @@ def mis_incidencias(request):
         "total_resultados": total_resultados,
         "initial_visible_rows": initial_visible_rows,
         "initial_visible_count": initial_visible_count,
+        "siguiente_cursor": siguiente_cursor,
         "active_filters": active_filters,
         "filtros": filtros,
         "matriculas_opciones": matriculas_opciones,
@@ -838,11 +949,34 @@ def mis_incidencias(request):
         "siguiente_direccion": siguiente_direccion,
     }
     return render(request, "comisiones/incidencias_personales.html", context)
+
+
+@login_required
+def mis_incidencias_resultados(request):
+    listado = _listado_incidencias_desde_request(request)
+    incidencias, siguiente_cursor, total_resultados = _pagina_incidencias(
+        request, listado
+    )
+    context = {
+        "fecha_desde": listado["fecha_desde"],
+        "fecha_hasta": listado["fecha_hasta"],
+        "filtros": listado["filtros"],
+        "sort_by": listado["sort_by"],
+        "sort_dir": listado["sort_dir"],
+        "incidencias": incidencias,
+    }
+    return _respuesta_fragmento_resultados(
+        request,
+        "comisiones/incidencias_personales_filas.html",
+        context,
+        incidencias,
+        total_resultados,
+        siguiente_cursor,
+    )
 
 
-@login_required
-def mis_comunicaciones(request):
-    perfil = _obtener_perfil(request.user)
+def _listado_comunicaciones_desde_request(request):
+    """Resuelve periodo, filtros y orden de `Mis Comunicaciones` desde la querystring."""
     fecha_desde, fecha_hasta, fecha_desde_date, fecha_hasta_date = _resolve_month_range(
         request.GET.get("desde"), request.GET.get("hasta"), default_to_current=True
     )
@@ -856,21 +990,6 @@ def mis_comunicaciones(request):
             fecha__lte=fecha_hasta_date
         )
 
-    marcas_opciones = list(
-        comunicaciones_periodo_qs.exclude(marca__isnull=True)
-        .exclude(marca="")
-        .values_list("marca", flat=True)
-        .distinct()
-        .order_by("marca")
-    )
-    tipos_opciones = list(
-        comunicaciones_periodo_qs.exclude(tipo__isnull=True)
-        .exclude(tipo="")
-        .values_list("tipo", flat=True)
-        .distinct()
-        .order_by("tipo")
-    )
-
     filtros = {
         "marca": request.GET.get("marca", "").strip(),
         "tipo": request.GET.get("tipo", "").strip(),
@@ -889,31 +1008,61 @@ def mis_comunicaciones(request):
         comunicaciones_qs = comunicaciones_qs.filter(marca__iexact=filtros["marca"])
     if filtros["tipo"]:
         comunicaciones_qs = comunicaciones_qs.filter(tipo__iexact=filtros["tipo"])
+    comunicaciones_qs = comunicaciones_qs.order_by(*orden_keyset(sort_by, sort_dir))
 
-    campo_orden = sort_by
-    prefijo = "" if sort_dir == "asc" else "-"
-    comunicaciones_qs = comunicaciones_qs.order_by(
-        f"{prefijo}{campo_orden}",
-        "id" if sort_dir == "asc" else "-id",
-    )
-
-    siguiente_direccion = _siguiente_direccion_por_campo(
-        campos_ordenables, sort_by, sort_dir
-    )
+    return {
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "comunicaciones_periodo_qs": comunicaciones_periodo_qs,
+        "filtros": filtros,
+        "campos_ordenables": campos_ordenables,
+        "sort_by": sort_by,
+        "sort_dir": sort_dir,
+        "comunicaciones_qs": comunicaciones_qs,
+    }
 
-    comunicaciones = list(comunicaciones_qs)
-    total_resultados = len(comunicaciones)
-    initial_visible_rows = 25
-    initial_visible_count = min(total_resultados, initial_visible_rows)
 
+def _marcar_boletines_leidos(boletines, usuario):
     leidos_ids = set(
         LecturaBoletin.objects.filter(
-            usuario=request.user, boletin_id__in=[b.id for b in comunicaciones]
+            usuario=usuario, boletin_id__in=[b.id for b in boletines]
         ).values_list("boletin_id", flat=True)
     )
-    for boletin in comunicaciones:
+    for boletin in boletines:
         boletin.ya_leido = boletin.id in leidos_ids
 
+
+@login_required
+def mis_comunicaciones(request):
+    perfil = _obtener_perfil(request.user)
+    listado = _listado_comunicaciones_desde_request(request)
+    fecha_desde = listado["fecha_desde"]
+    fecha_hasta = listado["fecha_hasta"]
+
+    facetas = calcular_facetas(
+        listado["comunicaciones_periodo_qs"], {"marca": "marca", "tipo": "tipo"}
+    )
+    marcas_opciones = facetas["marca"]
+    tipos_opciones = facetas["tipo"]
+
+    filtros = listado["filtros"]
+    sort_by = listado["sort_by"]
+    sort_dir = listado["sort_dir"]
+    comunicaciones_qs = listado["comunicaciones_qs"]
+
+    siguiente_direccion = _siguiente_direccion_por_campo(
+        listado["campos_ordenables"], sort_by, sort_dir
+    )
+
+    total_resultados = comunicaciones_qs.count()
+    comunicaciones, siguiente_cursor = _pagina_listado(
+        request, comunicaciones_qs, sort_by, sort_dir
+    )
+    initial_visible_rows = RESULTADOS_POR_PAGINA
+    initial_visible_count = len(comunicaciones)
+
+    _marcar_boletines_leidos(comunicaciones, request.user)
+
     current_month = _format_year_month((date.today().year, date.today().month))
     active_filters = []
     periodo_chip = _build_periodo_chip(fecha_desde, fecha_hasta, current_month)
@@ -947,6 +1096,7 @@ def mis_comunicaciones(request):
         "total_resultados": total_resultados,
         "initial_visible_rows": initial_visible_rows,
         "initial_visible_count": initial_visible_count,
+        "siguiente_cursor": siguiente_cursor,
         "active_filters": active_filters,
         "sort_by": sort_by,
         "sort_dir": sort_dir,
@@ -954,6 +1104,24 @@ def mis_comunicaciones(request):
         "comunicaciones": comunicaciones,
     }
     return render(request, "comisiones/mis_comunicaciones.html", context)
+
+
+@login_required
+def mis_comunicaciones_resultados(request):
+    listado = _listado_comunicaciones_desde_request(request)
+    comunicaciones_qs = listado["comunicaciones_qs"]
+    comunicaciones, siguiente_cursor = _pagina_listado(
+        request, comunicaciones_qs, listado["sort_by"], listado["sort_dir"]
+    )
+    _marcar_boletines_leidos(comunicaciones, request.user)
+    return _respuesta_fragmento_resultados(
+        request,
+        "comisiones/mis_comunicaciones_filas.html",
+        {"comunicaciones": comunicaciones},
+        comunicaciones,
+        comunicaciones_qs.count(),
+        siguiente_cursor,
+    )
 
 
 def _render_pagina_boletin_simple(request, template_name):
@@ -1033,21 +1201,23 @@ def registrar_incidencia(request):
             errores.append("El detalle de incidencia es obligatorio.")
 
         if not errores:
-            incidencia = Incidencia.objects.create(
-                reportado_por=request.user,
-                es_general=form_data["matricula"] == "GENERAL",
-                fecha_incidencia=fecha,
-                tipo=form_data["tipo"],
-                detalle=form_data["detalle"],
-                estado="pte_revision",
-                validacion_ok=False,
-            )
-            if form_data["matricula"] != "GENERAL":
-                ventas_matricula = Venta.objects.filter(
-                    usuario=request.user, matricula=form_data["matricula"]
+            with transaction.atomic():
+                incidencia = Incidencia.objects.create(
+                    reportado_por=request.user,
+                    es_general=form_data["matricula"] == "GENERAL",
+                    fecha_incidencia=fecha,
+                    tipo=form_data["tipo"],
+                    detalle=form_data["detalle"],
+                    estado="pte_revision",
+                    validacion_ok=False,
                 )
-                incidencia.ventas.set(ventas_matricula)
-            _enviar_correo_nueva_incidencia(incidencia)
+                if form_data["matricula"] != "GENERAL":
+                    ventas_matricula = Venta.objects.filter(
+                        usuario=request.user, matricula=form_data["matricula"]
+                    )
+                    incidencia.ventas.set(ventas_matricula)
+                # El aviso se envia en segundo plano (`enviar_correos`).
+                avisar_nueva_incidencia(incidencia)
             return redirect("mis_incidencias")
 
     context = {
@@ -1079,10 +1249,9 @@ def detalle_incidencia_personal(request, incidencia_id):
         incidencias_qs = incidencias_qs.filter(fecha_incidencia__lte=fecha_hasta_date)
 
     if filtros["matricula"]:
-        condicion_matricula = Q(ventas__matricula__icontains=filtros["matricula"])
-        if "general" in filtros["matricula"].lower():
-            condicion_matricula |= Q(es_general=True)
-        incidencias_qs = incidencias_qs.filter(condicion_matricula).distinct()
+        incidencias_qs = incidencias_qs.filter(
+            matriculas__icontains=filtros["matricula"]
+        )
 
     estados_validos = {code for code, _ in Incidencia.ESTADOS}
     if filtros["estado"] in estados_validos:
@@ -1090,28 +1259,19 @@ def detalle_incidencia_personal(request, incidencia_id):
     else:
         filtros["estado"] = ""
 
-    incidencias_filtradas = list(
-        incidencias_qs.prefetch_related("ventas").order_by("-fecha_incidencia", "-id")
-    )
-    incidencia_ids = [inc.id for inc in incidencias_filtradas]
-
     incidencia = get_object_or_404(
-        Incidencia.objects.prefetch_related("ventas"),
-        id=incidencia_id,
-        reportado_por=request.user,
+        Incidencia, id=incidencia_id, reportado_por=request.user
     )
 
-    anterior_id = None
-    siguiente_id = None
-    posicion_actual = None
-    total_incidencias = len(incidencia_ids)
-    if incidencia.id in incidencia_ids:
-        idx = incidencia_ids.index(incidencia.id)
-        posicion_actual = idx + 1
-        if idx > 0:
-            anterior_id = incidencia_ids[idx - 1]
-        if idx < len(incidencia_ids) - 1:
-            siguiente_id = incidencia_ids[idx + 1]
+    # Mismo orden que `Mis Incidencias` por defecto: (-fecha_incidencia, -id).
+    posicion_actual, total_incidencias = posicion_keyset(
+        incidencias_qs, "fecha_incidencia", "desc", incidencia
+    )
+    anterior_id = siguiente_id = None
+    if posicion_actual is not None:
+        anterior_id, siguiente_id = vecinos_keyset(
+            incidencias_qs, "fecha_incidencia", "desc", incidencia
+        )
 
     perfil = _obtener_perfil(request.user)
     context = {
@@ -1199,94 +1359,239 @@ def mi_perfil(request):
     return render(request, "comisiones/mi_perfil.html", context)
 
 
-@login_required
-def comisiones_gerencia(request):
-    if not _es_gerencia(request.user):
-        return redirect("redirigir_por_rol")
+CAMPOS_COMISION_GERENCIA = (
+    "facturacion",
+    "margen_bruto",
+    "imp_costo",
+    "comision_financiera",
+    "total_beneficio",
+    "seguros",
+    "imp_comision",
+)
 
+
+def _formatear_importe(valor, default="-"):
+    if valor is None:
+        return default
+    return f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+INSTALACION_TODAS = "todas"
+
+
+def _resolver_instalacion(params, usuario):
+    """Instalacion a filtrar en gerencia: `(valor del filtro, Q o None)`.
+
+    Sin parametro se usa la instalacion del perfil del usuario (si tiene),
+    junto con las filas sin instalacion para no ocultarlas; `todas` o un valor
+    no numerico no filtran.
+    """
+    valor = params.get("instalacion")
+    if valor is None:
+        instalacion_id = _obtener_perfil(usuario).instalacion_id
+        filtro = Q(instalacion_id=instalacion_id) | Q(instalacion__isnull=True)
+    else:
+        valor = valor.strip()
+        instalacion_id = int(valor) if valor.isdigit() else None
+        filtro = Q(instalacion_id=instalacion_id)
+    if not instalacion_id:
+        return INSTALACION_TODAS, None
+    return str(instalacion_id), filtro
+
+
+def _opciones_instalacion():
+    return [
+        {"value": str(instalacion.pk), "label": str(instalacion)}
+        for instalacion in Instalacion.objects.filter(activa=True)
+    ]
+
+
+def _listado_comisiones_gerencia(params, usuario):
+    """Ventas del periodo con los importes de sus comisiones sumados en la misma consulta."""
     fecha_desde, fecha_hasta, fecha_desde_date, fecha_hasta_date = _resolve_month_range(
-        request.GET.get("desde"), request.GET.get("hasta"), default_to_current=True
+        params.get("desde"), params.get("hasta"), default_to_current=True
     )
-    instalacion = request.GET.get("instalacion", "2901: Nissan Orihuela")
-    vendedor = request.GET.get("vendedor", "Todos")
-
-    perfil = _obtener_perfil(request.user)
+    instalacion, filtro_instalacion = _resolver_instalacion(params, usuario)
+    vendedor = params.get("vendedor", "Todos")
 
     ventas_qs = Venta.objects.filter(
         fecha_venta__range=(fecha_desde_date, fecha_hasta_date)
-    ).select_related("usuario")
-
+    )
+    if filtro_instalacion is not None:
+        ventas_qs = ventas_qs.filter(filtro_instalacion)
     vendedor_val = (vendedor or "").strip()
     if vendedor_val and vendedor_val.lower() != "todos":
         ventas_qs = ventas_qs.filter(
-            Q(usuario__username__icontains=vendedor_val)
-            | Q(usuario__first_name__icontains=vendedor_val)
-            | Q(usuario__last_name__icontains=vendedor_val)
-            | Q(matricula__icontains=vendedor_val)
+            Q(usuario_id__in=ids_usuarios(vendedor_val))
+            | Q(id__in=ids_ventas(vendedor_val))
         )
 
+    ultimo_estado = (
+        Comision.objects.filter(venta=OuterRef("pk"))
+        .order_by("-fecha_creacion", "-id")
+        .values("estado")[:1]
+    )
+    filas_qs = (
+        ventas_qs.select_related("usuario")
+        .annotate(
+            **{campo: Sum(f"comision__{campo}") for campo in CAMPOS_COMISION_GERENCIA},
+            estado_comision=Subquery(ultimo_estado),
+        )
+        .order_by(*orden_keyset("fecha_venta", "desc"))
+    )
+    return {
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "instalacion": instalacion,
+        "vendedor": vendedor,
+        "ventas_qs": ventas_qs,
+        "filas_qs": filas_qs,
+    }
+
+
+def _filas_comisiones_gerencia(ventas):
+    estados = dict(Comision.ESTADOS)
     filas = []
-    for venta in ventas_qs.order_by("-fecha_venta", "-id"):
+    for venta in ventas:
         nombre_empleado = _nombre_usuario(venta.usuario, default="Sin empleado")
+        estado = estados.get(venta.estado_comision, "Sin comision")
         filas.append(
             {
+                "venta_id": venta.pk,
                 "empleado_matricula": f"{nombre_empleado} / {venta.matricula}",
                 "ventas_idv": str(venta.idv),
-                "facturacion": "-",
-                "margen_bruto": "-",
-                "imp_costo": "-",
-                "comision_financiera": "-",
-                "total_beneficio": "-",
-                "seguros": "-",
-                "imp_comision": "-",
-                "estado": venta.get_tipo_venta_display(),
+                **{
+                    campo: _formatear_importe(getattr(venta, campo))
+                    for campo in CAMPOS_COMISION_GERENCIA
+                },
+                "estado": f"{estado} / {venta.get_tipo_venta_display()}",
                 "tipo_cliente": venta.get_tipo_cliente_display(),
             }
         )
+    return filas
+
+
+def _pagina_comisiones_gerencia(request, listado):
+    return paginar_keyset(
+        listado["filas_qs"],
+        "fecha_venta",
+        "desc",
+        request.GET.get("cursor"),
+        RESULTADOS_POR_PAGINA,
+    )
+
+
+def _totales_comisiones_gerencia(ventas_qs):
+    """Numero de ventas y suma de cada importe del periodo, en una consulta."""
+    totales = ventas_qs.aggregate(
+        total_ventas=Count("id", distinct=True),
+        **{campo: Sum(f"comision__{campo}") for campo in CAMPOS_COMISION_GERENCIA},
+    )
+    return {
+        "total_ventas": totales.pop("total_ventas"),
+        **{campo: _formatear_importe(valor) for campo, valor in totales.items()},
+    }
+
+
+@login_required
+def comisiones_gerencia(request):
+    if not _es_gerencia(request.user):
+        return redirect("redirigir_por_rol")
+
+    # Antes de leer las filas: la revision en bloque no pisa cambios posteriores.
+    leido_en = timezone.now()
+    listado = _listado_comisiones_gerencia(request.GET, request.user)
+    perfil = _obtener_perfil(request.user)
+    ventas, siguiente_cursor = _pagina_comisiones_gerencia(request, listado)
+    totales = _totales_comisiones_gerencia(listado["ventas_qs"])
 
     context = {
         **_contexto_base_usuario(request, perfil),
-        "fecha_desde": fecha_desde,
-        "fecha_hasta": fecha_hasta,
-        "instalacion": instalacion,
-        "vendedor": vendedor,
+        "fecha_desde": listado["fecha_desde"],
+        "fecha_hasta": listado["fecha_hasta"],
+        "instalacion": listado["instalacion"],
+        "opciones_instalacion": _opciones_instalacion(),
+        "vendedor": listado["vendedor"],
         "pendientes_revision": 1,
-        "filas_comision": filas,
+        "filas_comision": _filas_comisiones_gerencia(ventas),
+        "totales_comision": totales,
+        "total_resultados": totales["total_ventas"],
+        "siguiente_cursor": siguiente_cursor,
+        "leido_en": leido_en.isoformat(),
     }
     return render(request, "comisiones/comisiones.html", context)
+
+
+@login_required
+def comisiones_gerencia_resultados(request):
+    if not _es_gerencia(request.user):
+        return HttpResponse(
+            "Solo para gerencia.",
+            status=403,
+            content_type="text/plain; charset=utf-8",
+        )
+
+    listado = _listado_comisiones_gerencia(request.GET, request.user)
+    ventas, siguiente_cursor = _pagina_comisiones_gerencia(request, listado)
+    filas = _filas_comisiones_gerencia(ventas)
+    return _respuesta_fragmento_resultados(
+        request,
+        "comisiones/comisiones_filas.html",
+        {"filas_comision": filas},
+        filas,
+        listado["ventas_qs"].count(),
+        siguiente_cursor,
+    )
 
 
-@login_required
-def incidencias_gerencia(request):
-    if not _es_gerencia(request.user):
-        return redirect("redirigir_por_rol")
-
+def _listado_incidencias_gerencia(params, usuario):
     fecha_desde, fecha_hasta, fecha_desde_date, fecha_hasta_date = _resolve_month_range(
-        request.GET.get("desde"), request.GET.get("hasta"), default_to_current=True
+        params.get("desde"), params.get("hasta"), default_to_current=True
     )
-    instalacion = request.GET.get("instalacion", "2901: Nissan Orihuela")
-    vendedor = request.GET.get("vendedor", "Todos")
+    instalacion, filtro_instalacion = _resolver_instalacion(params, usuario)
+    vendedor = params.get("vendedor", "Todos")
 
-    perfil = _obtener_perfil(request.user)
-
-    incidencias_qs = (
-        Incidencia.objects.select_related("reportado_por")
-        .prefetch_related("ventas")
-        .order_by("-fecha_incidencia", "-id")
+    incidencias_qs = Incidencia.objects.select_related("reportado_por").order_by(
+        "-fecha_incidencia", "-id"
     )
     if fecha_desde_date:
         incidencias_qs = incidencias_qs.filter(fecha_incidencia__gte=fecha_desde_date)
     if fecha_hasta_date:
         incidencias_qs = incidencias_qs.filter(fecha_incidencia__lte=fecha_hasta_date)
+    if filtro_instalacion is not None:
+        incidencias_qs = incidencias_qs.filter(filtro_instalacion)
 
     vendedor_val = (vendedor or "").strip()
     if vendedor_val and vendedor_val.lower() != "todos":
+        # `Exists` sobre la tabla intermedia evita el join con `ventas` y el `distinct()`.
         incidencias_qs = incidencias_qs.filter(
-            Q(reportado_por__username__icontains=vendedor_val)
-            | Q(reportado_por__first_name__icontains=vendedor_val)
-            | Q(reportado_por__last_name__icontains=vendedor_val)
-            | Q(ventas__matricula__icontains=vendedor_val)
-        ).distinct()
+            Q(reportado_por_id__in=ids_usuarios(vendedor_val))
+            | Exists(
+                Incidencia.ventas.through.objects.filter(
+                    incidencia_id=OuterRef("pk"),
+                    venta_id__in=ids_ventas(vendedor_val),
+                )
+            )
+        )
+    return {
+        "fecha_desde": fecha_desde,
+        "fecha_hasta": fecha_hasta,
+        "instalacion": instalacion,
+        "vendedor": vendedor,
+        "incidencias_qs": incidencias_qs,
+    }
+
+
+@login_required
+def incidencias_gerencia(request):
+    if not _es_gerencia(request.user):
+        return redirect("redirigir_por_rol")
+
+    # Antes de leer las filas: la revision en bloque no pisa cambios posteriores.
+    leido_en = timezone.now()
+    listado = _listado_incidencias_gerencia(request.GET, request.user)
+    incidencias_qs = listado["incidencias_qs"]
+    perfil = _obtener_perfil(request.user)
 
     incidencias = []
     for incidencia in incidencias_qs:
@@ -1295,6 +1600,7 @@ def incidencias_gerencia(request):
         )
         incidencias.append(
             {
+                "id": incidencia.pk,
                 "empleado": nombre_empleado,
                 "matricula": incidencia.matricula_display,
                 "fecha": incidencia.fecha_incidencia.strftime("%d/%m/%Y"),
@@ -1309,21 +1615,158 @@ def incidencias_gerencia(request):
 
     context = {
         **_contexto_base_usuario(request, perfil),
-        "fecha_desde": fecha_desde,
-        "fecha_hasta": fecha_hasta,
-        "instalacion": instalacion,
-        "vendedor": vendedor,
+        "fecha_desde": listado["fecha_desde"],
+        "fecha_hasta": listado["fecha_hasta"],
+        "instalacion": listado["instalacion"],
+        "opciones_instalacion": _opciones_instalacion(),
+        "vendedor": listado["vendedor"],
         "pendientes_revision": pendientes_revision,
         "incidencias": incidencias,
+        "leido_en": leido_en.isoformat(),
     }
     return render(request, "comisiones/incidencias_gerencia.html", context)
+
+
+def _respuesta_revision_no_valida(mensaje, status=400):
+    return HttpResponse(
+        mensaje,
+        status=status,
+        content_type="text/plain; charset=utf-8",
+    )
+
+
+def _revisar_seleccion_gerencia(request, tipo, listado_qs, filas_de_seleccion):
+    """Aplica en bloque la accion del cuerpo a la seleccion sobre `listado_qs`.
+
+    Los filtros llegan en la querystring; en el cuerpo, `accion`, `leido_en`
+    (cuando se leyo el listado) y `modo=ids` con `ids` o `modo=filtros` con
+    los `excluidos` de "seleccionar todo".
+    """
+    accion = request.POST.get("accion", "")
+    if accion not in ACCIONES[tipo]:
+        return _respuesta_revision_no_valida("Accion no valida.")
+    leido_en = _parse_iso_datetime(request.POST.get("leido_en"))
+    if leido_en is None:
+        return _respuesta_revision_no_valida("Falta la fecha de lectura del listado.")
+    modo = request.POST.get("modo", MODO_IDS)
+    if modo not in MODOS:
+        return _respuesta_revision_no_valida("Modo de seleccion no valido.")
+
+    parametros = {"filtros": request.GET.dict()}
+    if modo == MODO_FILTROS:
+        excluidos = _parse_selected_ids(request.POST.get("excluidos", ""))
+        seleccion_qs = listado_qs.exclude(id__in=excluidos)
+        parametros["excluidos"] = excluidos
+    else:
+        ids = _parse_selected_ids(request.POST.get("ids", ""))
+        if not ids:
+            return _respuesta_revision_no_valida("No hay filas seleccionadas.")
+        seleccion_qs = listado_qs.filter(id__in=ids)
+        parametros["ids"] = ids
+
+    revision = aplicar_revision(
+        tipo,
+        accion,
+        filas_de_seleccion(seleccion_qs),
+        leido_en,
+        usuario=request.user,
+        modo=modo,
+        parametros=parametros,
+    )
+    return JsonResponse(
+        {
+            "revision": revision.pk,
+            "estado": revision.estado_nuevo,
+            "actualizadas": revision.actualizadas,
+            "conflictos": revision.conflictos,
+        }
+    )
+
+
+@login_required
+@require_POST
+def revisar_comisiones_gerencia(request):
+    """Aprueba, rechaza o reabre en bloque las comisiones de las ventas seleccionadas."""
+    if not _es_gerencia(request.user):
+        return _respuesta_revision_no_valida("Solo para gerencia.", status=403)
+
+    listado = _listado_comisiones_gerencia(request.GET, request.user)
+    return _revisar_seleccion_gerencia(
+        request,
+        RevisionMasiva.TIPO_COMISION,
+        listado["ventas_qs"],
+        comisiones_de_ventas,
+    )
+
+
+@login_required
+@require_POST
+def revisar_incidencias_gerencia(request):
+    """Acepta, rechaza o reabre en bloque las incidencias seleccionadas."""
+    if not _es_gerencia(request.user):
+        return _respuesta_revision_no_valida("Solo para gerencia.", status=403)
+
+    listado = _listado_incidencias_gerencia(request.GET, request.user)
+    return _revisar_seleccion_gerencia(
+        request,
+        RevisionMasiva.TIPO_INCIDENCIA,
+        listado["incidencias_qs"],
+        lambda seleccion_qs: seleccion_qs,
+    )
 
 
+def _mes_equipo_desde_request(request):
+    return _parse_year_month(request.GET.get("mes")) or (
+        date.today().year,
+        date.today().month,
+    )
+
+
+@login_required
+def mi_equipo(request):
+    if not contexto_usuario(request.user).es_mando:
+        return redirect("redirigir_por_rol")
+
+    mes = _mes_equipo_desde_request(request)
+    resumen = resumen_equipo(request.user, *mes)
+    context = {
+        **_contexto_base_usuario(request, _obtener_perfil(request.user)),
+        "es_gerencia": _es_gerencia(request.user),
+        "mes": _format_year_month(mes),
+        "filas_equipo": resumen["filas"],
+        "totales_equipo": resumen["totales"],
+    }
+    return render(request, "comisiones/mi_equipo.html", context)
+
+
+@login_required
+def mi_equipo_resumen(request):
+    if not contexto_usuario(request.user).es_mando:
+        return HttpResponse(
+            "Sin equipo a cargo.",
+            status=403,
+            content_type="text/plain; charset=utf-8",
+        )
+
+    mes = _mes_equipo_desde_request(request)
+    resumen = resumen_equipo(request.user, *mes)
+    return JsonResponse(
+        {
+            "mes": _format_year_month(mes),
+            "filas": len(resumen["filas"]),
+            "equipo": resumen["filas"],
+            "totales": resumen["totales"],
+        }
+    )
+
+
 @login_required
 def redirigir_por_rol(request):
-    user = request.user
+    contexto = contexto_usuario(request.user)
 
-    if user.groups.filter(name__in=["Vendedor", "Jefe de ventas"]).exists():
+    if "Jefe de ventas" in contexto.grupos:
+        return redirect("mi_equipo")
+    if contexto.es_equipo_ventas:
         return redirect("mis_ventas")
     return redirect("comisiones_gerencia")
 
@@ -68,6 +68,11 @@ if errorlevel 1 (
     echo Error aplicando migraciones.
     exit /b 1
 )
+"%PYTHON_EXE%" manage.py createcachetable
+if errorlevel 1 (
+    echo Error creando la tabla de cache.
+    exit /b 1
+)
 
 echo.
 echo [6/8] Verificando si ejecutar seed...
@@ -100,6 +100,41 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Politica de hash de contrasenas (`comisiones/hashers.py`). El primero se usa
+# para los hashes nuevos; el resto solo verifica los existentes, que se
+# recalculan con el primero en el siguiente login correcto (igual que si cambia
+# su coste). Por defecto PBKDF2 con el coste de Django; para pasar a scrypt o
+# Argon2 se pone primero en la lista y se fijan en `PASSWORD_HASHER_COSTES` los
+# valores que propone `python manage.py medir_hashers --objetivo-ms 250` en el
+# servidor. Argon2 necesita `argon2-cffi`.
+PASSWORD_HASHERS = [
+    "comisiones.hashers.PBKDF2AjustableHasher",
+    "comisiones.hashers.ScryptAjustableHasher",
+    "comisiones.hashers.Argon2AjustableHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+
+# Costes por algoritmo, medidos con `medir_hashers`; lo que falte usa el valor
+# por defecto de Django.
+PASSWORD_HASHER_COSTES = {}
+
+
+# "default" es la cache por proceso de Django: solo guarda datos que se pueden
+# recalcular. Los contadores de login fallidos tienen que ser globales, asi que
+# van en una cache compartida por todos los procesos (`LOGIN_INTENTOS_CACHE`).
+# Es de BD para no depender de otro servicio: la tabla se crea con
+# `python manage.py createcachetable`. Redis o Memcached valen igual.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "compartida": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "comisiones_cache",
+    },
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
 
@@ -123,6 +158,13 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Horas que se conservan los ficheros de exportaciones en segundo plano antes
+# de que `procesar_exportaciones` los borre.
+EXPORTACIONES_CADUCIDAD_HORAS = 24
+
+# Segundos que se reutiliza el resumen mensual de `Mi equipo` por usuario y mes.
+EQUIPO_RESUMEN_CACHE_SEGUNDOS = 5 * 60
+
 # Para plantillas personalizadas
 TEMPLATES[0]["DIRS"] = [BASE_DIR / "templates"]
 
@@ -130,11 +172,53 @@ LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/redirigir/"
 LOGOUT_REDIRECT_URL = "/accounts/login/"
 
+# Cierre de sesion por inactividad (`SessionIdleTimeoutMiddleware`).
+# 0 desactiva el cierre. La ultima actividad solo se escribe en sesion cuando
+# avanza mas de la granularidad, para no actualizar la tabla en cada peticion;
+# por eso el cierre puede llegar hasta la granularidad antes de lo configurado.
+SESSION_IDLE_TIMEOUT_SECONDS = 0
+SESSION_IDLE_ACTIVITY_GRANULARITY_SECONDS = 60
+
+# Limite de intentos de login fallidos (`comisiones/limite_login.py`). Al llegar
+# al maximo dentro de la ventana, el DNI o la IP quedan bloqueados y el login se
+# rechaza sin consultar la BD. Los contadores viven en la cache
+# `LOGIN_INTENTOS_CACHE` de `CACHES`, que debe ser compartida por todos los
+# procesos: con una por proceso cada worker llevaria su propia cuenta.
+LOGIN_INTENTOS_CACHE = "compartida"
+LOGIN_INTENTOS_MAX_POR_DNI = 5
+LOGIN_INTENTOS_MAX_POR_IP = 30
+LOGIN_INTENTOS_VENTANA_SEGUNDOS = 15 * 60
+LOGIN_BLOQUEO_SEGUNDOS = 15 * 60
+
+# IPs o redes de los proxies inversos delante de la aplicacion. Solo si la
+# peticion llega de uno de ellos se toma la IP del cliente de X-Forwarded-For;
+# vacio, se usa REMOTE_ADDR (con un proxy, todos compartirian su IP y su limite).
+# Ejemplo: ["127.0.0.1", "10.0.0.0/24"].
+LOGIN_PROXIES_DE_CONFIANZA = []
+
 AUTHENTICATION_BACKENDS = [
     "comisiones.auth_backends.DNIAutenticacionBackend",
     "django.contrib.auth.backends.ModelBackend",
 ]
 
+# Bandeja de salida de correos (`comisiones/correos.py`): las vistas solo
+# encolan y `python manage.py enviar_correos` envia en segundo plano. Un correo
+# fallido se reintenta tras CORREOS_REINTENTO_SEGUNDOS * 2^(intentos - 1) hasta
+# CORREOS_MAX_INTENTOS; los que quedan en "enviando" mas de
+# CORREOS_BLOQUEO_SEGUNDOS (worker caido) se vuelven a reclamar.
+CORREOS_HILOS = 4
+CORREOS_TAMANO_LOTE = 20
+CORREOS_MAX_INTENTOS = 5
+CORREOS_REINTENTO_SEGUNDOS = 60
+CORREOS_BLOQUEO_SEGUNDOS = 10 * 60
+
+# Aviso de incidencias nuevas: "inmediato" (un correo por incidencia a
+# INCIDENCIAS_EMAIL_TO) o "resumen" (`enviar_correos` agrupa cada
+# INCIDENCIAS_RESUMEN_MINUTOS las nuevas en un correo por jefe de ventas y
+# gerente de quien las reporta).
+INCIDENCIAS_AVISO_MODO = "inmediato"
+INCIDENCIAS_RESUMEN_MINUTOS = 60
+
 # Correo para notificaciones de incidencias.
 # Usa variables de entorno para no guardar credenciales en el repositorio.
 # EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
@@ -2,7 +2,6 @@
     const modal = document.getElementById("boletinConfirmModal");
     if (!modal) return;
 
-    const openButtons = Array.from(document.querySelectorAll(".js-boletin-open"));
     const closeButtons = Array.from(modal.querySelectorAll("[data-modal-close]"));
     const confirmButton = document.getElementById("boletinConfirmAccept");
     const nameNode = document.getElementById("boletinConfirmName");
@@ -34,13 +33,14 @@
         setOpenState(false);
     }
 
-    openButtons.forEach((button) => {
-        button.addEventListener("click", (event) => {
-            event.preventDefault();
-            const href = button.getAttribute("href");
-            const boletinName = button.dataset.boletinTitulo || "seleccionado";
-            openModal(href, boletinName, button);
-        });
+    // Delegado para cubrir tambien las filas cargadas con "Cargar mas".
+    document.addEventListener("click", (event) => {
+        const button = event.target.closest(".js-boletin-open");
+        if (!button) return;
+        event.preventDefault();
+        const href = button.getAttribute("href");
+        const boletinName = button.dataset.boletinTitulo || "seleccionado";
+        openModal(href, boletinName, button);
     });
 
     closeButtons.forEach((button) => {
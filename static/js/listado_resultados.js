@@ -0,0 +1,179 @@
+(function () {
+    // Carga incremental de filas desde los endpoints "resultados/" de cada listado.
+    // "Cargar mas" pide la siguiente pagina por cursor y la ordenacion por columna
+    // sustituye solo las filas de la tabla, sin volver a renderizar la pagina.
+
+    function parseRows(html) {
+        const template = document.createElement("template");
+        template.innerHTML = String(html || "").trim();
+        return Array.from(template.content.querySelectorAll("[data-result-row]"));
+    }
+
+    function init(options) {
+        const tableBody = options.tableBody;
+        if (!tableBody || !tableBody.dataset.resultsUrl) return null;
+
+        const resultsUrl = tableBody.dataset.resultsUrl;
+        const table = tableBody.closest("table");
+        const form = options.form || null;
+        const loadMoreBtn = options.loadMoreBtn || null;
+        const visibleCount = document.getElementById("results-visible-count");
+        const totalCount = document.getElementById("results-total-count");
+        const onRowsChanged = options.onRowsChanged || function () {};
+
+        let nextCursor = (loadMoreBtn && loadMoreBtn.dataset.nextCursor) || "";
+        let currentParams = new URLSearchParams(window.location.search);
+        currentParams.delete("cursor");
+
+        function rowCount() {
+            return tableBody.querySelectorAll("[data-result-row]").length;
+        }
+
+        function syncCounters(total) {
+            if (visibleCount) {
+                visibleCount.textContent = String(rowCount());
+            }
+            if (totalCount && typeof total === "number") {
+                totalCount.textContent = String(total);
+            }
+        }
+
+        function setLoading(isLoading) {
+            if (!loadMoreBtn) return;
+            loadMoreBtn.disabled = isLoading;
+            loadMoreBtn.classList.toggle("is-loading", isLoading);
+            if (isLoading) {
+                loadMoreBtn.setAttribute("aria-busy", "true");
+            } else {
+                loadMoreBtn.removeAttribute("aria-busy");
+            }
+        }
+
+        function syncLoadMoreState() {
+            if (!loadMoreBtn) return;
+            loadMoreBtn.hidden = !nextCursor;
+            setLoading(false);
+        }
+
+        function fetchPage(params) {
+            const url = new URL(resultsUrl, window.location.origin);
+            params.forEach((value, name) => {
+                url.searchParams.append(name, value);
+            });
+            return fetch(url.toString(), {
+                credentials: "same-origin",
+                headers: {
+                    Accept: "application/json",
+                    "X-Requested-With": "XMLHttpRequest",
+                },
+            }).then((response) => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            });
+        }
+
+        function loadMore() {
+            if (!nextCursor) return;
+            setLoading(true);
+            const params = new URLSearchParams(currentParams);
+            params.set("cursor", nextCursor);
+            fetchPage(params)
+                .then((data) => {
+                    const rows = parseRows(data.html);
+                    rows.forEach((row) => tableBody.appendChild(row));
+                    nextCursor = data.siguiente_cursor || "";
+                    syncCounters(data.total_resultados);
+                    onRowsChanged(rows, false);
+                })
+                .catch(() => {
+                    window.alert("No se han podido cargar mas resultados. Intentalo de nuevo.");
+                })
+                .finally(syncLoadMoreState);
+        }
+
+        function syncSortHeaders(sortBy, sortDir) {
+            if (!table) return;
+            table.querySelectorAll("th.th-sortable").forEach((th) => {
+                const link = th.querySelector(".sort-icon-btn");
+                if (!link) return;
+                const linkUrl = new URL(link.getAttribute("href"), window.location.href);
+                const campo = linkUrl.searchParams.get("sort");
+                const isSorted = campo === sortBy;
+                const icon = link.querySelector(".th-icon");
+
+                th.classList.toggle("is-sorted", isSorted);
+                link.classList.toggle("active", isSorted);
+                th.setAttribute(
+                    "aria-sort",
+                    isSorted ? (sortDir === "asc" ? "ascending" : "descending") : "none"
+                );
+                if (icon) {
+                    icon.textContent = isSorted && sortDir === "asc" ? "▲" : "▼";
+                }
+                linkUrl.searchParams.set(
+                    "dir",
+                    isSorted && sortDir === "asc" ? "desc" : "asc"
+                );
+                link.setAttribute("href", `?${linkUrl.searchParams.toString()}`);
+            });
+        }
+
+        function syncFormSort(sortBy, sortDir) {
+            if (!form) return;
+            const sortField = form.elements.namedItem("sort");
+            const dirField = form.elements.namedItem("dir");
+            if (sortField) sortField.value = sortBy;
+            if (dirField) dirField.value = sortDir;
+        }
+
+        function applySort(link) {
+            const linkUrl = new URL(link.getAttribute("href"), window.location.href);
+            const params = new URLSearchParams(linkUrl.search);
+            params.delete("cursor");
+            fetchPage(params)
+                .then((data) => {
+                    const rows = parseRows(data.html);
+                    tableBody.replaceChildren(...rows);
+                    currentParams = params;
+                    nextCursor = data.siguiente_cursor || "";
+                    const sortBy = params.get("sort") || "";
+                    const sortDir = params.get("dir") || "desc";
+                    syncSortHeaders(sortBy, sortDir);
+                    syncFormSort(sortBy, sortDir);
+                    syncCounters(data.total_resultados);
+                    syncLoadMoreState();
+                    window.history.replaceState(
+                        null,
+                        "",
+                        `${window.location.pathname}?${params.toString()}`
+                    );
+                    onRowsChanged(rows, true);
+                })
+                .catch(() => {
+                    window.location.assign(linkUrl.toString());
+                });
+        }
+
+        if (loadMoreBtn) {
+            loadMoreBtn.addEventListener("click", () => {
+                if (loadMoreBtn.disabled) return;
+                loadMore();
+            });
+        }
+
+        if (table) {
+            table.addEventListener("click", (event) => {
+                const link = event.target.closest(".sort-icon-btn");
+                if (!link || !table.contains(link)) return;
+                event.preventDefault();
+                applySort(link);
+            });
+        }
+
+        syncCounters();
+        syncLoadMoreState();
+        return { loadMore, rowCount };
+    }
+
+    window.ListadoResultados = { init };
+})();
@@ -4,8 +4,7 @@
 
     const applyBtn = form.querySelector(".aplicar-filtro");
     const trackedFilterNames = ["desde", "hasta", "matricula", "estado"];
-    const rows = Array.from(document.querySelectorAll("[data-result-row]"));
-    const visibleCount = document.getElementById("results-visible-count");
+    const tableBody = document.querySelector("tbody[data-results-url]");
     const loadMoreBtn = document.getElementById("load-more-incidencias");
     const clearAllButtons = Array.from(document.querySelectorAll("[data-clear-all='true']"));
     const chipButtons = Array.from(document.querySelectorAll(".filter-chip"));
@@ -70,49 +69,7 @@
         });
     });
 
-    if (!rows.length || !loadMoreBtn) return;
-
-    const pageSize = Number.parseInt(loadMoreBtn.dataset.pageSize || "25", 10) || 25;
-
-    function hiddenRows() {
-        return rows.filter((row) => row.hidden);
-    }
-
-    function updateVisibleCounter() {
-        if (!visibleCount) return;
-        const visible = rows.length - hiddenRows().length;
-        visibleCount.textContent = String(visible);
-    }
-
-    function syncLoadMoreState() {
-        const remaining = hiddenRows().length;
-        if (remaining <= 0) {
-            loadMoreBtn.hidden = true;
-            return;
-        }
-        loadMoreBtn.hidden = false;
-        loadMoreBtn.disabled = false;
-        loadMoreBtn.removeAttribute("aria-busy");
-        loadMoreBtn.classList.remove("is-loading");
+    if (window.ListadoResultados) {
+        window.ListadoResultados.init({ tableBody, form, loadMoreBtn });
     }
-
-    function revealNextPage() {
-        const next = hiddenRows().slice(0, pageSize);
-        next.forEach((row) => {
-            row.hidden = false;
-        });
-        updateVisibleCounter();
-        syncLoadMoreState();
-    }
-
-    loadMoreBtn.addEventListener("click", () => {
-        if (loadMoreBtn.disabled) return;
-        loadMoreBtn.disabled = true;
-        loadMoreBtn.setAttribute("aria-busy", "true");
-        loadMoreBtn.classList.add("is-loading");
-        window.setTimeout(revealNextPage, 170);
-    });
-
-    updateVisibleCounter();
-    syncLoadMoreState();
 })();
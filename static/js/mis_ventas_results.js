@@ -14,14 +14,18 @@
         "nombre_cliente",
     ];
 
-    const rows = Array.from(document.querySelectorAll("[data-result-row]"));
-    const visibleCount = document.getElementById("results-visible-count");
+    const tableBody = document.querySelector(".mis-ventas-results tbody");
     const loadMoreBtn = document.getElementById("load-more-results");
     const clearAllButtons = Array.from(document.querySelectorAll("[data-clear-all='true']"));
     const chipButtons = Array.from(document.querySelectorAll(".filter-chip"));
 
     const exportContainer = document.querySelector(".results-actions-row");
     const exportUrl = exportContainer ? exportContainer.dataset.exportUrl || "" : "";
+    const exportJobsUrl = exportContainer ? exportContainer.dataset.exportJobsUrl || "" : "";
+    const csrfToken = exportContainer ? exportContainer.dataset.csrfToken || "" : "";
+    const selectionUrl = exportContainer ? exportContainer.dataset.selectionUrl || "" : "";
+    const exportJobStatus = document.getElementById("export-job-status");
+    const EXPORT_POLL_MS = 1500;
     const exportExcelBtn = document.getElementById("export-excel-btn");
     const exportCsvBtn = document.getElementById("export-csv-btn");
     const exportMenuToggle = document.getElementById("export-menu-toggle");
@@ -29,7 +33,6 @@
     const exportOptionButtons = Array.from(document.querySelectorAll("#export-options-menu-mobile [data-export-format]"));
     const mobileExportQuery = window.matchMedia("(max-width: 640px)");
     const selectedSalesCount = document.getElementById("selected-sales-count");
-    const rowCheckboxes = Array.from(document.querySelectorAll("[data-select-venta]"));
     const selectAllSales = document.getElementById("select-all-sales");
 
     function readFilterValue(name) {
@@ -118,66 +121,67 @@
         });
     });
 
-    const pageSize =
-        Number.parseInt(
-            (loadMoreBtn && loadMoreBtn.dataset.pageSize) || "25",
-            10
-        ) || 25;
-
-    function hiddenRows() {
-        return rows.filter((row) => row.hidden);
+    function rowCheckboxes() {
+        return Array.from(document.querySelectorAll("[data-select-venta]"));
     }
 
-    function updateVisibleCounter() {
-        if (!visibleCount) return;
-        const visible = rows.length - hiddenRows().length;
-        visibleCount.textContent = String(visible);
-    }
+    // "Seleccionar todo" abarca todas las ventas del filtro, tambien las que aun
+    // no se han cargado; las que se desmarcan despues se guardan como exclusiones.
+    let selectAllMode = false;
+    const excludedIds = new Set();
 
-    function syncLoadMoreState() {
-        if (!loadMoreBtn) return;
-        const remaining = hiddenRows().length;
-        if (remaining <= 0) {
-            loadMoreBtn.hidden = true;
-            return;
-        }
-        loadMoreBtn.hidden = false;
-        loadMoreBtn.disabled = false;
-        loadMoreBtn.removeAttribute("aria-busy");
-        loadMoreBtn.classList.remove("is-loading");
+    function totalResults() {
+        const totalCount = document.getElementById("results-total-count");
+        const total = totalCount ? parseInt(totalCount.textContent, 10) : NaN;
+        return Number.isNaN(total) ? rowCheckboxes().length : total;
     }
 
-    function revealNextPage() {
-        const next = hiddenRows().slice(0, pageSize);
-        next.forEach((row) => {
-            row.hidden = false;
-        });
-        updateVisibleCounter();
-        syncLoadMoreState();
+    function resetSelectAllMode() {
+        selectAllMode = false;
+        excludedIds.clear();
     }
 
-    if (loadMoreBtn && rows.length) {
-        loadMoreBtn.addEventListener("click", () => {
-            if (loadMoreBtn.disabled) return;
-            loadMoreBtn.disabled = true;
-            loadMoreBtn.setAttribute("aria-busy", "true");
-            loadMoreBtn.classList.add("is-loading");
-            window.setTimeout(revealNextPage, 170);
+    if (window.ListadoResultados) {
+        window.ListadoResultados.init({
+            tableBody,
+            form,
+            loadMoreBtn,
+            onRowsChanged(rows, replaced) {
+                if (replaced) {
+                    resetSelectAllMode();
+                    if (selectAllSales) {
+                        selectAllSales.checked = false;
+                    }
+                } else if (selectAllMode) {
+                    rows.forEach((row) => {
+                        const checkbox = row.querySelector("[data-select-venta]");
+                        if (checkbox) checkbox.checked = true;
+                    });
+                }
+                syncSelectionState();
+            },
         });
     }
 
     function setAllRowsSelection(checked) {
-        rowCheckboxes.forEach((checkbox) => {
+        rowCheckboxes().forEach((checkbox) => {
             checkbox.checked = checked;
         });
     }
 
     function getSelectedSaleIds() {
-        return rowCheckboxes
+        return rowCheckboxes()
             .filter((checkbox) => checkbox.checked)
             .map((checkbox) => checkbox.value);
     }
 
+    function getSelectedCount() {
+        if (selectAllMode) {
+            return Math.max(0, totalResults() - excludedIds.size);
+        }
+        return getSelectedSaleIds().length;
+    }
+
     function syncSelectAllControls(selectedCount, totalCount) {
         const allChecked = totalCount > 0 && selectedCount === totalCount;
         const someChecked = selectedCount > 0 && selectedCount < totalCount;
@@ -219,8 +223,8 @@
     }
 
     function syncSelectionState() {
-        const totalCount = rowCheckboxes.length;
-        const selectedCount = getSelectedSaleIds().length;
+        const totalCount = selectAllMode ? totalResults() : rowCheckboxes().length;
+        const selectedCount = getSelectedCount();
         if (selectedSalesCount) {
             selectedSalesCount.textContent = `${selectedCount} seleccionadas`;
         }
@@ -228,20 +232,70 @@
         syncExportButtonsState(selectedCount, totalCount);
     }
 
-    rowCheckboxes.forEach((checkbox) => {
-        checkbox.addEventListener("change", syncSelectionState);
-    });
+    if (tableBody) {
+        tableBody.addEventListener("change", (event) => {
+            const checkbox = event.target;
+            if (!checkbox.matches("[data-select-venta]")) return;
+            if (selectAllMode) {
+                if (checkbox.checked) {
+                    excludedIds.delete(checkbox.value);
+                } else {
+                    excludedIds.add(checkbox.value);
+                }
+                if (getSelectedCount() === 0) {
+                    resetSelectAllMode();
+                }
+            }
+            syncSelectionState();
+        });
+    }
 
     if (selectAllSales) {
         selectAllSales.addEventListener("change", () => {
+            resetSelectAllMode();
+            selectAllMode = selectAllSales.checked;
             setAllRowsSelection(selectAllSales.checked);
             syncSelectionState();
         });
     }
 
-    function buildExportUrl(formato) {
-        if (!exportUrl) return "";
-        const url = new URL(exportUrl, window.location.origin);
+    function postForm(url, body) {
+        return fetch(url, {
+            method: "POST",
+            credentials: "same-origin",
+            headers: {
+                Accept: "application/json",
+                "X-CSRFToken": csrfToken,
+                "X-Requested-With": "XMLHttpRequest",
+            },
+            body,
+        }).then((response) => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        });
+    }
+
+    function saveSelection() {
+        // Los filtros aplicados son los de la URL actual, no los del formulario
+        // (que puede tener cambios sin aplicar).
+        const url = new URL(selectionUrl, window.location.origin);
+        url.search = window.location.search;
+        url.searchParams.delete("cursor");
+
+        const body = new URLSearchParams();
+        if (selectAllMode) {
+            body.set("modo", "filtros");
+            body.set("excluidos", Array.from(excludedIds).join(","));
+        } else {
+            body.set("modo", "ids");
+            body.set("ids", getSelectedSaleIds().join(","));
+        }
+        return postForm(url.toString(), body).then((data) => data.seleccion);
+    }
+
+    function buildExportUrl(formato, seleccion, baseUrl = exportUrl) {
+        if (!baseUrl) return "";
+        const url = new URL(baseUrl, window.location.origin);
         const formData = new FormData(form);
         for (const [name, value] of formData.entries()) {
             const normalized = String(value || "").trim();
@@ -251,21 +305,84 @@
         }
         url.searchParams.set("formato", formato);
 
-        const selectedIds = getSelectedSaleIds();
-        url.searchParams.set("selected_ids", selectedIds.join(","));
+        url.searchParams.set("seleccion", seleccion);
         return url.toString();
     }
 
+    function showExportStatus(message, options = {}) {
+        if (!exportJobStatus) return;
+        exportJobStatus.classList.toggle("is-error", Boolean(options.isError));
+        exportJobStatus.replaceChildren(document.createTextNode(message));
+        if (options.downloadUrl) {
+            const link = document.createElement("a");
+            link.href = options.downloadUrl;
+            link.textContent = "Descargar";
+            exportJobStatus.append(" ", link);
+        }
+        exportJobStatus.hidden = false;
+    }
+
+    function pollExportJob(statusUrl) {
+        fetch(statusUrl, {
+            credentials: "same-origin",
+            headers: { Accept: "application/json" },
+        })
+            .then((response) => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then((data) => {
+                if (data.estado === "completada") {
+                    showExportStatus("Exportacion lista.", { downloadUrl: data.url_descarga });
+                    window.location.assign(data.url_descarga);
+                    return;
+                }
+                if (data.estado === "error" || data.estado === "caducada") {
+                    showExportStatus("No se ha podido generar la exportacion.", { isError: true });
+                    return;
+                }
+                const label = data.estado === "pendiente" ? "Exportacion en cola" : "Generando exportacion";
+                showExportStatus(`${label}... ${data.progreso}%`);
+                window.setTimeout(() => pollExportJob(statusUrl), EXPORT_POLL_MS);
+            })
+            .catch(() => {
+                showExportStatus("No se ha podido consultar la exportacion.", { isError: true });
+            });
+    }
+
+    function requestExportJob(formato, seleccion) {
+        postForm(buildExportUrl(formato, seleccion, exportJobsUrl))
+            .then((data) => {
+                showExportStatus("Exportacion en cola... 0%");
+                pollExportJob(data.url_estado);
+            })
+            .catch(() => {
+                // Sin cola disponible se descarga directamente, como antes.
+                window.location.assign(buildExportUrl(formato, seleccion));
+            });
+    }
+
     function triggerExport(formato) {
-        const selectedIds = getSelectedSaleIds();
-        if (!selectedIds.length) {
+        if (!getSelectedCount()) {
             window.alert("Selecciona al menos una venta para exportar.");
             return;
         }
-        const targetUrl = buildExportUrl(formato);
-        if (!targetUrl) return;
+        if (!selectionUrl) return;
         closeExportMenu();
-        window.location.assign(targetUrl);
+        saveSelection()
+            .then((seleccion) => {
+                if (exportJobsUrl) {
+                    requestExportJob(formato, seleccion);
+                    return;
+                }
+                const targetUrl = buildExportUrl(formato, seleccion);
+                if (targetUrl) {
+                    window.location.assign(targetUrl);
+                }
+            })
+            .catch(() => {
+                window.alert("No se ha podido preparar la exportacion. Intentalo de nuevo.");
+            });
     }
 
     if (exportMenuToggle) {
@@ -325,8 +442,6 @@
         mobileExportQuery.addListener(handleViewportChange);
     }
 
-    updateVisibleCounter();
-    syncLoadMoreState();
     syncSelectionState();
     window.getActiveFilters = getActiveFilters;
 })();
@@ -0,0 +1,75 @@
+(function () {
+    // Cambios de estado en bloque en las pantallas de gerencia. Con filas
+    // marcadas se envian sus ids; sin ninguna, y tras confirmarlo, la accion se
+    // aplica a todas las filas de los filtros aplicados.
+
+    const container = document.querySelector("[data-revision-url]");
+    if (!container) return;
+
+    const revisionUrl = container.dataset.revisionUrl;
+    const leidoEn = container.dataset.leidoEn || "";
+    const csrfToken = container.dataset.csrfToken || "";
+
+    function getSelectedIds() {
+        return Array.from(
+            document.querySelectorAll("input[data-revision-id]:checked")
+        ).map((input) => input.value);
+    }
+
+    function postRevision(accion, ids) {
+        // Los filtros aplicados son los de la URL actual, no los del formulario.
+        const url = new URL(revisionUrl, window.location.origin);
+        url.search = window.location.search;
+        url.searchParams.delete("cursor");
+
+        const body = new URLSearchParams();
+        body.set("accion", accion);
+        body.set("leido_en", leidoEn);
+        if (ids.length) {
+            body.set("modo", "ids");
+            body.set("ids", ids.join(","));
+        } else {
+            body.set("modo", "filtros");
+        }
+        return fetch(url.toString(), {
+            method: "POST",
+            credentials: "same-origin",
+            headers: {
+                Accept: "application/json",
+                "X-CSRFToken": csrfToken,
+                "X-Requested-With": "XMLHttpRequest",
+            },
+            body,
+        }).then((response) => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        });
+    }
+
+    container.querySelectorAll("[data-revision-accion]").forEach((button) => {
+        button.addEventListener("click", () => {
+            const ids = getSelectedIds();
+            if (
+                !ids.length &&
+                !window.confirm("No hay filas marcadas. ¿Aplicar a todas las filas del filtro?")
+            ) {
+                return;
+            }
+            button.disabled = true;
+            postRevision(button.dataset.revisionAccion, ids)
+                .then((data) => {
+                    let mensaje = `Filas actualizadas: ${data.actualizadas}.`;
+                    if (data.conflictos) {
+                        mensaje += ` ${data.conflictos} han cambiado desde que se cargo la pagina y no se han tocado.`;
+                    }
+                    window.alert(mensaje);
+                    // `reload` borraria los filtros (ver el script de la plantilla).
+                    window.location.assign(window.location.href);
+                })
+                .catch(() => {
+                    window.alert("No se ha podido aplicar el cambio.");
+                    button.disabled = false;
+                });
+        });
+    });
+})();